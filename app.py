@@ -1,10 +1,25 @@
 import os
+import hmac
 import logging
 import json
-import requests
-from flask import Flask, render_template, request, jsonify, flash, redirect, url_for, send_file, session
+import time
+import asyncio
+from flask import Flask, Response, render_template, request, jsonify, flash, redirect, url_for, session, g
 from video_downloader import VideoDownloader
-from social_media_downloader import SocialMediaDownloader
+from social_media_downloader import SocialMediaDownloader, YDL_PROFILES
+from download_jobs import DownloadJobRegistry
+from job_queue import DownloadJobQueue, parse_platform_limits
+from batch_jobs import DownloadBatchManager
+from download_cache import DownloadCache
+from extraction_cache import ExtractionCache
+from extraction_pool import ExtractionPool
+from file_serving import FileServer, parse_accel_locations
+from http_client import PooledSession, parse_host_pool_sizes
+from rate_limiter import BandwidthLimiter, parse_rate, parse_host_rates
+import metrics
+from tracing import TRACER, build_exporters
+from progress_bus import PROGRESS_BUS, TqdmRenderer
+from async_downloader import AsyncVideoDownloader, AsyncDownloadRunner, httpx
 import validators
 
 # Configure logging
@@ -20,16 +35,193 @@ app.secret_key = "dev_secret_key_make_this_random_and_unique"
 video_downloader = VideoDownloader()
 social_media_downloader = SocialMediaDownloader()
 
-# Global download progress tracker
-download_progress = {
-    'status': 'idle',  # idle, downloading, completed, error
-    'progress': 0,     # 0-100
-    'file_size': 0,    # total file size in bytes
-    'downloaded': 0,   # bytes downloaded so far
-    'speed': 0,        # download speed in bytes/sec
-    'filename': '',    # name of the file being downloaded
-    'platform': ''     # source platform
-}
+# One pooled HTTP session for all generic traffic, so probes and page fetches
+# reuse keep-alive connections; HTTP_HOST_POOL_SIZES="cdn.example.com=64"
+http_session = PooledSession(
+    pool_hosts=int(os.environ.get('HTTP_POOL_HOSTS', 32)),
+    pool_maxsize=int(os.environ.get('HTTP_POOL_MAXSIZE', 32)),
+    host_pool_sizes=parse_host_pool_sizes(os.environ.get('HTTP_HOST_POOL_SIZES', ''))
+)
+video_downloader.session = http_session
+
+# Completed downloads are kept once per distinct file and reused for repeat URLs;
+# set DOWNLOAD_CACHE_MAX_BYTES=0 to disable
+download_cache_max_bytes = int(os.environ.get('DOWNLOAD_CACHE_MAX_BYTES', 10 * 1024 ** 3))
+download_cache = DownloadCache(
+    cache_dir=os.environ.get('DOWNLOAD_CACHE_DIR', os.path.join('downloads', '.cache')),
+    max_size=download_cache_max_bytes
+) if download_cache_max_bytes > 0 else None
+video_downloader.cache = download_cache
+
+# Extraction results shared by /check-url, /get-direct-url and downloads;
+# EXTRACTION_CACHE_DB adds an SQLite tier shared across workers and restarts
+extraction_cache = ExtractionCache(
+    default_ttl=int(os.environ.get('EXTRACTION_CACHE_TTL', 600)),
+    db_path=os.environ.get('EXTRACTION_CACHE_DB') or None
+)
+video_downloader.extraction_cache = extraction_cache
+social_media_downloader.extraction_cache = extraction_cache
+
+# With EXTRACTION_PROCESSES=N, page scans and yt-dlp extraction run in N worker
+# processes (started on first use) so they scale past the GIL; downloads stay in threads
+extraction_processes = int(os.environ.get('EXTRACTION_PROCESSES', 0))
+extraction_pool = ExtractionPool(
+    workers=extraction_processes,
+    ydl_profiles={'extract': YDL_PROFILES['extract']}
+) if extraction_processes > 0 else None
+video_downloader.extraction_pool = extraction_pool
+social_media_downloader.extraction_pool = extraction_pool
+
+# HLS/DASH streams: segments fetched in parallel per download, and an optional
+# bandwidth cap (bits/s) for the variant picked from a manifest
+video_downloader.manifest_workers = int(os.environ.get('MANIFEST_WORKERS', 8))
+video_downloader.max_bandwidth = int(os.environ.get('MANIFEST_MAX_BANDWIDTH', 0)) or None
+
+# Bandwidth caps in bytes/s (suffixes K, M, G), shared by generic and yt-dlp downloads:
+# RATE_LIMIT_GLOBAL across all downloads, RATE_LIMIT_PER_JOB for each job,
+# RATE_LIMIT_PER_HOST for each upstream host, RATE_LIMIT_HOSTS="cdn.example.com=5M"
+# for specific hosts. Adjustable at runtime through /admin/rate-limits.
+rate_limiter = BandwidthLimiter(
+    global_rate=parse_rate(os.environ.get('RATE_LIMIT_GLOBAL', '')),
+    job_rate=parse_rate(os.environ.get('RATE_LIMIT_PER_JOB', '')),
+    host_rate=parse_rate(os.environ.get('RATE_LIMIT_PER_HOST', '')),
+    host_rates=parse_host_rates(os.environ.get('RATE_LIMIT_HOSTS', ''))
+)
+video_downloader.rate_limiter = rate_limiter
+social_media_downloader.rate_limiter = rate_limiter
+
+# Admin endpoints require this token (X-Admin-Token header); without it they only answer local requests
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN') or None
+
+# How finished downloads reach the client: FILE_SERVING_MODE=direct (default),
+# x-accel-redirect (nginx, with X_ACCEL_LOCATIONS="downloads=/protected/") or x-sendfile
+file_server = FileServer(
+    mode=os.environ.get('FILE_SERVING_MODE', 'direct'),
+    accel_locations=parse_accel_locations(os.environ.get('X_ACCEL_LOCATIONS', ''))
+)
+
+# Downloads are written under DOWNLOADS_ROOT; a requested download_path must lie inside it
+DOWNLOADS_ROOT = os.path.realpath(os.environ.get('DOWNLOADS_ROOT', 'downloads'))
+
+# Download progress tracker, one entry per download job
+download_jobs = DownloadJobRegistry(
+    max_jobs=int(os.environ.get('DOWNLOAD_JOBS_MAX', 500)),
+    finished_ttl=int(os.environ.get('DOWNLOAD_JOBS_TTL', 3600))
+)
+
+def store_progress(events):
+    """Apply a batch of progress events to the download jobs"""
+    for event in events:
+        download_jobs.update_job(event.job_id, **event.fields())
+
+def count_transitions(events):
+    for event in events:
+        if event.transition:
+            metrics.JOB_TRANSITIONS.inc(status=event.status)
+
+# Downloaders publish progress to the bus, which merges it and hands it to the
+# job tracker PROGRESS_INTERVAL seconds at a time; status changes go out at once.
+# PROGRESS_BARS=1 also draws a progress bar per download on the terminal.
+PROGRESS_BUS.interval = float(os.environ.get('PROGRESS_INTERVAL', 0.2))
+PROGRESS_BUS.subscribe(store_progress)
+PROGRESS_BUS.subscribe(count_transitions)
+if os.environ.get('PROGRESS_BARS', '0') == '1':
+    PROGRESS_BUS.subscribe(TqdmRenderer())
+
+# Background download workers; e.g. DOWNLOAD_PLATFORM_LIMITS="youtube=4,instagram=1".
+# Instagram defaults to one job at a time because the shared instaloader
+# session is not thread-safe.
+download_queue = DownloadJobQueue(
+    run_job=lambda job_id, url, download_path: run_download(job_id, url, download_path),
+    max_workers=int(os.environ.get('DOWNLOAD_WORKERS', 8)),
+    platform_limits=dict({'instagram': 1}, **parse_platform_limits(os.environ.get('DOWNLOAD_PLATFORM_LIMITS', ''))),
+    default_platform_limit=int(os.environ.get('DOWNLOAD_PLATFORM_LIMIT', 0)) or None
+)
+
+# With ASYNC_DOWNLOADS=1 (and httpx installed) background jobs for generic URLs run
+# as coroutines on one event loop instead of each holding a worker thread
+async_downloads_enabled = os.environ.get('ASYNC_DOWNLOADS', '0') == '1' and httpx is not None
+if async_downloads_enabled:
+    async_runner = AsyncDownloadRunner()
+    async_video_downloader = AsyncVideoDownloader(
+        video_downloader,
+        max_connections=int(os.environ.get('ASYNC_MAX_CONNECTIONS', 100)),
+        http2=os.environ.get('HTTP2', '0') == '1'
+    )
+else:
+    async_runner = None
+    async_video_downloader = None
+
+# With STREAM_DOWNLOADS=1, /download relays the video to the client while it is
+# being downloaded instead of after; a request can also ask with stream=1
+STREAM_DOWNLOADS = os.environ.get('STREAM_DOWNLOADS', '0') == '1'
+
+# Progress event streams send at most PROGRESS_EVENTS_PER_SECOND updates per job;
+# faster changes are merged into the next event
+PROGRESS_EVENTS_PER_SECOND = float(os.environ.get('PROGRESS_EVENTS_PER_SECOND', 4))
+# Seconds between keep-alive comments on an idle stream
+PROGRESS_KEEPALIVE = 15
+# Seconds a stream waits for a job that has not been registered yet
+PROGRESS_JOB_WAIT = 30
+
+def collect_metrics():
+    """Copy cache counters and queue depths into their gauges before a scrape"""
+    caches = {'extraction': extraction_cache}
+    if download_cache is not None:
+        caches['download'] = download_cache
+    for name, cache in caches.items():
+        stats = cache.stats()
+        metrics.CACHE_HITS.set(stats['hits'], cache=name)
+        metrics.CACHE_MISSES.set(stats['misses'], cache=name)
+        metrics.CACHE_HIT_RATIO.set(stats['hit_ratio'], cache=name)
+    for platform, counts in download_queue.platform_counts().items():
+        metrics.QUEUE_DEPTH.set(counts['queued'], platform=platform or 'unknown')
+        metrics.RUNNING_JOBS.set(counts['running'], platform=platform or 'unknown')
+
+# Pipeline metrics for Prometheus at /metrics; each worker process reports its own
+metrics.REGISTRY.add_collector(collect_metrics)
+
+# Per-stage timing of downloads and requests, off by default. TRACING=1 adds a
+# breakdown of where each job's time went to its status; TRACING_EXPORTERS=log,otel
+# also logs every span and/or sends it to OpenTelemetry (needs the otel extra)
+TRACER.configure(
+    enabled=os.environ.get('TRACING', '0') == '1',
+    exporters=build_exporters(os.environ.get('TRACING_EXPORTERS', ''))
+)
+
+@app.before_request
+def start_request_span():
+    """Time each request as a span named after its route"""
+    if not TRACER.enabled:
+        return
+    rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    g.trace_span = TRACER.span(f'{request.method} {rule}', method=request.method, route=rule)
+
+@app.after_request
+def tag_request_span(response):
+    span = g.get('trace_span')
+    if span is not None:
+        span.set_attribute('status', response.status_code)
+    return response
+
+@app.teardown_request
+def end_request_span(error=None):
+    span = g.pop('trace_span', None)
+    if span is not None:
+        span.end(error)
+
+# Batch and playlist downloads; each batch keeps BATCH_CONCURRENCY jobs in flight by default.
+# A batch only queues as many jobs as the job registry (DOWNLOAD_JOBS_MAX) has room for.
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 4))
+download_batches = DownloadBatchManager(
+    download_jobs,
+    submit_job=lambda job_id, url, download_path, platform, on_done: submit_download(
+        job_id, url, download_path, platform, on_done
+    ),
+    classify_url=lambda url: detect_platform(url),
+    expand_playlist=social_media_downloader.expand_playlist,
+    max_items=int(os.environ.get('BATCH_MAX_ITEMS', min(1000, download_jobs.max_jobs)))
+)
 
 @app.route('/')
 def index():
@@ -39,112 +231,200 @@ def index():
 @app.route('/download', methods=['GET', 'POST'])
 def download_video():
     """Handle video download request"""
-    global download_progress
-    
     # Get URL from either POST form data or GET query parameter
     if request.method == 'POST':
         url = request.form.get('url', '')
+        job_id = request.form.get('job_id', '')
     else:
         url = request.args.get('url', '')
+        job_id = request.args.get('job_id', '')
     
-    # Initialize download progress
-    download_progress = {
-        'status': 'idle',
-        'progress': 0,
-        'file_size': 0,
-        'downloaded': 0,
-        'speed': 0,
-        'filename': '',
-        'platform': ''
-    }
+    # Register the download job; the client may pick the ID so it can poll
+    # progress while this request is still running
+    if not download_jobs.is_valid_job_id(job_id):
+        job_id = None
+    job = download_jobs.create_job(job_id)
+    if job is None:
+        # Another request owns this ID; never let a second one take over its job
+        return jsonify({'success': False, 'error': 'Job ID already in use'}), 409
+    job_id = job['job_id']
     
     # Basic validation
     if not url:
+        update_download_progress(job_id, status='error')
         flash('Please enter a URL', 'danger')
         return redirect(url_for('index'))
     
     # Validate URL format
     if not validators.url(url):
+        update_download_progress(job_id, status='error')
         flash('Invalid URL format', 'danger')
         return redirect(url_for('index'))
     
     # Specify download location (default to downloads folder)
-    download_path = request.form.get('download_path', 'downloads')
+    download_path = resolve_download_path(request.form.get('download_path'))
+    if download_path is None:
+        update_download_progress(job_id, status='error')
+        flash('The download path must be inside the downloads folder', 'danger')
+        return redirect(url_for('index'))
     
-    # Create the downloads directory if it doesn't exist
-    os.makedirs(download_path, exist_ok=True)
+    # In proxy mode the first bytes reach the client after one upstream round trip
+    if request.values.get('stream', '1' if STREAM_DOWNLOADS else '0') == '1':
+        response = stream_download(job_id, url, download_path)
+        if response is not None:
+            response.headers['X-Job-Id'] = job_id
+            return response
     
-    try:
-        # Update initial progress status
-        update_download_progress(status='checking')
-        
-        # Check if it's a social media URL
-        is_social_media, platform = social_media_downloader.is_social_media_url(url)
-        
-        # Set platform in progress tracker
-        if is_social_media:
-            update_download_progress(platform=platform)
-        
-        # Choose the appropriate downloader based on URL type
-        if is_social_media:
-            logger.info(f"Using social media downloader for {platform}: {url}")
-            download_info = social_media_downloader.download_video(url, download_path)
-        else:
-            logger.info(f"Using general video downloader for: {url}")
-            download_info = video_downloader.download_video(url, download_path)
-        
-        if download_info['success']:
-            # Update final progress status
-            update_download_progress(
-                status='completed',
-                progress=100,
-                file_size=download_info.get('file_size', 0),
-                downloaded=download_info.get('file_size', 0),
-                filename=os.path.basename(download_info['filepath'])
-            )
-            
-            flash(f'Video downloaded successfully to {download_info["filepath"]}', 'success')
-            # Return the downloaded file
-            return send_file(download_info['filepath'], as_attachment=True)
-        else:
-            # If social media downloader failed, try the generic downloader as fallback
-            if is_social_media and not download_info['success']:
-                logger.info(f"Social media downloader failed, trying generic downloader as fallback")
-                update_download_progress(status='retrying', progress=0)
-                
-                download_info = video_downloader.download_video(url, download_path)
-                
-                if download_info['success']:
-                    # Update final progress status
-                    update_download_progress(
-                        status='completed',
-                        progress=100,
-                        file_size=download_info.get('file_size', 0),
-                        downloaded=download_info.get('file_size', 0),
-                        filename=os.path.basename(download_info['filepath'])
-                    )
-                    
-                    flash(f'Video downloaded successfully to {download_info["filepath"]}', 'success')
-                    return send_file(download_info['filepath'], as_attachment=True)
-            
-            # Set error status in progress tracker
-            update_download_progress(
-                status='error',
-                progress=0
-            )
-            
-            flash(f'Failed to download video: {download_info.get("error", "Unknown error")}', 'danger')
-    except Exception as e:
-        logger.exception("Exception during video download")
-        # Set error status in progress tracker
-        update_download_progress(
-            status='error',
-            progress=0
-        )
-        flash(f'An error occurred: {str(e)}', 'danger')
+    download_info = run_download(job_id, url, download_path)
+    
+    if download_info['success']:
+        flash(f'Video downloaded successfully to {download_info["filepath"]}', 'success')
+        # Return the downloaded file
+        response = file_server.send(download_info['filepath'], download_info.get('download_name'))
+        response.headers['X-Job-Id'] = job_id
+        return response
     
+    flash(f'Failed to download video: {download_info.get("error", "Unknown error")}', 'danger')
     return redirect(url_for('index'))
 
+@app.route('/jobs', methods=['POST'])
+def create_download_job():
+    """Queue a background download job and return its ID immediately"""
+    data = request.get_json(silent=True) or request.form
+    url = data.get('url', '')
+    
+    if not url or not validators.url(url):
+        return jsonify({'success': False, 'error': 'Invalid URL format'}), 400
+    
+    download_path = resolve_download_path(data.get('download_path'))
+    if download_path is None:
+        return jsonify({'success': False, 'error': 'download_path must be inside the downloads directory'}), 400
+    
+    job_id = data.get('job_id', '')
+    if not download_jobs.is_valid_job_id(job_id):
+        job_id = None
+    
+    platform = detect_platform(url)
+    job = download_jobs.create_job(job_id, status='queued', platform=platform, url=url)
+    if job is None:
+        # The ID belongs to a job that is already queued or ran; queueing it again
+        # would have two workers report into one job
+        return jsonify({'success': False, 'error': 'Job ID already in use'}), 409
+    job_id = job['job_id']
+    submit_download(job_id, url, download_path, platform)
+    
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status_url': url_for('get_download_job', job_id=job_id),
+        'file_url': url_for('get_download_job_file', job_id=job_id)
+    }), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_download_job(job_id):
+    """Return the status of a background download job"""
+    job = download_jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown download job', 'job_id': job_id}), 404
+    
+    response = progress_response(job)
+    response.pop('filepath', None)
+    if job['status'] == 'completed':
+        response['file_url'] = url_for('get_download_job_file', job_id=job_id)
+    return jsonify(response)
+
+@app.route('/jobs/<job_id>/file', methods=['GET'])
+def get_download_job_file(job_id):
+    """Serve the file produced by a completed download job"""
+    job = download_jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown download job', 'job_id': job_id}), 404
+    
+    if job['status'] != 'completed' or not job.get('filepath'):
+        return jsonify({
+            'error': 'Download is not ready',
+            'job_id': job_id,
+            'status': job['status']
+        }), 409
+    
+    if not os.path.exists(job['filepath']):
+        return jsonify({'error': 'Downloaded file no longer exists', 'job_id': job_id}), 410
+    
+    return file_server.send(job['filepath'], job['filename'] or None)
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def stream_download_job(job_id):
+    """Stream a download job's progress as Server-Sent Events"""
+    if not download_jobs.is_valid_job_id(job_id):
+        return jsonify({'error': 'Invalid job ID', 'job_id': job_id}), 400
+    
+    # The generator runs after the request context is gone, so build URLs now
+    file_url = url_for('get_download_job_file', job_id=job_id)
+    return Response(
+        progress_events(job_id, file_url),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/batch', methods=['POST'])
+def create_batch():
+    """Queue a batch of downloads from a list of URLs and/or a playlist URL"""
+    data = request.get_json(silent=True) or {}
+    urls = data.get('urls') or []
+    playlist_url = data.get('playlist_url') or None
+    
+    if not isinstance(urls, list) or (not urls and not playlist_url):
+        return jsonify({'success': False, 'error': 'Provide a list of urls or a playlist_url'}), 400
+    
+    invalid = [url for url in urls + [playlist_url] if url and not (isinstance(url, str) and validators.url(url))]
+    if invalid:
+        return jsonify({'success': False, 'error': 'Invalid URL format', 'invalid_urls': invalid}), 400
+    
+    if len(set(urls)) > download_batches.max_items:
+        return jsonify({'success': False, 'error': f'A batch holds at most {download_batches.max_items} URLs'}), 413
+    # Each URL becomes a job; more than the registry has room for would evict jobs clients still track
+    if len(set(urls)) > download_jobs.capacity():
+        return jsonify({'success': False, 'error': 'Too many downloads in progress; try again later'}), 429
+    
+    download_path = resolve_download_path(data.get('download_path'))
+    if download_path is None:
+        return jsonify({'success': False, 'error': 'download_path must be inside the downloads directory'}), 400
+    
+    try:
+        concurrency = int(data.get('concurrency', BATCH_CONCURRENCY))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'concurrency must be a number'}), 400
+    # More jobs in flight than there are workers would only queue up
+    concurrency = max(1, min(concurrency, download_queue.max_workers))
+    
+    batch = download_batches.create_batch(
+        urls=urls,
+        playlist_url=playlist_url,
+        concurrency=concurrency,
+        download_path=download_path
+    )
+    
+    return jsonify({
+        'success': True,
+        'batch_id': batch['batch_id'],
+        'status': batch['status'],
+        'total': batch['total'],
+        'status_url': url_for('get_batch', batch_id=batch['batch_id'])
+    }), 202
+
+@app.route('/batch/<batch_id>', methods=['GET'])
+def get_batch(batch_id):
+    """Return the aggregate status of a batch and the status of each of its jobs"""
+    batch = download_batches.get_batch(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Unknown batch', 'batch_id': batch_id}), 404
+    
+    for item in batch['items']:
+        item['status_url'] = url_for('get_download_job', job_id=item['job_id'])
+        if item['status'] == 'completed':
+            item['file_url'] = url_for('get_download_job_file', job_id=item['job_id'])
+    return jsonify(batch)
+
 @app.route('/check-url', methods=['POST'])
 def check_url():
     """Check if a URL contains downloadable video content"""
@@ -166,6 +446,59 @@ def check_url():
         result = video_downloader.check_url(url)
         return jsonify(result)
 
+@app.route('/cache-stats', methods=['GET'])
+def get_cache_stats():
+    """Return download cache hit/miss counters and size, and HTTP connection reuse, as JSON"""
+    stats = download_cache.stats() if download_cache is not None else {}
+    stats['enabled'] = download_cache is not None
+    stats['http_pool'] = http_session.pool_stats()
+    return jsonify(stats)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Return download pipeline metrics in the Prometheus text format"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/admin/rate-limits', methods=['GET', 'PUT'])
+def admin_rate_limits():
+    """
+    Show or change the bandwidth limits
+    
+    PUT takes any of global, per_job, per_host (bytes/s, or strings such as "5M";
+    null or 0 removes a limit), hosts (replaces the per-host limits) and jobs
+    (per-job limits, keyed by job ID).
+    """
+    if not admin_authorized():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    if request.method == 'PUT':
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Expected a JSON object'}), 400
+        
+        limits = {}
+        try:
+            for key, name in (('global', 'global_rate'), ('per_job', 'job_rate'), ('per_host', 'host_rate')):
+                if key in data:
+                    limits[name] = parse_rate(data[key])
+            if 'hosts' in data:
+                limits['host_rates'] = {host: parse_rate(rate) for host, rate in (data['hosts'] or {}).items()}
+            if 'jobs' in data:
+                limits['job_rates'] = {job_id: parse_rate(rate) for job_id, rate in (data['jobs'] or {}).items()}
+        except (ValueError, TypeError, AttributeError) as e:
+            return jsonify({'error': f'Invalid rate limits: {str(e)}'}), 400
+        
+        rate_limiter.set_limits(**limits)
+        logger.info(f"Rate limits changed: {rate_limiter.limits()}")
+    
+    return jsonify({'limits': rate_limiter.limits(), 'usage': rate_limiter.stats()})
+
+def admin_authorized():
+    """Whether the request may use the admin endpoints"""
+    if ADMIN_TOKEN is not None:
+        return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+    return request.remote_addr in ('127.0.0.1', '::1')
+
 @app.errorhandler(404)
 def page_not_found(e):
     return render_template('index.html', error='Page not found'), 404
@@ -176,21 +509,32 @@ def server_error(e):
 
 @app.route('/download-progress', methods=['GET'])
 def get_download_progress():
-    """Return the current download progress as JSON"""
-    global download_progress
+    """Return the progress of the most recent download job as JSON"""
+    # Kept for clients that predate job IDs; concurrent downloads should
+    # poll /download-progress/<job_id> instead
+    job = download_jobs.latest_job()
+    if job is None:
+        job = {
+            'job_id': None,
+            'status': 'idle',
+            'progress': 0,
+            'file_size': 0,
+            'downloaded': 0,
+            'speed': 0,
+            'filename': '',
+            'platform': ''
+        }
     
-    # Calculate human-readable sizes
-    human_readable = {
-        'file_size': format_size(download_progress['file_size']),
-        'downloaded': format_size(download_progress['downloaded']),
-        'speed': format_size(download_progress['speed']) + '/s',
-    }
-    
-    # Add the human-readable values to the response
-    response = download_progress.copy()
-    response.update({'human_readable': human_readable})
+    return jsonify(progress_response(job))
+
+@app.route('/download-progress/<job_id>', methods=['GET'])
+def get_job_progress(job_id):
+    """Return the progress of a single download job as JSON"""
+    job = download_jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown download job', 'job_id': job_id}), 404
     
-    return jsonify(response)
+    return jsonify(progress_response(job))
 
 @app.route('/get-direct-url', methods=['POST'])
 def get_direct_url():
@@ -223,33 +567,19 @@ def get_direct_url():
                     'error': f"Could not extract direct video URL from {platform}"
                 })
         else:
-            # For non-social media URLs, check if it's a direct video URL
-            head_response = requests.head(url, headers=video_downloader.headers, timeout=video_downloader.timeout)
-            content_type = head_response.headers.get('Content-Type', '')
-            
-            if any(f'video/{ext.lstrip(".")}' in content_type for ext in video_downloader.video_extensions):
-                # It's already a direct video URL
+            # For non-social media URLs, find the video file behind the page (or the URL itself)
+            resolved = video_downloader.resolve_video_url(url)
+            if resolved['success']:
                 return jsonify({
                     'success': True,
-                    'direct_url': url,
-                    'platform': 'direct'
-                })
-            else:
-                # It's a webpage, we need to extract the video URL
-                response = requests.get(url, headers=video_downloader.headers, timeout=video_downloader.timeout)
-                if response.status_code == 200:
-                    video_url = video_downloader.extract_video_url(url, response.text)
-                    if video_url:
-                        return jsonify({
-                            'success': True,
-                            'direct_url': video_url,
-                            'platform': 'webpage'
-                        })
-                
-                return jsonify({
-                    'success': False,
-                    'error': "Could not extract video URL from webpage"
+                    'direct_url': resolved['video_url'],
+                    'platform': 'direct' if resolved['video_url'] == url else 'webpage'
                 })
+            
+            return jsonify({
+                'success': False,
+                'error': "Could not extract video URL from webpage"
+            })
                 
     except Exception as e:
         logger.exception(f"Error getting direct URL: {str(e)}")
@@ -258,6 +588,23 @@ def get_direct_url():
             'error': f"Error: {str(e)}"
         })
 
+def detect_platform(url):
+    """Return the platform name a URL is queued under ('generic' for non-social URLs)"""
+    is_social_media, platform = social_media_downloader.is_social_media_url(url)
+    return platform if is_social_media else 'generic'
+
+def resolve_download_path(download_path):
+    """Return the real path of a requested download directory, or None if it is outside DOWNLOADS_ROOT"""
+    if not download_path:
+        return DOWNLOADS_ROOT
+    if not isinstance(download_path, str):
+        return None
+    # Relative paths are relative to the working directory, as the downloaders treat them
+    path = os.path.realpath(download_path)
+    if os.path.commonpath([path, DOWNLOADS_ROOT]) != DOWNLOADS_ROOT:
+        return None
+    return path
+
 def format_size(size_bytes):
     """Format bytes to human-readable size"""
     if size_bytes == 0:
@@ -271,24 +618,340 @@ def format_size(size_bytes):
     
     return f"{size_bytes:.2f} {size_names[i]}"
 
-def update_download_progress(status=None, progress=None, file_size=None, 
+def submit_download(job_id, url, download_path, platform, on_done=None):
+    """
+    Run a registered download job in the background
+    
+    Generic URLs go to the async download loop when it is enabled; everything
+    else is queued for the download worker threads.
+    
+    Args:
+        job_id (str): The registered job to run
+        url (str): The URL to download
+        download_path (str): The directory to save the download in
+        platform (str): The platform the URL belongs to
+        on_done (callable, optional): Called as on_done(job_id) once the job has finished
+    """
+    if async_runner is not None and platform == 'generic':
+        future = async_runner.submit(run_download_async(job_id, url, download_path))
+        if on_done is not None:
+            future.add_done_callback(lambda _: on_done(job_id))
+        return
+    
+    download_queue.submit(job_id, url, download_path, platform, on_done=on_done)
+
+def run_download(job_id, url, download_path):
+    """
+    Download a video, reporting progress to a download job
+    
+    Social media URLs go through the social media downloader first and fall
+    back to the generic downloader if that fails.
+    
+    Args:
+        job_id (str): The download job to report progress to
+        url (str): The URL of the video or page containing the video
+        download_path (str): The path to save the downloaded video
+        
+    Returns:
+        dict: Information about the download including success status
+    """
+    with TRACER.span('job', job_id=job_id, url=url):
+        return _run_download(job_id, url, download_path)
+
+def _run_download(job_id, url, download_path):
+    """run_download without the job span"""
+    # Create the downloads directory if it doesn't exist
+    os.makedirs(download_path, exist_ok=True)
+    
+    try:
+        # Update initial progress status
+        update_download_progress(job_id, status='checking')
+        
+        # Serve repeat downloads straight from the cache
+        download_info = download_cache.lookup(url) if download_cache is not None else None
+        if download_info:
+            logger.info(f"Serving cached download for: {url}")
+            return finish_download(job_id, download_info)
+        
+        # Check if it's a social media URL
+        is_social_media, platform = social_media_downloader.is_social_media_url(url)
+        
+        # Set platform in progress tracker
+        if is_social_media:
+            update_download_progress(job_id, platform=platform)
+        
+        # Choose the appropriate downloader based on URL type
+        if is_social_media:
+            logger.info(f"Using social media downloader for {platform}: {url}")
+            metrics.DOWNLOADER_ATTEMPTS.inc(platform=platform, downloader='social_media')
+            download_info = social_media_downloader.download_video(url, download_path, job_id=job_id)
+        else:
+            logger.info(f"Using general video downloader for: {url}")
+            metrics.DOWNLOADER_ATTEMPTS.inc(platform='generic', downloader='generic')
+            download_info = video_downloader.download_video(url, download_path, job_id=job_id)
+        
+        # If social media downloader failed, try the generic downloader as fallback
+        if is_social_media and not download_info['success']:
+            logger.info(f"Social media downloader failed, trying generic downloader as fallback")
+            update_download_progress(job_id, status='retrying', progress=0)
+            metrics.FALLBACKS.inc(platform=platform, from_downloader='social_media', to_downloader='generic')
+            metrics.DOWNLOADER_ATTEMPTS.inc(platform=platform, downloader='generic')
+            
+            download_info = video_downloader.download_video(url, download_path, job_id=job_id)
+        
+        download_info = cache_download(url, download_info)
+    except Exception as e:
+        logger.exception("Exception during video download")
+        download_info = {
+            'success': False,
+            'error': f'An error occurred: {str(e)}'
+        }
+    
+    return finish_download(job_id, download_info)
+
+async def run_download_async(job_id, url, download_path):
+    """
+    Download a generic (non social media) URL on the async download loop
+    
+    Args:
+        job_id (str): The download job to report progress to
+        url (str): The URL of the video or page containing the video
+        download_path (str): The path to save the downloaded video
+        
+    Returns:
+        dict: Information about the download including success status
+    """
+    with TRACER.span('job', job_id=job_id, url=url):
+        return await _run_download_async(job_id, url, download_path)
+
+async def _run_download_async(job_id, url, download_path):
+    """run_download_async without the job span"""
+    os.makedirs(download_path, exist_ok=True)
+    
+    try:
+        update_download_progress(job_id, status='checking')
+        
+        # The cache index is SQLite and may wait on a lock; keep that off the loop
+        download_info = await asyncio.to_thread(download_cache.lookup, url) if download_cache is not None else None
+        if download_info:
+            logger.info(f"Serving cached download for: {url}")
+            return finish_download(job_id, download_info)
+        
+        logger.info(f"Using asynchronous video downloader for: {url}")
+        download_info = await async_video_downloader.download_video(url, download_path, job_id=job_id)
+        
+        # Hashing the file for the cache would block the loop
+        download_info = await asyncio.to_thread(cache_download, url, download_info)
+    except Exception as e:
+        logger.exception("Exception during video download")
+        download_info = {
+            'success': False,
+            'error': f'An error occurred: {str(e)}'
+        }
+    
+    return finish_download(job_id, download_info)
+
+def stream_download(job_id, url, download_path):
+    """
+    Relay a video to the client while it downloads
+    
+    The bytes are passed on as they arrive from upstream and saved on the
+    way; once the client has received the whole video it is stored in the
+    download cache like any other download.
+    
+    Args:
+        job_id (str): The download job to report progress to
+        url (str): The URL of the video or page containing the video
+        download_path (str): The path to save the downloaded video
+        
+    Returns:
+        Response or None: The streaming response, or None if the video cannot be
+        relayed as a single stream and should be downloaded first
+    """
+    with TRACER.span('job', job_id=job_id, url=url, stream=True):
+        return _stream_download(job_id, url, download_path)
+
+def _stream_download(job_id, url, download_path):
+    """stream_download without the job span"""
+    update_download_progress(job_id, status='checking')
+    
+    download_info = download_cache.lookup(url) if download_cache is not None else None
+    if download_info:
+        logger.info(f"Serving cached download for: {url}")
+        finish_download(job_id, download_info)
+        return file_server.send(download_info['filepath'], download_info.get('download_name'))
+    
+    # Social media videos can only be relayed if the platform offers a single media URL
+    is_social_media, platform = social_media_downloader.is_social_media_url(url)
+    video_url = None
+    if is_social_media:
+        update_download_progress(job_id, platform=platform)
+        video_url = social_media_downloader.get_direct_video_url(url, platform)
+        if not video_url:
+            return None
+    
+    stream = video_downloader.stream_video(url, download_path, job_id=job_id, video_url=video_url)
+    if not stream['success']:
+        logger.info(f"Cannot stream {url}, downloading it first: {stream.get('error')}")
+        return None
+    if is_social_media:
+        update_download_progress(job_id, platform=platform)
+    
+    def relay():
+        try:
+            yield from stream['chunks']
+        except GeneratorExit:
+            finish_download(job_id, {'success': False, 'error': 'Client disconnected before the download finished'})
+            raise
+        except Exception as e:
+            # Re-raised so the server aborts the response rather than ending it cleanly
+            logger.exception("Exception while streaming video")
+            finish_download(job_id, {'success': False, 'error': f'An error occurred: {str(e)}'})
+            raise
+        
+        download_info = stream['download_info']
+        try:
+            download_info = cache_download(url, download_info)
+        except Exception:
+            logger.exception("Could not cache streamed download")
+        finish_download(job_id, download_info)
+    
+    response = Response(relay(), mimetype=stream['content_type'])
+    if stream['content_length']:
+        response.headers['Content-Length'] = str(stream['content_length'])
+    response.headers.set('Content-Disposition', 'attachment', filename=stream['filename'])
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def cache_download(url, download_info):
+    """Keep a successful download in the cache, keyed by page URL and media URL"""
+    if not download_info['success'] or download_cache is None:
+        return download_info
+    
+    if download_info.get('cached'):
+        # The page resolved to a media URL we already had
+        download_cache.alias(url, download_info['sha256'])
+        return download_info
+    
+    return download_cache.store(
+        url,
+        download_info['filepath'],
+        aliases=[download_info.get('video_url')],
+        info=download_info
+    )
+
+def finish_download(job_id, download_info):
+    """Record the outcome of a download on its job and return the download information"""
+    # Apply what the downloader published first, so none of it lands after the outcome
+    PROGRESS_BUS.flush()
+    if download_info['success']:
+        # The file and the completed status are set in one update, so a job that reads
+        # completed can always be served, under its final name
+        download_jobs.update_job(
+            job_id,
+            status='completed',
+            progress=100,
+            file_size=download_info.get('file_size', 0),
+            downloaded=download_info.get('file_size', 0),
+            filename=download_info.get('download_name') or os.path.basename(download_info['filepath']),
+            filepath=download_info['filepath']
+        )
+    else:
+        download_jobs.update_job(
+            job_id,
+            status='error',
+            progress=0,
+            error=download_info.get('error', 'Unknown error')
+        )
+    # Let the other subscribers (metrics, progress bars) see the outcome too
+    update_download_progress(job_id, status='completed' if download_info['success'] else 'error')
+    
+    job = download_jobs.get_job(job_id)
+    metrics.DOWNLOADS.inc(
+        platform=(job or {}).get('platform') or 'generic',
+        status='success' if download_info['success'] else 'error'
+    )
+    rate_limiter.forget_job(job_id)
+    return download_info
+
+def progress_response(job):
+    """Add human-readable sizes to a job snapshot for the progress endpoints"""
+    human_readable = {
+        'file_size': format_size(job['file_size']),
+        'downloaded': format_size(job['downloaded']),
+        'speed': format_size(job['speed']) + '/s',
+    }
+    
+    response = dict(job)
+    response.update({'human_readable': human_readable})
+    # Where the job's time went, stage by stage
+    if TRACER.enabled:
+        response['timings'] = TRACER.job_timings(job['job_id'])
+    return response
+
+def progress_events(job_id, file_url):
+    """
+    Yield Server-Sent Events for a download job until it finishes.
+    
+    The first 'progress' event carries the whole job, later ones only the
+    fields that changed. A final 'end' event (or 'gone' if the job is
+    unknown or was removed) closes the stream.
+    """
+    interval = 1.0 / PROGRESS_EVENTS_PER_SECOND
+    deadline = time.time() + PROGRESS_JOB_WAIT
+    version = 0
+    sent = {}
+    
+    # Reconnect after two seconds if the connection drops
+    yield 'retry: 2000\n\n'
+    
+    while True:
+        job = download_jobs.wait_for_update(job_id, version, timeout=PROGRESS_KEEPALIVE)
+        
+        if job is None:
+            # Clients may open the stream before the download request registers the job
+            if not sent and time.time() < deadline:
+                yield ': waiting\n\n'
+                continue
+            yield sse_event('gone', {'job_id': job_id, 'error': 'Unknown download job'})
+            return
+        
+        if job['version'] == version:
+            yield ': keepalive\n\n'
+            continue
+        version = job['version']
+        
+        data = progress_response(job)
+        data.pop('filepath', None)
+        if job['status'] == 'completed':
+            data['file_url'] = file_url
+        delta = {key: value for key, value in data.items() if sent.get(key) != value}
+        delta['job_id'] = job_id
+        sent = data
+        yield sse_event('progress', delta)
+        
+        if job['status'] in download_jobs.FINISHED_STATUSES:
+            yield sse_event('end', {'job_id': job_id, 'status': job['status']})
+            return
+        
+        # Coalesce updates that arrive before the next event is due
+        time.sleep(interval)
+
+def sse_event(event, data):
+    """Format a Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def update_download_progress(job_id, status=None, progress=None, file_size=None,
                           downloaded=None, speed=None, filename=None, platform=None):
-    """Update the global download progress tracker"""
-    global download_progress
-    
-    if status is not None:
-        download_progress['status'] = status
-    if progress is not None:
-        download_progress['progress'] = progress
-    if file_size is not None:
-        download_progress['file_size'] = file_size
-    if downloaded is not None:
-        download_progress['downloaded'] = downloaded
-    if speed is not None:
-        download_progress['speed'] = speed
-    if filename is not None:
-        download_progress['filename'] = filename
-    if platform is not None:
-        download_progress['platform'] = platform
-    
-    return download_progress
+    """Update the progress tracker of a single download job"""
+    # Published like the downloaders' own updates, so the tracker sees them in order
+    PROGRESS_BUS.publish(
+        job_id,
+        status=status,
+        progress=progress,
+        file_size=file_size,
+        downloaded=downloaded,
+        speed=speed,
+        filename=filename,
+        platform=platform
+    )
@@ -0,0 +1,446 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime
+
+from download_journal import DownloadJournal
+from manifest_downloader import manifest_type
+from media_probe import SNIFF_SIZE, ProbeResult
+from metrics import EXTRACTION_SECONDS, TIME_TO_FIRST_BYTE_SECONDS, observe_transfer
+from tracing import TRACER
+
+# httpx provides the asyncio HTTP client; without it only the blocking downloader is available
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# h2 lets httpx speak HTTP/2
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+
+class AsyncVideoDownloader:
+    """
+    An asyncio download core for the generic (non social media) path.
+
+    Probing, page fetches, extraction and streaming to disk all run as
+    coroutines on one event loop, so an in-flight download costs a socket
+    and a coroutine rather than an OS thread. Settings, file naming, the
+    extraction cache and the download cache are taken from the wrapped
+    VideoDownloader, and results have the same shape as its download_video().
+    """
+
+    def __init__(self, video_downloader, max_connections=100, chunk_size=1024 * 64, http2=False):
+        """
+        Args:
+            video_downloader (VideoDownloader): Supplies headers, timeouts, extension
+                handling, page extraction and the caches
+            max_connections (int): Maximum downloads transferring at once, and the size
+                of the connection pool; further downloads wait their turn
+            chunk_size (int): Bytes read from a response at a time
+            http2 (bool): Negotiate HTTP/2 where servers offer it, multiplexing
+                requests to a host over one connection; needs the h2 package
+        """
+        if httpx is None:
+            raise RuntimeError("httpx is required for asynchronous downloads")
+
+        self.logger = logging.getLogger(__name__)
+        self.downloader = video_downloader
+        self.max_connections = max_connections
+        self.chunk_size = chunk_size
+        if http2 and h2 is None:
+            self.logger.warning("HTTP/2 requested but the h2 package is not installed; using HTTP/1.1")
+        self.http2 = http2 and h2 is not None
+        # Created on first use so it is bound to the loop that runs the downloads
+        self._client = None
+        # Downloads wait here rather than in the connection pool, whose wait
+        # queue gets slow with thousands of pending requests
+        self._slots = asyncio.Semaphore(max_connections)
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers=self.downloader.headers,
+                timeout=self.downloader.timeout,
+                follow_redirects=True,
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=min(self.max_connections, 100)
+                )
+            )
+        return self._client
+
+    async def aclose(self):
+        """Close the connection pool"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def resolve_video_url(self, url):
+        """
+        Find the URL of the video file behind a page or direct link
+
+        Args:
+            url (str): The URL of the video or page containing the video
+
+        Returns:
+            dict: success status, the strategy that found the video and either video_url
+            or error; content_type is included when the URL itself is the video
+        """
+        start_time = time.time()
+        with TRACER.span('resolve', url=url) as span:
+            result = await self._resolve_video_url(url)
+            span.set_attribute('strategy', result['strategy'])
+        EXTRACTION_SECONDS.observe(time.time() - start_time, platform='generic', strategy=result['strategy'])
+        return result
+
+    async def _resolve_video_url(self, url):
+        """resolve_video_url without the latency measurement"""
+        # The caches are SQLite-backed and may wait on a lock, so they are used off the loop
+        cache = self.downloader.extraction_cache
+        if cache is not None:
+            cached = await asyncio.to_thread(cache.get, 'video_url', url)
+            if cached:
+                self.logger.info(f"Using cached video URL for: {url}")
+                return {'success': True, 'video_url': cached['video_url'], 'strategy': 'cache'}
+
+        probe, page = await self.probe(url, read_page=True)
+
+        # Direct video file or stream manifest
+        if probe.is_media:
+            self.logger.info("Direct video link detected")
+            if cache is not None:
+                await asyncio.to_thread(cache.set, 'video_url', url, {'video_url': url}, media_url=url)
+            return {'success': True, 'video_url': url, 'strategy': 'direct', 'probe': probe}
+
+        if probe.status_code not in (200, 206):
+            self.logger.warning(f"Failed to access the URL. Status code: {probe.status_code}")
+            return {
+                'success': False,
+                'strategy': 'none',
+                'error': f"Failed to access the URL. Status code: {probe.status_code}"
+            }
+
+        # Parsing a large page would stall every other download on the loop
+        self.logger.info("Parsing HTML content to find video source")
+        best = await asyncio.to_thread(self.downloader._extract_best_candidate, url, page)
+        if not best:
+            self.logger.warning("No video source found on the page")
+            return {
+                'success': False,
+                'strategy': 'none',
+                'error': "No video source found on the page"
+            }
+
+        video_url = self.downloader._ensure_absolute_url(best['url'], url)
+        if cache is not None:
+            await asyncio.to_thread(cache.set, 'video_url', url, {'video_url': video_url}, media_url=video_url)
+        return {'success': True, 'video_url': video_url, 'strategy': best['strategy']}
+
+    async def probe(self, url, headers=None, read_page=False, cached=False):
+        """
+        Find out what a URL serves with one streaming GET, as VideoDownloader.probe does
+
+        Args:
+            url (str): The URL to probe
+            headers (dict, optional): Headers added to the client's defaults
+            read_page (bool): Read the rest of the body if it is not media
+            cached (bool): Return a remembered probe if there is one
+
+        Returns:
+            tuple: The ProbeResult, closed, and the decoded page (None for media,
+            error responses or when read_page is False)
+        """
+        cache = self.downloader.extraction_cache
+        if cached and cache is not None:
+            memo = await asyncio.to_thread(cache.get, 'probe', url)
+            if memo:
+                self.logger.info(f"Using cached probe for: {url}")
+                return ProbeResult(url, memo=memo), None
+
+        start_time = time.time()
+        with TRACER.span('probe', url=url) as span:
+            response = await self.client.send(
+                self.client.build_request('GET', url, headers=dict(headers or {}, Range='bytes=0-')), stream=True
+            )
+            try:
+                chunks = response.aiter_bytes(SNIFF_SIZE)
+                first_chunk = await anext(chunks, b'')
+                # ProbeResult only reads the status, headers, encoding and URL of the response
+                probe = ProbeResult(str(response.url), response, first_chunk)
+                probe.response = None
+                span.set_attribute('kind', probe.kind)
+                span.set_attribute('status', probe.status_code)
+
+                page = None
+                if read_page and not probe.is_media and probe.status_code in (200, 206):
+                    with TRACER.span('page.fetch', url=url):
+                        body = first_chunk + b''.join([data async for data in chunks])
+                    page = body.decode(probe.encoding or 'utf-8', errors='replace')
+            finally:
+                await response.aclose()
+
+        probe.url = url
+        if probe.is_media:
+            TIME_TO_FIRST_BYTE_SECONDS.observe(time.time() - start_time, platform='generic', engine='async')
+        if probe.status_code < 400 and cache is not None:
+            await asyncio.to_thread(cache.set, 'probe', url, probe.as_memo(), media_url=url)
+        return probe, page
+
+    async def download_video(self, url, download_path='downloads', job_id=None):
+        """
+        Download a video from a URL
+
+        Args:
+            url (str): The URL of the video or page containing the video
+            download_path (str): The path to save the downloaded video
+            job_id (str, optional): The download job to report progress to
+
+        Returns:
+            dict: Information about the download including success status
+        """
+        self.logger.info(f"Starting asynchronous download from: {url}")
+        os.makedirs(download_path, exist_ok=True)
+
+        async with self._slots:
+            return await self._download_video(url, download_path, job_id)
+
+    async def _download_video(self, url, download_path, job_id):
+        retry_count = 0
+        while retry_count < self.downloader.max_retries:
+            try:
+                resolved = await self.resolve_video_url(url)
+                if not resolved['success']:
+                    return resolved
+                video_url = resolved['video_url']
+                self.logger.info(f"Video URL identified: {video_url}")
+
+                # Another page may already have led us to the same media file
+                if self.downloader.cache is not None:
+                    cached = await asyncio.to_thread(self.downloader.cache.lookup, video_url, count=False)
+                    if cached:
+                        cached['original_url'] = url
+                        return cached
+
+                # A direct link was already probed while resolving it
+                probe = resolved.get('probe')
+                if probe is None:
+                    probe, _ = await self.probe(video_url, headers={'Referer': url}, cached=True)
+                if probe.status_code is not None and probe.status_code >= 400:
+                    return {
+                        'success': False,
+                        'error': f"Failed to access the video. Status code: {probe.status_code}"
+                    }
+                content_type = probe.content_type or ''
+
+                # Segment fetching for HLS/DASH already runs on its own thread pool
+                if probe.kind in ('hls', 'dash') or manifest_type(video_url, content_type):
+                    return await asyncio.to_thread(
+                        self.downloader._download_manifest, url, video_url, download_path, content_type, job_id
+                    )
+
+                file_ext = self.downloader._get_file_extension(video_url, content_type)
+                timestamp = datetime.now().strftime('%Y%m%d%H%M%S_%f')
+                filepath = os.path.join(download_path, f"video_{timestamp}{file_ext}")
+
+                try:
+                    with TRACER.span('transfer', url=video_url):
+                        await self._download_file(video_url, filepath, headers={'Referer': url}, job_id=job_id)
+                except httpx.TransportError:
+                    # Let the retry loop pick up the partial download where it stopped
+                    raise
+                except Exception as download_error:
+                    self.logger.exception(f"Error during download: {str(download_error)}")
+                    if self.downloader.extraction_cache is not None:
+                        await asyncio.to_thread(self.downloader.extraction_cache.invalidate, 'video_url', url)
+                    return {
+                        'success': False,
+                        'error': f"Download error: {str(download_error)}"
+                    }
+
+                if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
+                    self.logger.info(f"Video downloaded successfully to: {filepath}")
+                    return {
+                        'success': True,
+                        'filepath': filepath,
+                        'original_url': url,
+                        'video_url': video_url,
+                        'file_size': os.path.getsize(filepath)
+                    }
+                return {
+                    'success': False,
+                    'error': "Download failed - empty file or file does not exist"
+                }
+
+            except httpx.TransportError as e:
+                retry_count += 1
+                self.logger.warning(f"Transfer interrupted ({str(e)}), retrying "
+                                    f"({retry_count}/{self.downloader.max_retries})...")
+                await asyncio.sleep(2)
+
+            except httpx.HTTPError as e:
+                self.logger.error(f"Request error: {str(e)}")
+                return {
+                    'success': False,
+                    'error': f"Request error: {str(e)}"
+                }
+
+            except Exception as e:
+                self.logger.exception(f"Unexpected error: {str(e)}")
+                return {
+                    'success': False,
+                    'error': f"Unexpected error: {str(e)}"
+                }
+
+        return {
+            'success': False,
+            'error': "Maximum retry attempts reached"
+        }
+
+    async def _download_file(self, url, filepath, headers=None, job_id=None):
+        """
+        Stream a file to disk, resuming from the download journal if possible
+
+        Args:
+            url (str): The URL of the file to download
+            filepath (str): The path to save the file
+            headers (dict, optional): Headers added to the client's defaults
+            job_id (str, optional): The download job to report progress to
+        """
+        filename = os.path.basename(filepath)
+        self.downloader.progress_bus.publish(
+            job_id,
+            status='downloading',
+            progress=0,
+            file_size=0,
+            downloaded=0,
+            speed=0,
+            filename=filename,
+            platform='generic'
+        )
+
+        # Another download of the URL may hold the journal; wait for it off the loop
+        journal = await asyncio.to_thread(
+            DownloadJournal.open, os.path.join(os.path.dirname(filepath) or '.', '.partial'), url
+        )
+        with journal:
+            request_headers = dict(headers or {})
+            resume_from = journal.contiguous_prefix()
+            if resume_from and journal.if_range_value():
+                request_headers['Range'] = f"bytes={resume_from}-"
+                request_headers['If-Range'] = journal.if_range_value()
+            else:
+                resume_from = 0
+
+            request_time = time.time()
+            async with self.client.stream('GET', url, headers=request_headers) as response:
+                TIME_TO_FIRST_BYTE_SECONDS.observe(time.time() - request_time, platform='generic', engine='async')
+                response.raise_for_status()
+                if resume_from and response.status_code == 206:
+                    self.logger.info(f"Resuming download at byte {resume_from}")
+                    mode = 'r+b'
+                else:
+                    resume_from = 0
+                    mode = 'wb'
+                    journal.reset(
+                        etag=response.headers.get('ETag'),
+                        last_modified=response.headers.get('Last-Modified')
+                    )
+
+                total_size = resume_from + int(response.headers.get('Content-Length', 0))
+                journal.total_size = total_size
+                journal.save()
+                self.downloader.progress_bus.publish(job_id, file_size=total_size)
+
+                start_time = time.time()
+                downloaded = resume_from
+                last_update_time = start_time
+                last_checkpoint_time = start_time
+                throttle = self.downloader.throttle(url, job_id)
+
+                # Writes land in the page cache and return quickly, so they stay on the loop
+                with open(journal.part_path, mode) as file:
+                    file.seek(resume_from)
+                    file.truncate()
+                    try:
+                        async for data in response.aiter_bytes(self.chunk_size):
+                            file.write(data)
+                            downloaded += len(data)
+                            if throttle is not None:
+                                # Wait on the loop, not in a thread, so other downloads keep going
+                                delay = throttle.reserve(len(data))
+                                if delay > 0:
+                                    await asyncio.sleep(delay)
+
+                            current_time = time.time()
+                            if current_time - last_update_time >= 0.2:
+                                self.downloader.progress_bus.publish(
+                                    job_id,
+                                    progress=min(downloaded / total_size * 100, 99.9) if total_size > 0 else 0,
+                                    downloaded=downloaded,
+                                    speed=(downloaded - resume_from) / (current_time - start_time)
+                                )
+                                last_update_time = current_time
+
+                            if current_time - last_checkpoint_time >= 1.0:
+                                file.flush()
+                                journal.set_ranges([(0, downloaded)])
+                                journal.save()
+                                last_checkpoint_time = current_time
+                    finally:
+                        # Record how far we got so a retry can resume from here
+                        file.flush()
+                        journal.set_ranges([(0, downloaded)])
+                        journal.save()
+
+            journal.complete(filepath)
+
+            elapsed = time.time() - start_time
+            observe_transfer('generic', 'async', downloaded - resume_from, elapsed)
+            # Bytes are on disk; the job completes once the app has recorded the file
+            self.downloader.progress_bus.publish(
+                job_id,
+                status='processing',
+                progress=99.9,
+                downloaded=downloaded,
+                speed=(downloaded - resume_from) / elapsed if elapsed > 0 else 0
+            )
+
+
+class AsyncDownloadRunner:
+    """
+    Runs an event loop on a background thread for synchronous callers.
+
+    Flask views and worker threads hand coroutines to the loop with submit()
+    and get a concurrent.futures.Future back, or block on run().
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name='async-downloads', daemon=True)
+        self._thread.start()
+
+    def submit(self, coro):
+        """Schedule a coroutine on the loop; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the loop and wait for its result"""
+        return self.submit(coro).result(timeout)
+
+    def shutdown(self):
+        """Stop the loop after the current iteration"""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
@@ -0,0 +1,233 @@
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+
+
+class DownloadBatchManager:
+    """
+    Runs many downloads as one batch.
+
+    A batch is a list of URLs, or a playlist that is expanded into one. Each
+    URL becomes an ordinary download job; the batch keeps at most
+    `concurrency` of them on the download queue at a time and hands the
+    next one over as each finishes, so one large playlist cannot crowd out
+    other users' jobs. The queue's own worker and per-platform limits still
+    apply on top of the batch limit.
+
+    A batch never registers more jobs than the job registry has room for,
+    so it cannot push the registry past its limit and evict jobs that
+    clients are still tracking; a playlist that does not fit is truncated.
+    """
+
+    # Batch states after which no further jobs are started
+    FINISHED_STATUSES = ('completed', 'error')
+
+    def __init__(self, download_jobs, submit_job, classify_url, expand_playlist,
+                 max_items=1000, max_batches=100):
+        """
+        Args:
+            download_jobs (DownloadJobRegistry): Registry the batch's jobs are created in
+            submit_job (callable): Runs a job in the background, called as
+                submit_job(job_id, url, download_path, platform, on_done)
+            classify_url (callable): Returns the platform name used to queue a URL
+            expand_playlist (callable): Returns the video URLs of a playlist URL
+            max_items (int): Maximum number of URLs in one batch
+            max_batches (int): Number of batches retained before finished ones are evicted
+        """
+        self.logger = logging.getLogger(__name__)
+        self.download_jobs = download_jobs
+        self.submit_job = submit_job
+        self.classify_url = classify_url
+        self.expand_playlist = expand_playlist
+        self.max_items = max_items
+        self.max_batches = max_batches
+        # Batches in creation order, oldest first
+        self._batches = OrderedDict()
+        # Re-entrant because a job that finishes immediately may report back
+        # from inside submit_job, while _start still holds the lock
+        self._lock = threading.RLock()
+
+    def create_batch(self, urls=None, playlist_url=None, concurrency=4, download_path='downloads'):
+        """
+        Start a batch download.
+
+        Args:
+            urls (list, optional): Video URLs to download
+            playlist_url (str, optional): A playlist whose videos are added after urls
+            concurrency (int): Maximum number of the batch's jobs queued or running at once
+            download_path (str): The directory to save the downloads in
+
+        Returns:
+            dict: The batch status, as returned by get_batch()
+        """
+        batch_id = uuid.uuid4().hex
+        batch = {
+            'batch_id': batch_id,
+            'status': 'expanding' if playlist_url else 'running',  # expanding, running, completed, error
+            'concurrency': max(1, concurrency),
+            'download_path': download_path,
+            'playlist_url': playlist_url,
+            'error': None,
+            'items': [],
+            'created_at': time.time(),
+            'finished_at': None,
+            # Index of the next item to hand to the download queue
+            'next': 0,
+            # Items handed to the queue that have not finished yet
+            'active': 0,
+        }
+
+        with self._lock:
+            self._batches[batch_id] = batch
+            self._evict()
+            self._add_items(batch, urls or [])
+
+        if playlist_url:
+            # Expanding a long playlist can take a while; do it off the request thread
+            threading.Thread(
+                target=self._expand,
+                args=(batch, playlist_url),
+                name=f"batch-expand-{batch_id[:8]}",
+                daemon=True
+            ).start()
+        else:
+            with self._lock:
+                self._start(batch)
+
+        return self.get_batch(batch_id)
+
+    def get_batch(self, batch_id):
+        """
+        Return the aggregate status of a batch.
+
+        Args:
+            batch_id (str): The batch to look up
+
+        Returns:
+            dict or None: Overall status and progress, per-status counts and each
+            item's job status, or None if the batch is unknown
+        """
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return None
+            items = [dict(item) for item in batch['items']]
+            summary = {
+                key: batch[key] for key in
+                ('batch_id', 'status', 'concurrency', 'playlist_url', 'error', 'created_at', 'finished_at')
+            }
+
+        counts = {}
+        total_progress = 0
+        downloaded = 0
+        for item in items:
+            job = self.download_jobs.get_job(item['job_id'])
+            if job is not None:
+                item.update(
+                    status=job['status'],
+                    progress=job['progress'],
+                    downloaded=job['downloaded'],
+                    filename=job['filename'],
+                    error=job.get('error')
+                )
+            counts[item['status']] = counts.get(item['status'], 0) + 1
+            total_progress += 100 if item['status'] == 'completed' else item.get('progress', 0)
+            downloaded += item.get('downloaded', 0)
+
+        summary.update({
+            'total': len(items),
+            'counts': counts,
+            'progress': round(total_progress / len(items), 1) if items else 0,
+            'downloaded': downloaded,
+            'items': items,
+        })
+        return summary
+
+    def _expand(self, batch, playlist_url):
+        try:
+            urls = self.expand_playlist(playlist_url)
+        except Exception as e:
+            self.logger.exception(f"Could not expand playlist {playlist_url}")
+            urls = []
+            error = f"Could not expand playlist: {str(e)}"
+        else:
+            error = None if urls else 'Playlist has no videos'
+
+        with self._lock:
+            self._add_items(batch, urls)
+            if error and not batch['items']:
+                batch['status'] = 'error'
+                batch['error'] = error
+                batch['finished_at'] = time.time()
+                return
+            batch['status'] = 'running'
+            self._start(batch)
+
+    def _add_items(self, batch, urls):
+        """Register a queued job for each new URL in the batch"""
+        # Caller must hold self._lock
+        seen = {item['url'] for item in batch['items']}
+        room = self.download_jobs.capacity()
+        for url in urls:
+            if url in seen:
+                continue
+            if len(batch['items']) >= self.max_items:
+                self.logger.warning(f"Batch {batch['batch_id']} truncated to {self.max_items} items")
+                break
+            if room <= 0:
+                self.logger.warning(f"Batch {batch['batch_id']} truncated to {len(batch['items'])} items; "
+                                    f"the download job registry is full")
+                batch['error'] = f"Only {len(batch['items'])} videos were queued; too many downloads are in progress"
+                break
+            room -= 1
+            seen.add(url)
+            platform = self.classify_url(url)
+            job = self.download_jobs.create_job(status='queued', platform=platform, url=url)
+            batch['items'].append({
+                'url': url,
+                'job_id': job['job_id'],
+                'platform': platform,
+                'status': 'queued',
+            })
+
+    def _start(self, batch):
+        """Hand jobs to the download queue until the batch's concurrency is reached"""
+        # Caller must hold self._lock
+        items = batch['items']
+        while batch['active'] < batch['concurrency'] and batch['next'] < len(items):
+            item = items[batch['next']]
+            batch['next'] += 1
+            batch['active'] += 1
+            self.submit_job(
+                item['job_id'], item['url'], batch['download_path'], item['platform'],
+                lambda job_id, batch=batch, item=item: self._job_done(batch, item)
+            )
+
+        if batch['active'] == 0 and batch['next'] >= len(items):
+            batch['status'] = 'completed'
+            batch['finished_at'] = time.time()
+
+    def _job_done(self, batch, item):
+        # Keep the final state in case the job registry evicts the job before the batch
+        job = self.download_jobs.get_job(item['job_id'])
+        with self._lock:
+            if job is not None:
+                item.update(
+                    status=job['status'],
+                    progress=job['progress'],
+                    downloaded=job['downloaded'],
+                    filename=job['filename'],
+                    error=job.get('error')
+                )
+            batch['active'] -= 1
+            self._start(batch)
+
+    def _evict(self):
+        """Drop the oldest finished batches while over capacity"""
+        # Caller must hold self._lock
+        for batch_id in [b for b, batch in self._batches.items() if batch['status'] in self.FINISHED_STATUSES]:
+            if len(self._batches) <= self.max_batches:
+                return
+            del self._batches[batch_id]
@@ -0,0 +1,285 @@
+"""
+A local HTTP server with synthetic pages and media for benchmarks.
+
+Pages (src picks the media they point at, default /media/clip.mp4):
+    /pages/video-tag         <video src>
+    /pages/source-tag        standalone <source type="video/mp4">
+    /pages/iframe            a YouTube embed only
+    /pages/data-attribute    <div data-video>
+    /pages/spa?size_kb=4096  a large single-page app: markup, inline state and
+                             the video URL deep inside the JSON
+
+Media (size in bytes, rate in bytes/s per connection, latency in ms before headers):
+    /media/<name>.mp4?size=&rate=&latency=    supports Range
+    /norange/<name>.mp4?size=&rate=&latency=  ignores Range, like many CDNs
+    /hls/master.m3u8?segments=&segment_size=  two variants of MPEG-TS segments
+
+Bodies are generated from a repeating pattern that starts with an MP4 ftyp
+box, so every offset can be served without holding the file.
+
+Usage:
+    python benchmarks/fake_media_server.py [--port 8000]
+"""
+import re
+import sys
+import time
+import random
+import argparse
+import multiprocessing
+from urllib.parse import urlsplit, parse_qs, quote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULT_MEDIA_SIZE = 1024 * 1024 * 8
+
+# ftyp box of an ISO base media file, so the downloader sniffs the bytes as video
+FTYP_BOX = b'\x00\x00\x00\x18ftypmp42\x00\x00\x00\x00mp42isom'
+PATTERN = FTYP_BOX + random.Random(0).randbytes(1024 * 1024 - len(FTYP_BOX))
+
+# Bytes written per throttled write, as a share of the rate
+THROTTLE_SLICE = 0.05
+
+HLS_VARIANTS = {'low': 800000, 'high': 4000000}
+
+
+def media_bytes(offset, length):
+    """Return length bytes of the synthetic media body starting at offset"""
+    start = offset % len(PATTERN)
+    data = PATTERN[start:start + length]
+    while len(data) < length:
+        data += PATTERN[:length - len(data)]
+    return data
+
+
+def page(title, body):
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{title}</title></head>'
+            f'<body>{body}</body></html>')
+
+
+def spa_page(base_url, src, size_kb):
+    """A client-rendered page of about size_kb KB whose only video URL sits in its state"""
+    items = []
+    length = 0
+    i = 0
+    while length < size_kb * 1024:
+        item = (f'{{"id":{i},"title":"Item {i}","thumbnail":"{base_url}/img/{i}.jpg",'
+                f'"href":"/item/{i}","tags":["news","sports","clips"],"views":{i * 37}}}')
+        items.append(item)
+        length += len(item) + 1
+        i += 1
+    markup = ''.join(f'<div class="card"><a href="/item/{n}"><img src="/img/{n}.jpg"></a></div>'
+                     for n in range(200))
+    state = '{"feed":[' + ','.join(items) + f'],"player":{{"hls":false,"src":"{base_url}{src}"}}}}'
+    return page('Feed', f'<div id="root">{markup}</div>'
+                        f'<script>window.__INITIAL_STATE__ = {state};</script>'
+                        f'<script src="/static/bundle.js"></script>')
+
+
+def hls_master(query):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+    for name, bandwidth in HLS_VARIANTS.items():
+        lines += [f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth}', f'{name}/index.m3u8{query}']
+    return '\n'.join(lines) + '\n'
+
+
+def hls_media(segments, query):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:4', '#EXT-X-MEDIA-SEQUENCE:0']
+    for i in range(segments):
+        lines += ['#EXTINF:4.0,', f'{i}.ts{query}']
+    return '\n'.join(lines + ['#EXT-X-ENDLIST']) + '\n'
+
+
+class FakeMediaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        path = parts.path
+        params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+
+        latency = float(params.get('latency', 0)) / 1000
+        if latency:
+            time.sleep(latency)
+
+        if path.startswith('/pages/'):
+            return self.send_page(path[len('/pages/'):], params)
+        if path.startswith('/media/'):
+            return self.send_media(params, ranges=True)
+        if path.startswith('/norange/'):
+            return self.send_media(params, ranges=False)
+        if path.startswith('/hls/'):
+            return self.send_hls(path[len('/hls/'):], params, parts.query)
+        self.send_body(b'Not found', 'text/plain', status=404)
+
+    def send_page(self, name, params):
+        base_url = f"http://{self.headers.get('Host', '127.0.0.1')}"
+        src = params.get('src', '/media/clip.mp4')
+        quoted = src.replace('&', '&amp;').replace('"', '&quot;')
+
+        if name == 'video-tag':
+            html = page('Video', f'<h1>Clip</h1><video controls src="{quoted}"></video>')
+        elif name == 'source-tag':
+            html = page('Source', f'<source src="{quoted}" type="video/mp4">')
+        elif name == 'iframe':
+            html = page('Embed', '<iframe src="https://www.youtube.com/embed/dQw4w9WgXcQ" allowfullscreen></iframe>')
+        elif name == 'data-attribute':
+            html = page('Lazy', f'<div class="player" data-video="{quoted}"></div>')
+        elif name == 'spa':
+            html = spa_page(base_url, src, int(params.get('size_kb', 4096)))
+        else:
+            return self.send_body(b'Not found', 'text/plain', status=404)
+        self.send_body(html.encode('utf-8'), 'text/html; charset=utf-8')
+
+    def send_media(self, params, ranges):
+        size = int(params.get('size', DEFAULT_MEDIA_SIZE))
+        rate = float(params['rate']) if params.get('rate') else None
+        start, end = 0, size - 1
+
+        match = re.fullmatch(r'bytes=(\d*)-(\d*)', self.headers.get('Range', '')) if ranges else None
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(size - int(match.group(2)), 0)
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(end - start + 1))
+        if ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', f'"clip-{size}"')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.write_media(start, end - start + 1, rate)
+
+    def send_hls(self, name, params, query):
+        segments = int(params.get('segments', 20))
+        segment_size = int(params.get('segment_size', 1024 * 512))
+        query = f'?{query}' if query else ''
+
+        if name == 'master.m3u8':
+            return self.send_body(hls_master(query).encode(), 'application/vnd.apple.mpegurl')
+        variant, _, leaf = name.partition('/')
+        if variant not in HLS_VARIANTS:
+            return self.send_body(b'Not found', 'text/plain', status=404)
+        if leaf == 'index.m3u8':
+            return self.send_body(hls_media(segments, query).encode(), 'application/vnd.apple.mpegurl')
+        match = re.fullmatch(r'(\d+)\.ts', leaf)
+        if not match or int(match.group(1)) >= segments:
+            return self.send_body(b'Not found', 'text/plain', status=404)
+        index = int(match.group(1))
+        self.send_body(media_bytes(index * segment_size, segment_size), 'video/mp2t')
+
+    def send_body(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def write_media(self, offset, length, rate=None):
+        view = memoryview(PATTERN)
+        slice_size = max(int(rate * THROTTLE_SLICE), 1024) if rate else len(PATTERN)
+        start_time = time.monotonic()
+        written = 0
+        try:
+            while written < length:
+                start = (offset + written) % len(PATTERN)
+                count = min(length - written, len(PATTERN) - start, slice_size)
+                self.wfile.write(view[start:start + count])
+                written += count
+                if rate:
+                    # Sleep until the bytes sent so far are due at the requested rate
+                    delay = start_time + written / rate - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class FakeMediaHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # Clients hang up mid-body on purpose, e.g. after probing a URL
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def serve(host, port, ready=None):
+    server = FakeMediaHTTPServer((host, port), FakeMediaHandler)
+    if ready is not None:
+        ready.put(server.server_port)
+    server.serve_forever()
+
+
+class FakeMediaServer:
+    """
+    The fake media server in a child process.
+
+    Running it in its own process keeps its CPU time and memory out of the
+    measurements taken in the benchmark process.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.process = None
+
+    def start(self):
+        context = multiprocessing.get_context()
+        ready = context.Queue()
+        self.process = context.Process(target=serve, args=(self.host, self.port, ready), daemon=True)
+        self.process.start()
+        self.port = ready.get(timeout=30)
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+    def url(self, path, **params):
+        """Return the absolute URL of path with params as its query string"""
+        query = '&'.join(f'{key}={quote(str(value), safe="/")}' for key, value in params.items())
+        return f"http://{self.host}:{self.port}{path}" + (f'?{query}' if query else '')
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+    print(f"Serving on http://{args.host}:{args.port}/")
+    try:
+        serve(args.host, args.port)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,524 @@
+"""
+End-to-end benchmark of the download pipeline against a local fake media server.
+
+Runs check_url, extract_video_url and download_video of VideoDownloader,
+the yt-dlp path of SocialMediaDownloader and the Flask routes (through the
+test client, under concurrent load) against the synthetic pages and media
+of fake_media_server.py, which runs in its own process. Every scenario
+reports latency percentiles, throughput, CPU seconds per GB and the peak
+resident memory it added, and the whole run is written as JSON so two
+runs can be compared.
+
+The download cache and extraction cache are off unless --with-caches is
+given, so repeated calls measure the pipeline rather than cache hits.
+
+Usage:
+    python benchmarks/pipeline_benchmark.py [--output report.json] [--compare baseline.json]
+        [--only 'download/*'] [--quick] [--size-mb 64] [--iterations 50] [--concurrency 8]
+"""
+import os
+import gc
+import sys
+import json
+import time
+import shutil
+import fnmatch
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_media_server import FakeMediaServer
+
+REPORT_VERSION = 1
+
+# Metrics compared between reports, whether a higher value is better, and the
+# absolute difference below which a change is noise rather than a regression
+COMPARED_METRICS = (
+    ('latency_ms.p50', False, 0.5),
+    ('latency_ms.p95', False, 0.5),
+    ('ops_per_s', True, 0),
+    ('throughput_mb_s', True, 0),
+    ('cpu_s_per_gb', False, 0),
+    ('peak_rss_mb', False, 8),
+)
+
+
+class BenchmarkError(Exception):
+    """A call under test returned a failure instead of raising"""
+
+
+class RSSSampler:
+    """Samples this process's resident memory in the background and keeps the peak"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.baseline = self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss() or 0)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss() or 0)
+
+    @property
+    def added_mb(self):
+        """Peak resident memory above the level at the start, or None where it cannot be read"""
+        if self.baseline is None:
+            return None
+        return round((self.peak - self.baseline) / 1024 ** 2, 2)
+
+
+def current_rss():
+    """Resident memory in bytes, read from /proc; None on systems without it"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    index = max(int(round(pct / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def run_scenario(call, iterations, concurrency, warmup=1):
+    """
+    Run call(i) iterations times over concurrency threads and measure it.
+
+    Args:
+        call (callable): Takes the iteration number; returns the bytes it transferred
+            (or None) and raises on failure
+        iterations (int): Measured calls
+        concurrency (int): Calls in flight at once
+        warmup (int): Unmeasured calls made first, to open connections and fill pools
+
+    Returns:
+        dict: Latency percentiles, throughput, CPU time and memory of the run
+    """
+    for i in range(warmup):
+        call(-1 - i)
+
+    latencies = []
+    errors = []
+    transferred = [0]
+    lock = threading.Lock()
+
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            size = call(i) or 0
+        except Exception as e:
+            with lock:
+                errors.append(f"{type(e).__name__}: {e}")
+            return
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            transferred[0] += size
+
+    gc.collect()
+    with RSSSampler() as sampler:
+        cpu = time.process_time()
+        wall = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(timed, range(iterations)))
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+
+    latencies.sort()
+    size = transferred[0]
+    result = {
+        'iterations': iterations,
+        'concurrency': concurrency,
+        'errors': len(errors),
+        'wall_s': round(wall, 4),
+        'cpu_s': round(cpu, 4),
+        'ops_per_s': round(len(latencies) / wall, 2) if wall else None,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+            'p50': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+            'p95': round(percentile(latencies, 95) * 1000, 3) if latencies else None,
+            'p99': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+            'max': round(latencies[-1] * 1000, 3) if latencies else None,
+        },
+        'peak_rss_mb': sampler.added_mb,
+    }
+    if size:
+        result.update({
+            'bytes': size,
+            'throughput_mb_s': round(size / wall / 1024 ** 2, 2),
+            'cpu_s_per_gb': round(cpu / (size / 1024 ** 3), 3),
+        })
+    if errors:
+        result['first_error'] = errors[0]
+    return result
+
+
+class Pipeline:
+    """The code under test, wired to the fake server and a scratch download directory"""
+
+    def __init__(self, server, args):
+        self.server = server
+        self.args = args
+        self.download_dir = tempfile.mkdtemp(prefix='webvid-bench-')
+        self._clients = threading.local()
+        os.environ['DOWNLOADS_ROOT'] = self.download_dir
+
+        # Imported here: the app configures itself from the environment on import
+        import app
+        from platforms import Platform
+        from social_media_downloader import SocialMediaDownloader, YDL_PROFILES
+
+        self.app = app
+        self.video_downloader = app.video_downloader
+        if not args.with_caches:
+            self.video_downloader.cache = None
+            self.video_downloader.extraction_cache = None
+            app.social_media_downloader.extraction_cache = None
+
+        # A separate instance, so the Flask routes still treat the fake server as a generic site
+        self.social_downloader = SocialMediaDownloader()
+        self.social_downloader.platforms.register(Platform('bench', [server.host]))
+        self.social_downloader.ydl_pool.register_profile('download', dict(YDL_PROFILES['download'], noprogress=True))
+        if args.with_caches:
+            self.social_downloader.extraction_cache = app.extraction_cache
+
+    def close(self):
+        self.social_downloader.cleanup()
+        shutil.rmtree(self.download_dir, ignore_errors=True)
+
+    @property
+    def client(self):
+        # Flask test clients keep per-client state, so each load thread gets its own
+        client = getattr(self._clients, 'client', None)
+        if client is None:
+            client = self._clients.client = self.app.app.test_client()
+        return client
+
+    def media_url(self, path='/media/clip.mp4', **params):
+        params.setdefault('size', self.args.size_mb * 1024 * 1024)
+        return self.server.url(path, **params)
+
+    def page_url(self, name, src=None, **params):
+        return self.server.url(f'/pages/{name}', src=src or self.media_path(), **params)
+
+    def media_path(self):
+        return f'/media/clip.mp4?size={self.args.size_mb * 1024 * 1024}'
+
+    def fetch(self, url):
+        return self.video_downloader.session.get(url, timeout=30).text
+
+    def consume(self, result):
+        """Check a download result, delete the file and return its size"""
+        if not result.get('success'):
+            raise BenchmarkError(result.get('error', 'download failed'))
+        filepath = result['filepath']
+        size = os.path.getsize(filepath)
+        os.remove(filepath)
+        return size
+
+    def scenarios(self):
+        """Return (name, call, iterations, concurrency) for every scenario"""
+        args = self.args
+        scenarios = []
+
+        # Page scanning alone, on pages fetched once up front
+        for name, page in (('video_tag', 'video-tag'), ('source_tag', 'source-tag'), ('iframe', 'iframe'),
+                           ('data_attribute', 'data-attribute'), ('spa_4mb', 'spa')):
+            iterations = args.iterations if page == 'spa' else args.iterations * 4
+            scenarios.append((f'extract/{name}', self.extract_call(self.page_url(page)), iterations, 1))
+
+        # check_url over HTTP under concurrent load
+        for name, url in (('direct_mp4', self.media_url()),
+                          ('video_tag', self.page_url('video-tag')),
+                          ('spa_4mb', self.page_url('spa')),
+                          ('slow_origin', self.page_url('video-tag', latency=100)),
+                          ('hls', self.server.url('/hls/master.m3u8'))):
+            scenarios.append((f'check_url/{name}', self.check_call(url), args.iterations, args.concurrency))
+
+        # Whole downloads, one at a time so throughput is per download; the throttled
+        # server sends 2 MB/s per connection
+        segments = max(args.size_mb * 2, 4)
+        throttled_size = 1024 * 1024 * 4
+        for name, url_for in (
+            ('range', lambda i: self.media_url()),
+            ('norange', lambda i: self.media_url('/norange/clip.mp4')),
+            ('video_tag_page', lambda i: self.page_url('video-tag')),
+            ('throttled', lambda i: self.media_url(size=throttled_size, rate=1024 * 1024 * 2)),
+            ('hls', lambda i: self.server.url('/hls/master.m3u8', segments=segments, segment_size=512 * 1024)),
+        ):
+            scenarios.append((f'download/{name}', self.download_call(url_for), args.runs, 1))
+        # Concurrent downloads of one URL take turns on its partial file
+        scenarios.append(('download/concurrent_range', self.download_call(lambda i: self.media_url()),
+                          args.runs * 2, min(args.concurrency, 4)))
+
+        if self.social_downloader.has_yt_dlp:
+            size = min(args.size_mb, 16) * 1024 * 1024
+            scenarios.append(('social/extract_ytdlp', self.social_extract_call(self.media_url(size=size)),
+                              args.iterations, 1))
+            scenarios.append(('social/download_ytdlp', self.social_download_call(lambda i: self.media_url(size=size)),
+                              args.runs, 1))
+
+        # Flask routes, as a client of the app sees them
+        scenarios.append(('flask/check_url', self.flask_check_call(self.page_url('video-tag')),
+                          args.iterations * 2, args.concurrency))
+        scenarios.append(('flask/download', self.flask_download_call(lambda i: self.media_url()),
+                          args.runs * 2, min(args.concurrency, 4)))
+        scenarios.append(('flask/jobs', self.flask_job_call(lambda i: self.page_url('video-tag')),
+                          args.runs * 2, min(args.concurrency, 4)))
+        return scenarios
+
+    def extract_call(self, page_url):
+        content = self.fetch(page_url)
+        vd = self.video_downloader
+
+        def call(i):
+            if vd.extract_video_url(page_url, content) is None:
+                raise BenchmarkError('no video found')
+        return call
+
+    def check_call(self, url):
+        vd = self.video_downloader
+
+        def call(i):
+            result = vd.check_url(url)
+            if not result['valid']:
+                raise BenchmarkError(result['message'])
+        return call
+
+    def download_call(self, url_for):
+        vd = self.video_downloader
+
+        def call(i):
+            return self.consume(vd.download_video(url_for(i), self.download_dir))
+        return call
+
+    def social_extract_call(self, url):
+        def call(i):
+            if self.social_downloader.get_direct_video_url(url, 'bench') is None:
+                raise BenchmarkError('no direct URL')
+        return call
+
+    def social_download_call(self, url_for):
+        def call(i):
+            # yt-dlp names files after the video, so each run gets its own directory
+            download_path = os.path.join(self.download_dir, f'social-{i}')
+            try:
+                return self.consume(self.social_downloader.download_video(url_for(i), download_path))
+            finally:
+                shutil.rmtree(download_path, ignore_errors=True)
+        return call
+
+    def flask_check_call(self, url):
+        def call(i):
+            response = self.client.post('/check-url', json={'url': url})
+            if response.status_code != 200 or not response.get_json()['valid']:
+                raise BenchmarkError(f'/check-url answered {response.status_code}')
+        return call
+
+    def flask_download_call(self, url_for):
+        def call(i):
+            response = self.client.post('/download', data={'url': url_for(i), 'download_path': self.download_dir})
+            try:
+                if response.status_code != 200:
+                    raise BenchmarkError(f'/download answered {response.status_code}')
+                size = 0
+                for data in response.response:
+                    size += len(data)
+                return size
+            finally:
+                response.close()
+        return call
+
+    def flask_job_call(self, url_for):
+        def call(i):
+            response = self.client.post('/jobs', json={'url': url_for(i), 'download_path': self.download_dir})
+            if response.status_code != 202:
+                raise BenchmarkError(f'/jobs answered {response.status_code}')
+            job_id = response.get_json()['job_id']
+            deadline = time.monotonic() + self.args.timeout
+            while time.monotonic() < deadline:
+                status = self.client.get(f'/jobs/{job_id}').get_json()['status']
+                if status == 'completed':
+                    # A completed job must be servable straight away
+                    filepath = self.app.download_jobs.get_job(job_id).get('filepath')
+                    if not filepath:
+                        raise BenchmarkError(f'job {job_id} completed without a file')
+                    return self.consume({'success': True, 'filepath': filepath})
+                if status == 'error':
+                    raise BenchmarkError(f'job {job_id} failed')
+                time.sleep(0.02)
+            raise BenchmarkError(f'job {job_id} timed out')
+        return call
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def lookup(result, path):
+    value = result
+    for key in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def compare(baseline, report, max_regression=None):
+    """
+    Print each compared metric of both reports and the relative change.
+
+    Args:
+        baseline (dict): The earlier report
+        report (dict): This run's report
+        max_regression (float, optional): Percentage a metric may get worse by
+
+    Returns:
+        list: Descriptions of metrics that got worse by more than max_regression
+    """
+    regressions = []
+    print(f"\nCompared with {baseline['meta'].get('revision') or 'baseline'} "
+          f"from {baseline['meta'].get('timestamp', '?')}")
+    print(f"{'scenario':<28} {'metric':<16} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, result in report['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            continue
+        for metric, higher_is_better, noise in COMPARED_METRICS:
+            old, new = lookup(before, metric), lookup(result, metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = -change if higher_is_better else change
+            flag = ''
+            if max_regression is not None and worse > max_regression and abs(new - old) > noise:
+                flag = ' !'
+                regressions.append(f"{name} {metric}: {old} -> {new}")
+            print(f"{name:<28} {metric:<16} {old:>12} {new:>12} {change:>+8.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--compare', help='a previous JSON report to compare against')
+    parser.add_argument('--max-regression', type=float,
+                        help='with --compare, exit with status 1 if a metric gets worse by more than this percentage')
+    parser.add_argument('--only', action='append', help='run scenarios matching this pattern, e.g. "download/*"')
+    parser.add_argument('--list', action='store_true', help='list the scenarios and exit')
+    parser.add_argument('--quick', action='store_true', help='small files and few iterations, for a smoke test')
+    parser.add_argument('--size-mb', type=int, default=64, help='media file size in MB')
+    parser.add_argument('--iterations', type=int, default=50, help='calls per latency scenario')
+    parser.add_argument('--runs', type=int, default=3, help='downloads per download scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='calls in flight for load scenarios')
+    parser.add_argument('--timeout', type=float, default=120, help='seconds to wait for a queued job')
+    parser.add_argument('--with-caches', action='store_true', help='keep the download and extraction caches on')
+    parser.add_argument('--verbose', action='store_true', help='show the application log')
+    args = parser.parse_args()
+    if args.quick:
+        args.size_mb, args.iterations, args.runs = 8, 10, 1
+
+    if not args.with_caches:
+        os.environ['DOWNLOAD_CACHE_MAX_BYTES'] = '0'
+    # Progress bars would dominate the output
+    os.environ.setdefault('TQDM_DISABLE', '1')
+
+    server = FakeMediaServer().start()
+    pipeline = None
+    try:
+        pipeline = Pipeline(server, args)
+        if not args.verbose:
+            logging.disable(logging.WARNING)
+
+        scenarios = [scenario for scenario in pipeline.scenarios()
+                     if not args.only or any(fnmatch.fnmatch(scenario[0], pattern) for pattern in args.only)]
+        if args.list:
+            for name, _, iterations, concurrency in scenarios:
+                print(f"{name:<28} {iterations:>4} calls, {concurrency} at a time")
+            return
+
+        report = {
+            'version': REPORT_VERSION,
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'revision': git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+            },
+            'config': {
+                'size_mb': args.size_mb,
+                'iterations': args.iterations,
+                'runs': args.runs,
+                'concurrency': args.concurrency,
+                'with_caches': args.with_caches,
+            },
+            'scenarios': {},
+        }
+
+        print(f"{'scenario':<28} {'p50 ms':>9} {'p95 ms':>9} {'ops/s':>8} {'MB/s':>8} {'CPU s/GB':>9} {'+RSS MB':>8}")
+        for name, call, iterations, concurrency in scenarios:
+            try:
+                result = run_scenario(call, iterations, concurrency)
+            except Exception as e:
+                # A scenario that cannot even warm up is reported rather than ending the run
+                result = {'iterations': iterations, 'concurrency': concurrency, 'errors': iterations,
+                          'first_error': f"{type(e).__name__}: {e}"}
+            report['scenarios'][name] = result
+
+            def column(path, width):
+                value = lookup(result, path)
+                return f"{value:>{width}}" if value is not None else f"{'-':>{width}}"
+            print(f"{name:<28} {column('latency_ms.p50', 9)} {column('latency_ms.p95', 9)} "
+                  f"{column('ops_per_s', 8)} {column('throughput_mb_s', 8)} {column('cpu_s_per_gb', 9)} "
+                  f"{column('peak_rss_mb', 8)}")
+            if result['errors']:
+                print(f"    {result['errors']} failed: {result['first_error']}")
+    finally:
+        if pipeline is not None:
+            pipeline.close()
+        server.stop()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.max_regression)
+        if regressions:
+            print(f"\n{len(regressions)} metrics regressed by more than {args.max_regression}%")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
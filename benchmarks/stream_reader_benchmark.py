@@ -0,0 +1,131 @@
+"""
+Client CPU cost of the old fixed 8 KB download loop versus AdaptiveReader.
+
+Serves a large body over loopback and reads it twice: with
+iter_content(8192) and per-chunk write, progress bar and progress math,
+as _download_file_with_progress used to, and with AdaptiveReader and
+progress on a timer. Reports throughput and the CPU time of the reading
+thread only, so the server's own cost is left out.
+
+Usage:
+    python benchmarks/stream_reader_benchmark.py [--size-mb 1024] [--runs 3] [--output /dev/null]
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+from tqdm import tqdm
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stream_reader import AdaptiveReader
+
+BLOCK = os.urandom(1024 * 1024 * 16)
+
+
+def start_server(size):
+    """Serve size bytes at every path; returns the server"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'video/mp4')
+            self.send_header('Content-Length', str(size))
+            self.end_headers()
+            view = memoryview(BLOCK)
+            remaining = size
+            while remaining:
+                chunk = view[:min(remaining, len(BLOCK))]
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def fixed_loop(response, file, total_size, bar_file):
+    """The per-chunk loop the downloader used before"""
+    downloaded = 0
+    last_update_time = start_time = time.time()
+    with tqdm(total=total_size, unit='B', unit_scale=True, file=bar_file) as bar:
+        for data in response.iter_content(1024 * 8):
+            if data:
+                file.write(data)
+                downloaded += len(data)
+                bar.update(len(data))
+                # Progress and speed were computed for the UI; only their cost matters here
+                _ = (downloaded / total_size * 100) if total_size > 0 else 0
+                current_time = time.time()
+                if current_time - last_update_time >= 0.2:
+                    _ = downloaded / (current_time - start_time)
+                    last_update_time = current_time
+    return downloaded
+
+
+def adaptive_loop(response, file, total_size, bar_file):
+    """The current loop: adaptive chunks, progress on a timer"""
+    downloaded = reported = 0
+    next_update_time = time.time() + 0.2
+    with tqdm(total=total_size, unit='B', unit_scale=True, file=bar_file) as bar:
+        for data in AdaptiveReader(response):
+            file.write(data)
+            downloaded += len(data)
+            current_time = time.time()
+            if current_time < next_update_time:
+                continue
+            bar.update(downloaded - reported)
+            reported = downloaded
+            _ = (downloaded / total_size * 100) if total_size > 0 else 0
+            next_update_time = current_time + 0.2
+        bar.update(downloaded - reported)
+    return downloaded
+
+
+def run(session, url, output, loop, bar_file):
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    with session.get(url, stream=True) as response, open(output, 'wb') as file:
+        size = loop(response, file, int(response.headers['Content-Length']), bar_file)
+    cpu = time.thread_time() - cpu
+    wall = time.perf_counter() - wall
+    return size, wall, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=1024, help='body size in MB')
+    parser.add_argument('--runs', type=int, default=3, help='runs per variant')
+    parser.add_argument('--output', default=os.devnull, help='file the body is written to')
+    args = parser.parse_args()
+
+    server = start_server(args.size_mb * 1024 * 1024)
+    url = f"http://127.0.0.1:{server.server_port}/video.mp4"
+    session = requests.Session()
+    print(f"{args.size_mb} MB over {url}, written to {args.output}")
+    try:
+        # The progress bars draw to devnull so only their bookkeeping is measured
+        with open(os.devnull, 'w') as bar_file:
+            for label, loop in (('fixed 8 KB', fixed_loop), ('adaptive', adaptive_loop)):
+                for _ in range(args.runs):
+                    size, wall, cpu = run(session, url, args.output, loop, bar_file)
+                    print(f"{label:<12} {size * 8 / wall / 1e9:6.2f} Gbit/s   "
+                          f"reader CPU {cpu:6.3f} s ({cpu / wall * 100:5.1f}% of one core)")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Per-call overhead of a fresh YoutubeDL instance versus a pooled one.
+
+Serves a small video from a local HTTP server and runs the same extraction
+(and optionally download) repeatedly, first building a new YoutubeDL for
+every call as the downloader used to, then through YoutubeDLPool.
+
+Usage:
+    python benchmarks/ydl_pool_benchmark.py [--calls 50] [--size 262144] [--download]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yt_dlp import YoutubeDL
+from ydl_pool import YoutubeDLPool
+from social_media_downloader import YDL_PROFILES
+
+
+def start_server(body):
+    """Serve body as video/mp4 at every path; returns the server"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_HEAD(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'video/mp4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+
+        def do_GET(self):
+            self.do_HEAD()
+            self.wfile.write(body)
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+
+        def handle_error(self, request, client_address):
+            # Clients hang up mid-body (the generic extractor only sniffs the
+            # file) and close idle keep-alive connections; neither is an error here
+            if not isinstance(sys.exc_info()[1], ConnectionError):
+                super().handle_error(request, client_address)
+
+    server = Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def time_calls(calls, run):
+    timings = []
+    for i in range(calls):
+        start = time.perf_counter()
+        run(i)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label, timings):
+    print(f"{label:<22} mean {statistics.mean(timings):7.2f} ms   "
+          f"median {statistics.median(timings):7.2f} ms   p95 {sorted(timings)[int(len(timings) * 0.95)]:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=50, help='calls per variant')
+    parser.add_argument('--size', type=int, default=256 * 1024, help='video size in bytes')
+    parser.add_argument('--download', action='store_true', help='also benchmark full downloads')
+    args = parser.parse_args()
+
+    server = start_server(os.urandom(args.size))
+    url = f"http://127.0.0.1:{server.server_port}/video.mp4"
+    out_dir = tempfile.mkdtemp()
+    # Same options as the app, minus the console progress bar
+    profiles = {name: dict(options, noprogress=True) for name, options in YDL_PROFILES.items()}
+    pool = YoutubeDLPool(profiles)
+
+    def fresh_extract(i):
+        with YoutubeDL(dict(profiles['extract'])) as ydl:
+            ydl.extract_info(url, download=False)
+
+    def pooled_extract(i):
+        with pool.checkout('extract') as ydl:
+            ydl.extract_info(url, download=False)
+
+    def fresh_download(i):
+        options = dict(profiles['download'], outtmpl=os.path.join(out_dir, f"fresh_{i}.%(ext)s"))
+        with YoutubeDL(options) as ydl:
+            ydl.extract_info(url, download=True)
+
+    def pooled_download(i):
+        with pool.checkout('download', progress_hook=lambda d: None,
+                           outtmpl=os.path.join(out_dir, f"pooled_{i}.%(ext)s")) as ydl:
+            ydl.extract_info(url, download=True)
+
+    try:
+        # Warm up imports and the pool so neither variant pays one-off costs
+        fresh_extract(-1)
+        pooled_extract(-1)
+
+        print(f"{args.calls} calls against {url} ({args.size} bytes)")
+        report('extract, fresh', time_calls(args.calls, fresh_extract))
+        report('extract, pooled', time_calls(args.calls, pooled_extract))
+        if args.download:
+            report('download, fresh', time_calls(args.calls, fresh_download))
+            report('download, pooled', time_calls(args.calls, pooled_download))
+        print(f"pool: {pool.stats()}")
+    finally:
+        pool.close()
+        server.shutdown()
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+
+
+# Query parameters that only track where a link was shared from
+TRACKING_PARAMS = {'fbclid', 'gclid', 'igshid', 'si', 'feature', 'ref_src'}
+
+
+def normalize_url(url):
+    """
+    Reduce a URL to a canonical form for cache lookups.
+
+    Lowercases the scheme and host, drops default ports, fragments and
+    tracking parameters, sorts the query string and maps youtu.be short
+    links to their youtube.com form.
+
+    Args:
+        url (str): The URL to normalize
+
+    Returns:
+        str: The normalized URL
+    """
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    port = parsed.port
+    if port and not ((scheme == 'http' and port == 80) or (scheme == 'https' and port == 443)):
+        host = f"{host}:{port}"
+
+    path = parsed.path or '/'
+    query = [
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith('utm_')
+    ]
+
+    if host == 'youtu.be' and path.strip('/'):
+        query.append(('v', path.strip('/')))
+        host, path = 'youtube.com', '/watch'
+
+    if len(path) > 1:
+        path = path.rstrip('/')
+
+    return urlunparse((scheme, host, path, '', urlencode(sorted(query)), ''))
+
+
+class DownloadCache:
+    """
+    A content-addressed store of downloaded videos.
+
+    Files are stored once under their SHA-256 digest and looked up by
+    normalized URL; a page URL and the media URL it resolved to can both
+    point at the same file, as can different URLs that served identical
+    bytes. When the store grows past its size limit the least recently
+    used files are evicted.
+
+    The index is an SQLite file in the cache directory, so worker processes
+    sharing the directory see each other's files and enforce one size limit.
+    """
+
+    def __init__(self, cache_dir='downloads/.cache', max_size=10 * 1024 ** 3):
+        """
+        Args:
+            cache_dir (str): Directory holding the cached files and their index
+            max_size (int): Total size in bytes the cache may occupy
+        """
+        self.logger = logging.getLogger(__name__)
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.objects_dir = os.path.join(self.cache_dir, 'objects')
+        self.index_path = os.path.join(self.cache_dir, 'index.db')
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._db = sqlite3.connect(self.index_path, timeout=30, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        with self._transaction():
+            # Content digest -> stored file metadata
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS objects (digest TEXT PRIMARY KEY, size INTEGER NOT NULL, '
+                'ext TEXT NOT NULL, filename TEXT NOT NULL, info TEXT NOT NULL, last_access REAL NOT NULL)'
+            )
+            # Normalized URL -> content digest
+            self._db.execute('CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, digest TEXT NOT NULL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS urls_digest ON urls (digest)')
+
+    def lookup(self, url, count=True):
+        """
+        Find a cached download for a URL.
+
+        Args:
+            url (str): A page or media URL
+            count (bool): Count the hit or miss; secondary lookups of the same
+                download (e.g. by resolved media URL) pass False
+
+        Returns:
+            dict or None: Download information in the same shape the downloaders
+            return, or None on a cache miss
+        """
+        key = normalize_url(url)
+        with self._lock, self._transaction():
+            row = self._db.execute(
+                'SELECT objects.digest, size, ext, filename, info FROM urls '
+                'JOIN objects ON objects.digest = urls.digest WHERE url = ?',
+                (key,)
+            ).fetchone()
+            entry = self._entry(row) if row is not None else None
+
+            if entry is None or not os.path.exists(self._object_path(row[0], entry)):
+                if entry is not None:
+                    # The file was removed behind our back
+                    self._forget(row[0])
+                if count:
+                    self.misses += 1
+                return None
+
+            if count:
+                self.hits += 1
+            self._db.execute('UPDATE objects SET last_access = ? WHERE digest = ?', (time.time(), row[0]))
+            self.logger.info(f"Cache hit for {url}")
+            return self._download_info(row[0], entry, url)
+
+    def store(self, url, filepath, aliases=None, info=None):
+        """
+        Move a downloaded file into the cache.
+
+        Args:
+            url (str): The URL the file was downloaded for
+            filepath (str): The downloaded file; it is moved into the cache
+            aliases (list, optional): Other URLs that resolve to the same file,
+                such as the direct media URL
+            info (dict, optional): Extra download metadata (title, uploader, ...) to keep
+
+        Returns:
+            dict: Download information pointing at the cached file
+        """
+        digest = self._hash_file(filepath)
+        ext = os.path.splitext(filepath)[1].lower()
+
+        with self._lock, self._transaction():
+            row = self._db.execute(
+                'SELECT digest, size, ext, filename, info FROM objects WHERE digest = ?', (digest,)
+            ).fetchone()
+            entry = self._entry(row) if row is not None else None
+            if entry is not None and os.path.exists(self._object_path(digest, entry)):
+                # Same bytes already stored under another URL
+                os.remove(filepath)
+            else:
+                entry = {
+                    'size': os.path.getsize(filepath),
+                    'ext': ext,
+                    'filename': os.path.basename(filepath),
+                    'info': {
+                        key: value for key, value in (info or {}).items()
+                        if key in ('title', 'channel', 'uploader', 'video_url')
+                    },
+                }
+                object_path = self._object_path(digest, entry)
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                shutil.move(filepath, object_path)
+                self._db.execute(
+                    'INSERT OR REPLACE INTO objects (digest, size, ext, filename, info, last_access) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (digest, entry['size'], entry['ext'], entry['filename'], json.dumps(entry['info']), time.time())
+                )
+
+            self._db.execute('UPDATE objects SET last_access = ? WHERE digest = ?', (time.time(), digest))
+            self._db.executemany(
+                'INSERT OR REPLACE INTO urls (url, digest) VALUES (?, ?)',
+                [(normalize_url(key), digest) for key in [url] + [alias for alias in (aliases or []) if alias]]
+            )
+
+            self._evict(keep=digest)
+            return self._download_info(digest, entry, url)
+
+    def alias(self, url, digest):
+        """Point another URL at a file that is already cached"""
+        with self._lock, self._transaction():
+            if self._db.execute('SELECT 1 FROM objects WHERE digest = ?', (digest,)).fetchone():
+                self._db.execute('INSERT OR REPLACE INTO urls (url, digest) VALUES (?, ?)', (normalize_url(url), digest))
+
+    def stats(self):
+        """Return hit/miss counters and the current size of the cache"""
+        with self._lock:
+            entries, size = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects').fetchone()
+            urls = self._db.execute('SELECT COUNT(*) FROM urls').fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0,
+                'entries': entries,
+                'urls': urls,
+                'size': size,
+                'max_size': self.max_size,
+            }
+
+    @contextmanager
+    def _transaction(self):
+        """Hold the index's write lock, shared with other processes, until the block ends"""
+        # Caller must hold self._lock, except during __init__
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self._db.rollback()
+            raise
+        self._db.commit()
+
+    def _entry(self, row):
+        _, size, ext, filename, info = row
+        return {'size': size, 'ext': ext, 'filename': filename, 'info': json.loads(info)}
+
+    def _download_info(self, digest, entry, url):
+        info = dict(entry.get('info', {}))
+        info.update({
+            'success': True,
+            'filepath': self._object_path(digest, entry),
+            'original_url': url,
+            'file_size': entry['size'],
+            'download_name': entry['filename'],
+            'sha256': digest,
+            'cached': True,
+        })
+        return info
+
+    def _object_path(self, digest, entry):
+        return os.path.join(self.objects_dir, digest[:2], digest + entry['ext'])
+
+    def _hash_file(self, filepath):
+        sha256 = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(block)
+        return sha256.hexdigest()
+
+    def _evict(self, keep=None):
+        """Remove least recently used files until the cache fits its size limit"""
+        # Caller must be in a transaction; the file being stored (keep) is never evicted
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM objects').fetchone()[0]
+        if total <= self.max_size:
+            return
+        rows = self._db.execute('SELECT digest, size, ext, filename, info FROM objects ORDER BY last_access').fetchall()
+        for row in rows:
+            if total <= self.max_size:
+                break
+            digest, entry = row[0], self._entry(row)
+            if digest == keep:
+                continue
+            self.logger.info(f"Evicting {entry['filename']} ({entry['size']} bytes) from the download cache")
+            total -= entry['size']
+            try:
+                os.remove(self._object_path(digest, entry))
+            except OSError:
+                pass
+            self._forget(digest)
+
+    def _forget(self, digest):
+        # Caller must be in a transaction
+        self._db.execute('DELETE FROM objects WHERE digest = ?', (digest,))
+        self._db.execute('DELETE FROM urls WHERE digest = ?', (digest,))
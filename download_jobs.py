@@ -0,0 +1,187 @@
+import re
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+
+
+class DownloadJobRegistry:
+    """
+    A thread-safe registry of download jobs keyed by job ID.
+
+    Each job holds the same progress fields the UI has always polled
+    (status, progress, file_size, downloaded, speed, filename, platform).
+    Finished jobs are kept for a while so clients can read their final
+    state, then evicted once they expire or the registry is full.
+
+    Every change bumps the job's version, and wait_for_update() lets a
+    reader block until a job changes instead of polling it.
+    """
+
+    # Job states after which no further progress updates are expected
+    FINISHED_STATUSES = ('completed', 'error')
+
+    # Client-supplied job IDs must be short and URL-safe
+    JOB_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+    def __init__(self, max_jobs=500, finished_ttl=3600):
+        self.logger = logging.getLogger(__name__)
+        # Maximum number of jobs retained before finished jobs are evicted
+        self.max_jobs = max_jobs
+        # Seconds a finished job stays readable after its last update
+        self.finished_ttl = finished_ttl
+        # Jobs in creation order, oldest first
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        # Notified whenever a job is created, changed or removed
+        self._changed = threading.Condition(self._lock)
+        # Last version handed out; versions increase across all jobs so a
+        # replaced job never reuses an old number
+        self._version = 0
+
+    def is_valid_job_id(self, job_id):
+        """Check whether a client-supplied job ID is acceptable"""
+        return bool(job_id) and bool(self.JOB_ID_PATTERN.match(job_id))
+
+    def create_job(self, job_id=None, **fields):
+        """
+        Register a new job.
+
+        Args:
+            job_id (str, optional): The ID to use; a random one is generated if omitted
+            **fields: Initial values for the job's progress fields
+
+        Returns:
+            dict or None: A snapshot of the new job, or None if a job with the given
+            ID is already registered; the existing job is left untouched
+        """
+        if not job_id:
+            job_id = uuid.uuid4().hex
+
+        now = time.time()
+        job = {
+            'job_id': job_id,
+            'status': 'idle',  # idle, queued, checking, downloading, processing, retrying, completed, error
+            'progress': 0,     # 0-100
+            'file_size': 0,    # total file size in bytes
+            'downloaded': 0,   # bytes downloaded so far
+            'speed': 0,        # download speed in bytes/sec
+            'filename': '',    # name of the file being downloaded
+            'platform': '',    # source platform
+            'created_at': now,
+            'updated_at': now,
+        }
+        job.update(fields)
+
+        with self._lock:
+            if job_id in self._jobs:
+                return None
+            self._version += 1
+            job['version'] = self._version
+            self._jobs[job_id] = job
+            self._evict(now)
+            self._changed.notify_all()
+            return dict(job)
+
+    def update_job(self, job_id, **fields):
+        """
+        Update the progress fields of a job.
+
+        Args:
+            job_id (str): The job to update
+            **fields: Field values to set; None values are ignored
+
+        Returns:
+            dict or None: A snapshot of the updated job, or None if the job is unknown
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+
+            changed = False
+            for key, value in fields.items():
+                if value is not None and job.get(key) != value:
+                    job[key] = value
+                    changed = True
+            job['updated_at'] = time.time()
+
+            if changed:
+                self._version += 1
+                job['version'] = self._version
+                self._changed.notify_all()
+            return dict(job)
+
+    def get_job(self, job_id):
+        """Return a snapshot of a job, or None if it is unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def wait_for_update(self, job_id, version, timeout=None):
+        """
+        Block until a job changes past a known version.
+
+        Args:
+            job_id (str): The job to watch; it does not need to exist yet
+            version (int): The last version the caller has seen
+            timeout (float, optional): Maximum seconds to wait
+
+        Returns:
+            dict or None: A snapshot of the job, which on timeout may still be at
+            the given version, or None if the job is unknown
+        """
+        with self._changed:
+            self._changed.wait_for(
+                lambda: job_id in self._jobs and self._jobs[job_id]['version'] > version,
+                timeout
+            )
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def latest_job(self):
+        """Return a snapshot of the most recently created job, or None"""
+        with self._lock:
+            if not self._jobs:
+                return None
+            return dict(next(reversed(self._jobs.values())))
+
+    def remove_job(self, job_id):
+        """Forget a job; returns True if it existed"""
+        with self._lock:
+            removed = self._jobs.pop(job_id, None) is not None
+            self._changed.notify_all()
+            return removed
+
+    def capacity(self):
+        """Return how many more unfinished jobs fit before the registry exceeds max_jobs"""
+        with self._lock:
+            active = sum(job['status'] not in self.FINISHED_STATUSES for job in self._jobs.values())
+            return max(self.max_jobs - active, 0)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def _evict(self, now):
+        """Drop expired finished jobs, then the oldest finished jobs while over capacity"""
+        # Caller must hold self._lock
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job['status'] in self.FINISHED_STATUSES
+            and now - job['updated_at'] > self.finished_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+        if len(self._jobs) <= self.max_jobs:
+            return
+
+        for job_id in [j for j, job in self._jobs.items() if job['status'] in self.FINISHED_STATUSES]:
+            del self._jobs[job_id]
+            if len(self._jobs) <= self.max_jobs:
+                return
+
+        # Active jobs are never evicted; the registry is allowed to grow past its limit
+        self.logger.warning(f"Download job registry holds {len(self._jobs)} active jobs (limit {self.max_jobs})")
@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Without fcntl (Windows) journals are only locked within the process
+    fcntl = None
+
+
+# Lock path to [lock, holders and waiters]; an entry lives while anyone uses it
+_key_locks = {}
+_key_locks_lock = threading.Lock()
+
+
+class DownloadJournal:
+    """
+    On-disk record of a partially downloaded file.
+
+    The bytes live in a ``.part`` file and a small JSON journal next to it
+    records the source URL, the validators the server sent (ETag and
+    Last-Modified) and which byte ranges have been written. Both are keyed
+    by a hash of the URL, so a retry or a restarted process finds them again
+    and only requests the missing ranges.
+
+    A journal holds a lock on its URL from open() until close(), within the
+    process and (where fcntl exists) across processes, so a second download
+    of the same URL into the same directory waits for the first instead of
+    writing to the same part file.
+    """
+
+    def __init__(self, directory, url):
+        self.logger = logging.getLogger(__name__)
+        self.directory = directory
+        self.url = url
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+        self.journal_path = os.path.join(directory, f"{key}.json")
+        self.part_path = os.path.join(directory, f"{key}.part")
+        self.lock_path = os.path.join(directory, f"{key}.lock")
+        self.total_size = 0
+        self.etag = None
+        self.last_modified = None
+        # Sorted, non-overlapping [start, end) ranges already written to the part file
+        self.ranges = []
+        self._key_lock = None
+        self._lock_file = None
+
+    @classmethod
+    def open(cls, directory, url):
+        """
+        Lock the journal for a URL and load it, or start an empty one.
+
+        Blocks while another download of the URL holds the journal. The
+        caller must close() it when done, or use it as a context manager.
+
+        Args:
+            directory (str): Directory holding partial downloads
+            url (str): The URL being downloaded
+
+        Returns:
+            DownloadJournal: The journal; empty if nothing usable was found on disk
+        """
+        os.makedirs(directory, exist_ok=True)
+        journal = cls(directory, url)
+        journal._acquire()
+
+        if not os.path.exists(journal.journal_path) or not os.path.exists(journal.part_path):
+            return journal
+
+        try:
+            with open(journal.journal_path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            journal.logger.warning(f"Ignoring unreadable download journal {journal.journal_path}: {str(e)}")
+            return journal
+
+        if data.get('url') != url:
+            return journal
+
+        journal.total_size = data.get('total_size', 0)
+        journal.etag = data.get('etag')
+        journal.last_modified = data.get('last_modified')
+        journal.set_ranges(data.get('ranges', []))
+
+        # Never trust ranges beyond what actually made it into the part file
+        part_size = os.path.getsize(journal.part_path)
+        journal.set_ranges([(start, min(end, part_size)) for start, end in journal.ranges if start < part_size])
+        if journal.ranges:
+            journal.logger.info(f"Found partial download of {url}: {journal.completed_bytes()} bytes already on disk")
+        return journal
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _acquire(self):
+        key = os.path.abspath(self.lock_path)
+        with _key_locks_lock:
+            entry = _key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        entry[0].acquire()
+        self._key_lock = (key, entry)
+
+        if fcntl is None:
+            return
+        while True:
+            lock_file = open(self.lock_path, 'a')
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            # The previous holder removes the file as it lets go; retry on the one there now
+            try:
+                if os.path.samestat(os.fstat(lock_file.fileno()), os.stat(self.lock_path)):
+                    break
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+        self._lock_file = lock_file
+
+    def close(self):
+        """Release the journal's lock so the next download of the URL can go ahead"""
+        if self._lock_file is not None:
+            try:
+                os.remove(self.lock_path)
+            except OSError:
+                pass
+            # Closing the file drops the flock
+            self._lock_file.close()
+            self._lock_file = None
+        if self._key_lock is not None:
+            key, entry = self._key_lock
+            self._key_lock = None
+            with _key_locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del _key_locks[key]
+            entry[0].release()
+
+    def matches(self, total_size, etag, last_modified):
+        """Check whether the server still describes the same file as the journal"""
+        if not self.ranges:
+            return False
+        if total_size and self.total_size and total_size != self.total_size:
+            return False
+        if self.etag and etag:
+            return self.etag == etag
+        if self.last_modified and last_modified:
+            return self.last_modified == last_modified
+        # Without validators there is no way to tell whether the file changed
+        return False
+
+    def reset(self, total_size=0, etag=None, last_modified=None):
+        """Throw away any partial data and start recording a fresh download"""
+        self.total_size = total_size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.ranges = []
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
+
+    def if_range_value(self):
+        """Return the validator to send in an If-Range header, or None"""
+        # If-Range only accepts strong ETags
+        if self.etag and not self.etag.startswith('W/'):
+            return self.etag
+        return self.last_modified
+
+    def set_ranges(self, ranges):
+        """Replace the completed ranges, merging overlapping and adjacent ones"""
+        merged = []
+        for start, end in sorted((int(s), int(e)) for s, e in ranges if int(e) > int(s)):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.ranges = [(start, end) for start, end in merged]
+
+    def add_range(self, start, end):
+        """Record that bytes [start, end) have been written"""
+        self.set_ranges(self.ranges + [(start, end)])
+
+    def completed_bytes(self):
+        return sum(end - start for start, end in self.ranges)
+
+    def contiguous_prefix(self):
+        """Return how many bytes from the start of the file are complete"""
+        if self.ranges and self.ranges[0][0] == 0:
+            return self.ranges[0][1]
+        return 0
+
+    def missing_ranges(self, total_size):
+        """Return the [start, end) ranges of a file of total_size still to be downloaded"""
+        missing = []
+        position = 0
+        for start, end in self.ranges:
+            if start > position:
+                missing.append((position, min(start, total_size)))
+            position = max(position, end)
+        if position < total_size:
+            missing.append((position, total_size))
+        return [(start, end) for start, end in missing if end > start]
+
+    def save(self):
+        """Write the journal atomically"""
+        data = {
+            'url': self.url,
+            'total_size': self.total_size,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'ranges': self.ranges,
+            'updated_at': time.time(),
+        }
+        temp_path = self.journal_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.journal_path)
+
+    def complete(self, filepath):
+        """Move the finished part file to its final path and drop the journal"""
+        os.replace(self.part_path, filepath)
+        self.discard()
+
+    def discard(self):
+        """Remove the journal and any leftover part file"""
+        for path in (self.journal_path, self.part_path):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,207 @@
+import json
+import time
+import calendar
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+from download_cache import normalize_url
+
+
+# Query parameters that carry an absolute expiry time (Unix seconds) in signed URLs
+EXPIRY_PARAMS = ('expire', 'expires', 'exp', 'e')
+
+
+def signed_url_expiry(url):
+    """
+    Work out when a signed media URL stops being valid.
+
+    Understands absolute expiry parameters (``expire=``, ``Expires=``, ...),
+    YouTube-style ``/expire/<ts>/`` path segments and AWS SigV4
+    ``X-Amz-Date`` + ``X-Amz-Expires`` pairs.
+
+    Args:
+        url (str): The media URL
+
+    Returns:
+        float or None: Expiry as a Unix timestamp, or None if the URL carries none
+    """
+    if not url:
+        return None
+
+    parsed = urlparse(url)
+    params = {key.lower(): values[0] for key, values in parse_qs(parsed.query).items() if values}
+
+    for name in EXPIRY_PARAMS:
+        value = params.get(name)
+        if value and value.isdigit() and len(value) >= 9:
+            return float(value)
+
+    segments = parsed.path.split('/')
+    for i, segment in enumerate(segments[:-1]):
+        if segment == 'expire' and segments[i + 1].isdigit():
+            return float(segments[i + 1])
+
+    if 'x-amz-date' in params and params.get('x-amz-expires', '').isdigit():
+        try:
+            signed_at = calendar.timegm(time.strptime(params['x-amz-date'], '%Y%m%dT%H%M%SZ'))
+            return signed_at + int(params['x-amz-expires'])
+        except ValueError:
+            return None
+
+    return None
+
+
+class ExtractionCache:
+    """
+    A TTL cache of URL extraction results.
+
+    Keeps what was learned about a URL (the direct media URL, yt-dlp's info
+    dict, the result of a page check) so that checking a URL and then
+    downloading it does not fetch and parse the page twice. Entries expire
+    after a default TTL, or earlier if the media URL they hold is signed
+    with an expiry. An optional SQLite file lets entries survive restarts
+    and be shared between worker processes.
+    """
+
+    def __init__(self, default_ttl=600, max_entries=256, db_path=None, expiry_margin=60):
+        """
+        Args:
+            default_ttl (int): Seconds an entry is kept when its URL carries no expiry
+            max_entries (int): Maximum entries held in memory
+            db_path (str, optional): SQLite file used as a shared second tier
+            expiry_margin (int): Seconds before a signed URL's expiry that its entry is dropped
+        """
+        self.logger = logging.getLogger(__name__)
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.expiry_margin = expiry_margin
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> (expires_at, value), least recently used first
+        self._entries = OrderedDict()
+        self._db = None
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS extraction_cache '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            self._db.commit()
+
+    def get(self, kind, url):
+        """
+        Look up a cached extraction result.
+
+        Args:
+            kind (str): What was extracted, e.g. 'video_url' or 'ytdlp_info'
+            url (str): The URL it was extracted from
+
+        Returns:
+            The cached value, or None if missing or expired
+        """
+        key = self._key(kind, url)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(key, None)
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        'SELECT value, expires_at FROM extraction_cache WHERE key = ? AND expires_at > ?',
+                        (key, now)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    # The shared tier is only a cache; a locked or broken database is a miss
+                    self.logger.warning(f"Extraction cache database read failed: {str(e)}")
+                    row = None
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._remember(key, row[1], value)
+                    self.hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def set(self, kind, url, value, media_url=None, ttl=None):
+        """
+        Cache an extraction result.
+
+        Args:
+            kind (str): What was extracted
+            url (str): The URL it was extracted from
+            value: A JSON-serializable result
+            media_url (str, optional): Signed media URL inside the result; its expiry caps the TTL
+            ttl (int, optional): Seconds to keep the entry; defaults to default_ttl
+        """
+        expires_at = time.time() + (ttl if ttl is not None else self.default_ttl)
+        url_expiry = signed_url_expiry(media_url)
+        if url_expiry is not None:
+            expires_at = min(expires_at, url_expiry - self.expiry_margin)
+        if expires_at <= time.time():
+            return
+
+        key = self._key(kind, url)
+        with self._lock:
+            self._remember(key, expires_at, value)
+            if self._db is not None:
+                self._write(
+                    ('INSERT OR REPLACE INTO extraction_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                     (key, json.dumps(value), expires_at)),
+                    ('DELETE FROM extraction_cache WHERE expires_at <= ?', (time.time(),))
+                )
+
+    def invalidate(self, kind, url):
+        """Drop a cached result, e.g. after its media URL stopped working"""
+        key = self._key(kind, url)
+        with self._lock:
+            self._entries.pop(key, None)
+            if self._db is not None:
+                self._write(('DELETE FROM extraction_cache WHERE key = ?', (key,)))
+
+    def stats(self):
+        """Return hit/miss counters and the number of entries in memory"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0,
+                'entries': len(self._entries),
+            }
+
+    def _write(self, *statements):
+        """Run statements against the database in one transaction; on failure log and skip them"""
+        # Caller must hold self._lock
+        try:
+            for sql, parameters in statements:
+                self._db.execute(sql, parameters)
+            self._db.commit()
+        except sqlite3.Error as e:
+            self.logger.warning(f"Extraction cache database write skipped: {str(e)}")
+            try:
+                self._db.rollback()
+            except sqlite3.Error:
+                pass
+
+    def _key(self, kind, url):
+        return f"{kind}:{normalize_url(url)}"
+
+    def _remember(self, key, expires_at, value):
+        # Caller must hold self._lock
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,185 @@
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from html_extractor import scan_page
+from ydl_pool import YoutubeDLPool, YoutubeDL, compact_info
+
+
+# Pages smaller than this parse faster in the calling thread than they travel to a worker
+MIN_POOLED_PAGE_SIZE = 1024 * 64
+
+# Imported once by the fork server, so forked workers start with them loaded
+PRELOAD_MODULES = ['html_extractor', 'ydl_pool', 'yt_dlp', 'yt_dlp.extractor.extractors']
+
+# State of a worker process, set up by _init_worker
+_worker_ydl_pool = None
+
+
+class ExtractionError(Exception):
+    """An extraction that failed in a worker process, carried back as plain text"""
+
+
+def _init_worker(ydl_profiles):
+    """Warm a worker: build a YoutubeDL per profile, which loads the extractor registry"""
+    global _worker_ydl_pool
+    if YoutubeDL is None or not ydl_profiles:
+        return
+    _worker_ydl_pool = YoutubeDLPool(ydl_profiles, max_idle=1)
+    for profile in ydl_profiles:
+        with _worker_ydl_pool.checkout(profile):
+            pass
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def _scan_page(page_content, video_extensions):
+    # PageScan holds only strings, ints and lists, so it pickles compactly
+    return scan_page(page_content, video_extensions)
+
+
+def _extract_info(url, profile):
+    if _worker_ydl_pool is None:
+        raise ExtractionError("yt-dlp is not available in the extraction worker")
+    return extract_with(_worker_ydl_pool, url, profile)
+
+
+def extract_with(ydl_pool, url, profile):
+    """Extract a URL on an instance from ydl_pool and return the compacted info dict, or None"""
+    try:
+        with ydl_pool.checkout(profile) as ydl:
+            info = ydl.extract_info(url, download=False)
+    except Exception as e:
+        # yt-dlp errors hold tracebacks and other unpicklable state
+        raise ExtractionError(f"{type(e).__name__}: {e}") from None
+    return compact_info(info) if info else None
+
+
+class ExtractionPool:
+    """
+    Runs CPU-bound extraction in worker processes.
+
+    Page scans and yt-dlp extraction (signature deciphering, JSON
+    processing) hold the GIL, so in a threaded server they run one at a
+    time however many cores there are. This pool runs them in warm worker
+    processes instead and returns compact plain-data results: a PageScan,
+    or an info dict reduced by compact_info(). Byte transfer stays in the
+    calling threads.
+
+    Workers start on first use, or with start(). They are forked from a
+    fork server that has yt-dlp's extractors loaded (spawned where fork
+    servers are unavailable), so they do not inherit the server's threads.
+    A pool whose worker died is replaced, and the call that hit it runs in
+    the calling thread.
+    """
+
+    def __init__(self, workers=None, ydl_profiles=None, min_page_size=MIN_POOLED_PAGE_SIZE):
+        """
+        Args:
+            workers (int, optional): Worker processes; defaults to the number of CPUs
+            ydl_profiles (dict, optional): yt-dlp option profiles the workers can
+                extract with, by name
+            min_page_size (int): Pages with fewer characters are scanned in the calling thread
+        """
+        self.logger = logging.getLogger(__name__)
+        self.workers = workers or os.cpu_count() or 1
+        self.ydl_profiles = dict(ydl_profiles or {})
+        self.min_page_size = min_page_size
+        self._executor = None
+        self._local_ydl_pool = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start every worker now instead of on first use; returns the pool"""
+        executor = self._get_executor()
+        futures = [executor.submit(_warm_up) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+        return self
+
+    def scan_page(self, page_content, video_extensions):
+        """
+        Scan a page for video content in a worker process.
+
+        Args:
+            page_content (str): The HTML content of the page
+            video_extensions (list): Extensions including the dot that count as video files
+
+        Returns:
+            PageScan: As html_extractor.scan_page returns it
+        """
+        video_extensions = tuple(video_extensions)
+        if len(page_content) < self.min_page_size:
+            return scan_page(page_content, video_extensions)
+        return self._run(_scan_page, page_content, video_extensions)
+
+    def extract_info(self, url, profile):
+        """
+        Extract a URL's info with yt-dlp in a worker process, without downloading.
+
+        Args:
+            url (str): The page URL
+            profile (str): One of the yt-dlp option profiles the pool was created with
+
+        Returns:
+            dict or None: The compacted info dict, ready for YoutubeDL.process_ie_result()
+
+        Raises:
+            ExtractionError: If yt-dlp failed to extract the URL
+        """
+        if profile not in self.ydl_profiles:
+            raise KeyError(f"Unknown YoutubeDL profile: {profile}")
+        return self._run(_extract_info, url, profile)
+
+    def close(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, function, *args):
+        executor = self._get_executor()
+        try:
+            return executor.submit(function, *args).result()
+        except BrokenProcessPool:
+            self.logger.warning("An extraction worker died; restarting the pool")
+            self._replace_executor(executor)
+            return self._run_locally(function, *args)
+
+    def _run_locally(self, function, *args):
+        if function is not _extract_info:
+            return function(*args)
+        with self._lock:
+            if self._local_ydl_pool is None:
+                self._local_ydl_pool = YoutubeDLPool(self.ydl_profiles)
+            ydl_pool = self._local_ydl_pool
+        return extract_with(ydl_pool, *args)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=self._context(),
+                    initializer=_init_worker,
+                    initargs=(self.ydl_profiles,)
+                )
+            return self._executor
+
+    def _replace_executor(self, broken):
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _context(self):
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(PRELOAD_MODULES)
+            return context
+        return multiprocessing.get_context('spawn')
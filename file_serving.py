@@ -0,0 +1,135 @@
+import os
+import logging
+from urllib.parse import quote
+
+from flask import current_app, request, send_file
+from werkzeug.utils import send_file as werkzeug_send_file
+
+
+# How downloaded files are handed to the client
+SERVING_MODES = ('direct', 'x-accel-redirect', 'x-sendfile')
+
+
+class FileServer:
+    """
+    Serves downloaded files to clients.
+
+    In 'direct' mode the app sends the file itself, honoring Range and
+    conditional requests. Full responses, and partial ones that run to the
+    end of the file, go through the server's wsgi.file_wrapper, which lets
+    servers such as gunicorn use os.sendfile instead of copying through
+    Python.
+
+    In 'x-accel-redirect' (nginx) and 'x-sendfile' (Apache, lighttpd) modes
+    the response only names the file and the front proxy streams it, Range
+    requests included, so a slow client never holds an app worker.
+    """
+
+    def __init__(self, mode='direct', accel_locations=None, block_size=1024 * 256):
+        """
+        Args:
+            mode (str): One of SERVING_MODES
+            accel_locations (dict, optional): Directory to nginx internal location prefix,
+                e.g. {'/srv/app/downloads': '/protected/'}; used in 'x-accel-redirect' mode
+            block_size (int): Read size passed to wsgi.file_wrapper
+        """
+        self.logger = logging.getLogger(__name__)
+        if mode not in SERVING_MODES:
+            raise ValueError(f"Unknown file serving mode: {mode}")
+        self.mode = mode
+        self.accel_locations = {
+            os.path.realpath(directory): prefix.rstrip('/') + '/'
+            for directory, prefix in (accel_locations or {}).items()
+        }
+        self.block_size = block_size
+
+        if mode == 'x-accel-redirect' and not self.accel_locations:
+            self.logger.warning("X-Accel-Redirect serving has no locations configured; serving files directly")
+
+    def send(self, filepath, download_name=None):
+        """
+        Build the response that delivers a file as an attachment.
+
+        Args:
+            filepath (str): The file to send
+            download_name (str, optional): The filename the client saves as
+
+        Returns:
+            flask.Response: The response
+        """
+        download_name = download_name or os.path.basename(filepath)
+
+        if self.mode == 'x-sendfile':
+            return self._send_via_proxy(os.path.realpath(filepath), download_name, 'X-Sendfile')
+
+        if self.mode == 'x-accel-redirect':
+            internal_uri = self._internal_uri(filepath)
+            if internal_uri:
+                return self._send_via_proxy(filepath, download_name, 'X-Accel-Redirect', internal_uri)
+
+        return self._send_direct(filepath, download_name)
+
+    def _send_direct(self, filepath, download_name):
+        response = send_file(filepath, as_attachment=True, download_name=download_name, conditional=True)
+
+        # Werkzeug slices ranges through a Python iterator; hand the server a
+        # file positioned at the range start instead so it can use sendfile.
+        # Servers may send a wrapped file to EOF, so only ranges that end there qualify.
+        file_wrapper = request.environ.get('wsgi.file_wrapper')
+        content_range = response.content_range
+        if (response.status_code == 206 and file_wrapper is not None and content_range
+                and content_range.stop == content_range.length):
+            response.response.close()
+            file = open(filepath, 'rb')
+            file.seek(content_range.start)
+            response.response = file_wrapper(file, self.block_size)
+
+        return response
+
+    def _send_via_proxy(self, filepath, download_name, header, value=None):
+        # The proxy handles Range and conditional requests itself
+        response = werkzeug_send_file(
+            filepath,
+            request.environ,
+            as_attachment=True,
+            download_name=download_name,
+            conditional=False,
+            use_x_sendfile=True,
+            response_class=current_app.response_class,
+            _root_path=current_app.root_path,
+        )
+        if header != 'X-Sendfile':
+            del response.headers['X-Sendfile']
+            response.headers[header] = value
+        # The proxy sets the length of the body it sends
+        del response.headers['Content-Length']
+        return response
+
+    def _internal_uri(self, filepath):
+        """Map a file to its nginx internal location, or None if it is not under one"""
+        path = os.path.realpath(filepath)
+        for directory, prefix in self.accel_locations.items():
+            if os.path.commonpath([path, directory]) == directory:
+                relative = os.path.relpath(path, directory).replace(os.sep, '/')
+                return prefix + quote(relative)
+        return None
+
+
+def parse_accel_locations(value):
+    """
+    Parse an X-Accel-Redirect location setting such as "downloads=/protected/".
+
+    Args:
+        value (str): Comma-separated directory=prefix pairs
+
+    Returns:
+        dict: Absolute directory to internal location prefix
+    """
+    locations = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        directory, prefix = item.split('=', 1)
+        if directory.strip() and prefix.strip():
+            locations[os.path.abspath(directory.strip())] = prefix.strip()
+    return locations
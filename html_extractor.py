@@ -0,0 +1,185 @@
+import re
+from functools import lru_cache
+from html.parser import HTMLParser
+
+
+# Extraction strategies, in the order their candidates are preferred
+STRATEGY_VIDEO_TAG = 'video tag'
+STRATEGY_SOURCE_TAG = 'standalone source tag'
+STRATEGY_PAGE_SOURCE = 'page source'
+STRATEGY_DATA_ATTRIBUTE = 'data attribute'
+STRATEGY_IFRAME = 'iframe embed'
+
+STRATEGY_RANKS = {
+    STRATEGY_VIDEO_TAG: 1,
+    STRATEGY_SOURCE_TAG: 2,
+    STRATEGY_PAGE_SOURCE: 3,
+    STRATEGY_DATA_ATTRIBUTE: 4,
+    STRATEGY_IFRAME: 5,
+}
+
+# Attributes that commonly hold a lazily loaded video URL
+VIDEO_DATA_ATTRIBUTES = ('data-src', 'data-source', 'data-video')
+
+# Embedded players recognised by check_url
+EMBED_PLATFORMS = ('youtube.com', 'vimeo.com', 'dailymotion.com', 'twitch.tv')
+
+# Script-driven players recognised by check_url, in reporting order
+VIDEO_PLAYERS = ('videojs', 'jwplayer', 'flowplayer', 'mediaelement', 'plyr')
+PLAYER_PATTERN = re.compile('|'.join(VIDEO_PLAYERS), re.IGNORECASE)
+
+
+@lru_cache(maxsize=8)
+def media_url_pattern(video_extensions):
+    """
+    Build one regex matching absolute URLs that end in any of the extensions.
+
+    Matching stops at quotes and angle brackets, so URLs embedded in JSON or
+    attribute values are not glued to the text around them.
+
+    Args:
+        video_extensions (tuple): Extensions including the dot, e.g. ('.mp4', '.webm')
+
+    Returns:
+        re.Pattern: The compiled pattern
+    """
+    alternatives = '|'.join(re.escape(ext.lstrip('.')) for ext in video_extensions)
+    return re.compile(rf"https?://[^\s/$.?#][^\s\"'<>]*?\.(?:{alternatives})\b")
+
+
+class VideoSourceParser(HTMLParser):
+    """
+    Collects every candidate video source on a page in a single pass.
+
+    Records video/source tag URLs, data attributes and iframe embeds as the
+    document streams through, along with the counts check_url reports.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        # (rank, group, position, url, strategy) tuples
+        self.candidates = []
+        self.video_count = 0
+        self.video_type_source_count = 0
+        self.iframe_sources = []
+        # Index of each <video> currently open, innermost last
+        self._open_videos = []
+        self._position = 0
+
+    def handle_starttag(self, tag, attrs):
+        attributes = {name: value or '' for name, value in attrs}
+        self._position += 1
+
+        if tag == 'video':
+            self.video_count += 1
+            self._open_videos.append(self.video_count)
+            if attributes.get('src'):
+                self._add(STRATEGY_VIDEO_TAG, attributes['src'], group=self.video_count)
+
+        elif tag == 'source':
+            if attributes.get('type', '').startswith('video/'):
+                self.video_type_source_count += 1
+            if attributes.get('src'):
+                if self._open_videos:
+                    # A source inside a video counts as that video's source
+                    self._add(STRATEGY_VIDEO_TAG, attributes['src'], group=self._open_videos[-1])
+                else:
+                    self._add(STRATEGY_SOURCE_TAG, attributes['src'])
+
+        elif tag == 'iframe' and attributes.get('src'):
+            self.iframe_sources.append(attributes['src'])
+            embed_url = embed_page_url(attributes['src'])
+            if embed_url:
+                self._add(STRATEGY_IFRAME, embed_url)
+
+        for name in VIDEO_DATA_ATTRIBUTES:
+            if attributes.get(name):
+                self._add(STRATEGY_DATA_ATTRIBUTE, attributes[name])
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag == 'video':
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag == 'video' and self._open_videos:
+            self._open_videos.pop()
+
+    def _add(self, strategy, url, group=0):
+        self.candidates.append((STRATEGY_RANKS[strategy], group, self._position, url.strip(), strategy))
+
+
+def embed_page_url(src):
+    """Turn a YouTube or Vimeo embed URL into the video's page URL, or None"""
+    if 'youtube.com/embed/' in src:
+        video_id = src.split('/')[-1].split('?')[0]
+        return f"https://www.youtube.com/watch?v={video_id}"
+    elif 'vimeo.com' in src:
+        video_id = src.split('/')[-1].split('?')[0]
+        return f"https://vimeo.com/{video_id}"
+    return None
+
+
+class PageScan:
+    """The result of scanning a page once for video content"""
+
+    def __init__(self, parser, media_urls, players):
+        self.video_count = parser.video_count
+        self.video_type_source_count = parser.video_type_source_count
+        self.iframe_sources = parser.iframe_sources
+        self.media_urls = media_urls
+        self.players = players
+        self._candidates = parser.candidates
+
+    def candidates(self):
+        """
+        Return candidate video URLs, best first.
+
+        Returns:
+            list: dicts with 'url' (possibly relative) and 'strategy', without duplicates
+        """
+        ranked = sorted(self._candidates)
+        ranked += [
+            (STRATEGY_RANKS[STRATEGY_PAGE_SOURCE], 0, 0, url, STRATEGY_PAGE_SOURCE)
+            for url in self.media_urls
+        ]
+        ranked.sort(key=lambda candidate: candidate[:3])
+
+        seen = set()
+        results = []
+        for _, _, _, url, strategy in ranked:
+            if url and url not in seen:
+                seen.add(url)
+                results.append({'url': url, 'strategy': strategy})
+        return results
+
+    def embedded_players(self):
+        """Return iframe sources pointing at known video platforms"""
+        return [src for src in self.iframe_sources if any(platform in src for platform in EMBED_PLATFORMS)]
+
+
+def scan_page(page_content, video_extensions):
+    """
+    Scan a page for video content in one pass over the markup and one regex pass.
+
+    Args:
+        page_content (str): The HTML content of the page
+        video_extensions (list): Extensions including the dot that count as video files
+
+    Returns:
+        PageScan: Candidate sources and the counts used by check_url
+    """
+    parser = VideoSourceParser()
+    parser.feed(page_content)
+    parser.close()
+
+    # Prefer earlier extensions in the list, then earlier positions on the page
+    extensions = tuple(video_extensions)
+    priority = {ext.lstrip('.'): i for i, ext in enumerate(extensions)}
+    matches = media_url_pattern(extensions).findall(page_content)
+    media_urls = sorted(matches, key=lambda url: priority.get(url.rsplit('.', 1)[-1], len(priority)))
+
+    found_players = {match.lower() for match in PLAYER_PATTERN.findall(page_content)}
+    players = [player for player in VIDEO_PLAYERS if player in found_players]
+
+    return PageScan(parser, media_urls, players)
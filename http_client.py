@@ -0,0 +1,203 @@
+import socket
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.poolmanager import PoolManager
+
+
+def keepalive_socket_options(idle=60, interval=15, count=4):
+    """
+    Socket options that turn on TCP keep-alive probes.
+
+    Idle pooled connections then survive NAT and load balancer timeouts,
+    and dead ones are noticed before a request is sent on them.
+
+    Args:
+        idle (int): Seconds of idleness before the first probe
+        interval (int): Seconds between probes
+        count (int): Unanswered probes before the connection is dropped
+
+    Returns:
+        list: (level, option, value) tuples for urllib3's socket_options
+    """
+    options = list(HTTPConnection.default_socket_options)
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    # Not every platform lets the probe timing be tuned
+    for name, value in (('TCP_KEEPIDLE', idle), ('TCP_KEEPINTVL', interval), ('TCP_KEEPCNT', count)):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+class HostPoolManager(PoolManager):
+    """
+    A urllib3 PoolManager with per-host pool sizes and connection reuse counters.
+
+    Each (scheme, host, port) gets its own pool of keep-alive connections.
+    Hosts listed in host_maxsize, or subdomains of them, get a pool of that
+    size instead of the default maxsize.
+    """
+
+    def __init__(self, num_pools=10, headers=None, host_maxsize=None, **connection_pool_kw):
+        super().__init__(num_pools=num_pools, headers=headers, **connection_pool_kw)
+        self.host_maxsize = {host.lower(): size for host, size in (host_maxsize or {}).items()}
+        # Pools currently held, and totals carried over from pools evicted since
+        self._live_pools = {}
+        self._retired = {'requests': 0, 'connections': 0}
+        self._stats_lock = threading.Lock()
+        self.pools.dispose_func = self._retire_pool
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        if request_context is None:
+            request_context = self.connection_pool_kw.copy()
+        maxsize = self._maxsize_for(host)
+        if maxsize:
+            request_context['maxsize'] = maxsize
+
+        pool = super()._new_pool(scheme, host, port, request_context)
+        with self._stats_lock:
+            self._live_pools[id(pool)] = pool
+        return pool
+
+    def _maxsize_for(self, host):
+        labels = (host or '').lower().split('.')
+        for i in range(len(labels)):
+            size = self.host_maxsize.get('.'.join(labels[i:]))
+            if size:
+                return size
+        return None
+
+    def _retire_pool(self, pool):
+        with self._stats_lock:
+            if self._live_pools.pop(id(pool), None) is not None:
+                self._retired['requests'] += pool.num_requests
+                self._retired['connections'] += pool.num_connections
+        pool.close()
+
+    def stats(self):
+        """
+        Return connection reuse counters.
+
+        Returns:
+            dict: Totals of requests sent and connections opened, how many
+            requests reused a pooled connection, and the same per live host pool
+        """
+        with self._stats_lock:
+            pools = list(self._live_pools.values())
+            requests_sent = self._retired['requests']
+            connections = self._retired['connections']
+
+        hosts = {}
+        for pool in pools:
+            requests_sent += pool.num_requests
+            connections += pool.num_connections
+            key = f"{pool.scheme}://{pool.host}:{pool.port}"
+            hosts[key] = {
+                'requests': pool.num_requests,
+                'connections': pool.num_connections,
+                # The queue is padded with None placeholders for connections not yet opened
+                'idle': sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0,
+                'maxsize': pool.pool.maxsize if pool.pool is not None else 0,
+            }
+
+        reused = max(requests_sent - connections, 0)
+        return {
+            'requests': requests_sent,
+            'connections_opened': connections,
+            'reused': reused,
+            'reuse_ratio': round(reused / requests_sent, 3) if requests_sent else 0,
+            'hosts': hosts,
+        }
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    A requests transport adapter backed by a HostPoolManager.
+    """
+
+    def __init__(self, host_pool_sizes=None, socket_options=None, **kwargs):
+        """
+        Args:
+            host_pool_sizes (dict, optional): Host to connection pool size
+            socket_options (list, optional): Socket options for new connections
+            **kwargs: Passed to HTTPAdapter (pool_connections, pool_maxsize, pool_block, max_retries)
+        """
+        # HTTPAdapter.__init__ builds the pool manager, so these have to be set first
+        self.host_pool_sizes = dict(host_pool_sizes or {})
+        self.socket_options = socket_options
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        if self.socket_options is not None:
+            pool_kwargs['socket_options'] = self.socket_options
+        self.poolmanager = HostPoolManager(
+            num_pools=connections,
+            maxsize=maxsize,
+            block=block,
+            host_maxsize=self.host_pool_sizes,
+            **pool_kwargs
+        )
+
+
+class PooledSession(requests.Session):
+    """
+    A requests.Session tuned to be shared by every thread of the app.
+
+    Connections are kept alive and reused per host, so repeated HEAD probes
+    and page fetches skip the TCP and TLS handshakes, and the pools are
+    large enough for parallel segment downloads to the same host. Sending
+    requests from several threads at once is safe: the connection pools are
+    locked, and the cookie jar is too.
+    """
+
+    def __init__(self, pool_hosts=32, pool_maxsize=32, host_pool_sizes=None, tcp_keepalive=True):
+        """
+        Args:
+            pool_hosts (int): Hosts whose connection pools are kept; the least recently
+                used pool is closed beyond this
+            pool_maxsize (int): Keep-alive connections kept per host
+            host_pool_sizes (dict, optional): Per-host overrides of pool_maxsize, e.g.
+                {'cdn.example.com': 64}; subdomains inherit their parent's size
+            tcp_keepalive (bool): Enable TCP keep-alive probes on pooled connections
+        """
+        super().__init__()
+        self.adapter = PooledHTTPAdapter(
+            host_pool_sizes=host_pool_sizes,
+            socket_options=keepalive_socket_options() if tcp_keepalive else None,
+            pool_connections=pool_hosts,
+            pool_maxsize=pool_maxsize
+        )
+        self.mount('http://', self.adapter)
+        self.mount('https://', self.adapter)
+
+    def pool_stats(self):
+        """Return connection reuse counters, see HostPoolManager.stats()"""
+        return self.adapter.poolmanager.stats()
+
+
+def parse_host_pool_sizes(value):
+    """
+    Parse a per-host pool size setting such as "cdn.example.com=64,example.org=8".
+
+    Args:
+        value (str): Comma-separated host=size pairs
+
+    Returns:
+        dict: Host to connection pool size
+    """
+    sizes = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        host, size = item.split('=', 1)
+        try:
+            sizes[host.strip().lower()] = max(1, int(size))
+        except ValueError:
+            logging.getLogger(__name__).warning(f"Ignoring invalid host pool size: {item}")
+    return sizes
@@ -0,0 +1,123 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DownloadJobQueue:
+    """
+    Runs download jobs in the background on a bounded worker pool.
+
+    Jobs are queued per platform so that a burst of downloads from one site
+    cannot occupy every worker: a job is only handed to the pool while its
+    platform is below its concurrency limit, otherwise it waits in line.
+    """
+
+    def __init__(self, run_job, max_workers=8, platform_limits=None, default_platform_limit=None):
+        """
+        Args:
+            run_job (callable): Called as run_job(job_id, url, download_path) on a worker thread
+            max_workers (int): Size of the worker pool
+            platform_limits (dict, optional): Maximum concurrent jobs per platform name
+            default_platform_limit (int, optional): Limit for platforms not in platform_limits;
+                defaults to max_workers
+        """
+        self.logger = logging.getLogger(__name__)
+        self.run_job = run_job
+        self.max_workers = max_workers
+        self.platform_limits = dict(platform_limits or {})
+        self.default_platform_limit = default_platform_limit or max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='download-worker')
+        # Jobs waiting for a free slot on their platform
+        self._pending = {}
+        # Number of jobs currently running per platform
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_id, url, download_path, platform=None, on_done=None):
+        """
+        Queue a download job.
+
+        Args:
+            job_id (str): The registered job to run
+            url (str): The URL to download
+            download_path (str): The directory to save the download in
+            platform (str, optional): The platform used for concurrency limiting
+            on_done (callable, optional): Called as on_done(job_id) on the worker thread
+                once the job has finished, whether or not it succeeded
+        """
+        platform = platform or 'generic'
+        with self._lock:
+            self._pending.setdefault(platform, deque()).append((job_id, url, download_path, on_done))
+            self._dispatch(platform)
+
+    def queue_depth(self):
+        """Return the number of jobs waiting for a worker"""
+        with self._lock:
+            return sum(len(jobs) for jobs in self._pending.values())
+
+    def running_count(self):
+        """Return the number of jobs currently running"""
+        with self._lock:
+            return sum(self._running.values())
+
+    def platform_counts(self):
+        """Return the queued and running job counts per platform"""
+        with self._lock:
+            return {
+                platform: {'queued': len(self._pending.get(platform, ())), 'running': self._running.get(platform, 0)}
+                for platform in set(self._pending) | set(self._running)
+            }
+
+    def shutdown(self, wait=True):
+        """Stop accepting work and optionally wait for running jobs"""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _limit_for(self, platform):
+        return self.platform_limits.get(platform, self.default_platform_limit)
+
+    def _dispatch(self, platform):
+        """Start as many pending jobs for a platform as its limit allows"""
+        # Caller must hold self._lock
+        pending = self._pending.get(platform)
+        while pending and self._running.get(platform, 0) < self._limit_for(platform):
+            job_id, url, download_path, on_done = pending.popleft()
+            self._running[platform] = self._running.get(platform, 0) + 1
+            self._executor.submit(self._run, platform, job_id, url, download_path, on_done)
+
+    def _run(self, platform, job_id, url, download_path, on_done):
+        try:
+            self.run_job(job_id, url, download_path)
+        except Exception:
+            self.logger.exception(f"Unhandled error in download job {job_id}")
+        finally:
+            with self._lock:
+                self._running[platform] -= 1
+                self._dispatch(platform)
+            if on_done is not None:
+                try:
+                    on_done(job_id)
+                except Exception:
+                    self.logger.exception(f"Error in completion callback of download job {job_id}")
+
+
+def parse_platform_limits(value):
+    """
+    Parse a platform limit setting such as "youtube=2,instagram=1".
+
+    Args:
+        value (str): Comma-separated platform=limit pairs
+
+    Returns:
+        dict: Platform name to concurrency limit
+    """
+    limits = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        platform, limit = item.split('=', 1)
+        try:
+            limits[platform.strip().lower()] = max(1, int(limit))
+        except ValueError:
+            logging.getLogger(__name__).warning(f"Ignoring invalid platform limit: {item}")
+    return limits
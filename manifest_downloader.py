@@ -0,0 +1,612 @@
+import os
+import re
+import math
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+import xml.etree.ElementTree as ElementTree
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+
+import requests
+
+from tracing import TRACER
+
+# AES-128 encrypted HLS streams need the cryptography package
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    Cipher = None
+
+
+HLS_CONTENT_TYPES = ('application/vnd.apple.mpegurl', 'application/x-mpegurl', 'audio/mpegurl', 'audio/x-mpegurl')
+DASH_CONTENT_TYPES = ('application/dash+xml',)
+
+# Extensions of manifest URLs, looked for in page sources alongside video files
+MANIFEST_EXTENSIONS = ('.m3u8', '.mpd')
+
+# HLS attribute lists: KEY=value or KEY="quoted, value"
+ATTRIBUTE_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^",]*)')
+
+# DASH segment template identifiers such as $Number$ or $Number%05d$
+TEMPLATE_PATTERN = re.compile(r'\$(RepresentationID|Number|Time|Bandwidth)(?:%0(\d+)d)?\$')
+
+# ISO 8601 durations as used by MPD files, e.g. PT1H2M3.5S
+DURATION_PATTERN = re.compile(
+    r'P(?:(?P<days>\d+(?:\.\d+)?)D)?'
+    r'(?:T(?:(?P<hours>\d+(?:\.\d+)?)H)?(?:(?P<minutes>\d+(?:\.\d+)?)M)?(?:(?P<seconds>\d+(?:\.\d+)?)S)?)?'
+)
+
+
+class ManifestError(Exception):
+    """Raised when a manifest cannot be parsed or downloaded"""
+
+
+def manifest_type(url, content_type=''):
+    """
+    Tell whether a URL points at an HLS or DASH manifest.
+
+    Args:
+        url (str): The media URL
+        content_type (str): The Content-Type the server reported, if known
+
+    Returns:
+        str or None: 'hls', 'dash' or None
+    """
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    path = urlparse(url).path.lower()
+    if content_type in HLS_CONTENT_TYPES or path.endswith('.m3u8'):
+        return 'hls'
+    if content_type in DASH_CONTENT_TYPES or path.endswith('.mpd'):
+        return 'dash'
+    return None
+
+
+class MediaSegment:
+    """One piece of a stream: a URL, optionally a byte range of it, and its encryption key"""
+
+    def __init__(self, url, byte_range=None, key=None, sequence=0):
+        self.url = url
+        # (start, end) inclusive byte offsets, or None for the whole resource
+        self.byte_range = byte_range
+        # {'uri': ..., 'iv': bytes or None} for AES-128 segments
+        self.key = key
+        self.sequence = sequence
+
+
+class MediaPlan:
+    """The segments of one chosen rendition, in playback order"""
+
+    def __init__(self, kind, segments, init_segment=None, ext='.mp4', bandwidth=0, audio=None):
+        self.kind = kind
+        self.segments = segments
+        # fMP4 initialization segment written before the media segments
+        self.init_segment = init_segment
+        self.ext = ext
+        self.bandwidth = bandwidth
+        # Separate audio rendition that has to be muxed in, if any
+        self.audio = audio
+
+    def segment_count(self):
+        count = len(self.segments) + (1 if self.init_segment else 0)
+        if self.audio is not None:
+            count += self.audio.segment_count()
+        return count
+
+
+class ManifestDownloader:
+    """
+    Downloads HLS and DASH streams.
+
+    The manifest is parsed, the rendition whose bandwidth best fits the
+    limit is chosen, and its segments are fetched concurrently on a bounded
+    pool while being written to the output file strictly in order. AES-128
+    encrypted HLS segments are decrypted on the fly. Separate audio
+    renditions are muxed in with ffmpeg when it is installed.
+    """
+
+    def __init__(self, session, headers=None, timeout=30, workers=8, max_bandwidth=None, max_segment_retries=3,
+                 throttle=None):
+        """
+        Args:
+            session (requests.Session): Session used for every request
+            headers (dict, optional): Headers sent with every request
+            timeout (int): Timeout in seconds for HTTP requests
+            workers (int): Segments fetched in parallel
+            max_bandwidth (int, optional): Highest rendition bandwidth in bits/s to pick;
+                the best available rendition if omitted
+            max_segment_retries (int): Retries per segment on connection errors
+            throttle (rate_limiter.Throttle, optional): Bandwidth limits segments are charged to
+        """
+        self.logger = logging.getLogger(__name__)
+        self.session = session
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self.workers = workers
+        self.max_bandwidth = max_bandwidth
+        self.max_segment_retries = max_segment_retries
+        self.throttle = throttle
+        self._keys = {}
+        self._keys_lock = threading.Lock()
+
+    def plan(self, manifest_url, content_type=''):
+        """
+        Fetch a manifest and choose the rendition to download.
+
+        Args:
+            manifest_url (str): URL of the .m3u8 or .mpd manifest
+            content_type (str): The Content-Type the server reported, if known
+
+        Returns:
+            MediaPlan: The segments to download
+
+        Raises:
+            ManifestError: If the manifest is unsupported or has no playable rendition
+        """
+        kind = manifest_type(manifest_url, content_type)
+        text, final_url = self._get_text(manifest_url)
+        if kind == 'dash' or (kind is None and '<MPD' in text):
+            return self._plan_dash(text, final_url)
+        if text.lstrip().startswith('#EXTM3U'):
+            return self._plan_hls(text, final_url)
+        raise ManifestError("Not an HLS or DASH manifest")
+
+    def download(self, plan, filepath, progress_callback=None):
+        """
+        Download a planned stream into one file.
+
+        Args:
+            plan (MediaPlan): The plan returned by plan()
+            filepath (str): The path to save the file
+            progress_callback (callable, optional): Called as
+                progress_callback(downloaded_bytes, done_segments, total_segments)
+
+        Returns:
+            int: The size of the downloaded file in bytes
+        """
+        progress = {'bytes': 0, 'done': 0, 'total': plan.segment_count()}
+
+        def on_segment(size):
+            progress['bytes'] += size
+            progress['done'] += 1
+            if progress_callback:
+                progress_callback(progress['bytes'], progress['done'], progress['total'])
+
+        if plan.audio is None:
+            self._download_rendition(plan, filepath, on_segment)
+            return os.path.getsize(filepath)
+
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg is None:
+            self.logger.warning("ffmpeg is not installed; downloading the video rendition without separate audio")
+            progress['total'] -= plan.audio.segment_count()
+            self._download_rendition(plan, filepath, on_segment)
+            return os.path.getsize(filepath)
+
+        temp_dir = tempfile.mkdtemp(dir=os.path.dirname(filepath) or '.')
+        try:
+            video_path = os.path.join(temp_dir, 'video' + plan.ext)
+            audio_path = os.path.join(temp_dir, 'audio' + plan.audio.ext)
+            self._download_rendition(plan, video_path, on_segment)
+            self._download_rendition(plan.audio, audio_path, on_segment)
+            merged_path = os.path.join(temp_dir, 'merged' + plan.ext)
+            self._mux(ffmpeg, video_path, audio_path, merged_path)
+            os.replace(merged_path, filepath)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        return os.path.getsize(filepath)
+
+    def _download_rendition(self, plan, filepath, on_segment):
+        """Fetch a rendition's segments in parallel and append them to filepath in order"""
+        segments = ([plan.init_segment] if plan.init_segment else []) + plan.segments
+        self.logger.info(f"Downloading {len(segments)} {plan.kind.upper()} segments with {self.workers} workers")
+
+        # Segments go to a .part file that only takes the final name once complete,
+        # so a failed download leaves nothing truncated behind
+        part_path = filepath + '.part'
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='manifest-segment')
+        try:
+            with open(part_path, 'wb') as file:
+                # Keep a bounded window of segments in flight so memory use stays flat
+                remaining = iter(segments)
+                pending = deque()
+                for segment in remaining:
+                    pending.append(pool.submit(self._fetch_segment, segment))
+                    if len(pending) >= self.workers * 2:
+                        break
+
+                while pending:
+                    data = pending.popleft().result()
+                    file.write(data)
+                    on_segment(len(data))
+                    segment = next(remaining, None)
+                    if segment is not None:
+                        pending.append(pool.submit(self._fetch_segment, segment))
+
+                file.flush()
+                with TRACER.span('fsync'):
+                    os.fsync(file.fileno())
+            os.replace(part_path, filepath)
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _fetch_segment(self, segment):
+        headers = dict(self.headers)
+        if segment.byte_range:
+            headers['Range'] = f"bytes={segment.byte_range[0]}-{segment.byte_range[1]}"
+
+        attempts = 0
+        while True:
+            try:
+                response = self.session.get(segment.url, headers=headers, timeout=self.timeout)
+                response.raise_for_status()
+                data = response.content
+                break
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout) as e:
+                attempts += 1
+                if attempts > self.max_segment_retries:
+                    raise
+                self.logger.warning(f"Segment {segment.url} failed, retrying "
+                                    f"({attempts}/{self.max_segment_retries}): {str(e)}")
+
+        if self.throttle is not None:
+            self.throttle.wait(len(data))
+        if segment.key is not None:
+            data = self._decrypt(data, segment)
+        return data
+
+    def _decrypt(self, data, segment):
+        if Cipher is None:
+            raise ManifestError("This stream is AES-128 encrypted; install the cryptography package to download it")
+
+        iv = segment.key['iv'] or segment.sequence.to_bytes(16, 'big')
+        decryptor = Cipher(algorithms.AES(self._get_key(segment.key['uri'])), modes.CBC(iv)).decryptor()
+        data = decryptor.update(data) + decryptor.finalize()
+        # Strip PKCS#7 padding
+        if data and 1 <= data[-1] <= 16:
+            data = data[:-data[-1]]
+        return data
+
+    def _get_key(self, uri):
+        with self._keys_lock:
+            key = self._keys.get(uri)
+        if key is None:
+            response = self.session.get(uri, headers=self.headers, timeout=self.timeout)
+            response.raise_for_status()
+            key = response.content
+            if len(key) != 16:
+                raise ManifestError(f"Invalid AES-128 key length {len(key)} from {uri}")
+            with self._keys_lock:
+                self._keys[uri] = key
+        return key
+
+    def _mux(self, ffmpeg, video_path, audio_path, filepath):
+        command = [
+            ffmpeg, '-y', '-loglevel', 'error',
+            '-i', video_path, '-i', audio_path,
+            '-map', '0:v:0', '-map', '1:a:0', '-c', 'copy',
+            filepath,
+        ]
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise ManifestError(f"ffmpeg could not merge audio and video: {result.stderr.strip()}")
+
+    def _get_text(self, url):
+        response = self.session.get(url, headers=self.headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response.text, response.url
+
+    def _pick(self, renditions):
+        """Choose the highest bandwidth within max_bandwidth, or the lowest if none fits"""
+        renditions = sorted(renditions, key=lambda r: r['bandwidth'])
+        if self.max_bandwidth:
+            fitting = [r for r in renditions if r['bandwidth'] <= self.max_bandwidth]
+            return fitting[-1] if fitting else renditions[0]
+        return renditions[-1]
+
+    # HLS
+
+    def _plan_hls(self, text, base_url):
+        if '#EXT-X-STREAM-INF' not in text:
+            return self._parse_hls_media(text, base_url)
+
+        variants, audio_groups = self._parse_hls_master(text, base_url)
+        if not variants:
+            raise ManifestError("HLS master playlist lists no variants")
+        variant = self._pick(variants)
+        self.logger.info(f"Selected HLS variant at {variant['bandwidth']} bit/s: {variant['url']}")
+
+        media_text, media_url = self._get_text(variant['url'])
+        plan = self._parse_hls_media(media_text, media_url)
+        plan.bandwidth = variant['bandwidth']
+
+        # Audio in its own rendition has to be fetched separately and muxed
+        audio_url = audio_groups.get(variant.get('audio'))
+        if audio_url:
+            audio_text, audio_url = self._get_text(audio_url)
+            plan.audio = self._parse_hls_media(audio_text, audio_url)
+        return plan
+
+    def _parse_hls_master(self, text, base_url):
+        variants = []
+        audio_groups = {}
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        for i, line in enumerate(lines):
+            if line.startswith('#EXT-X-STREAM-INF:'):
+                attributes = parse_attribute_list(line.split(':', 1)[1])
+                uri = next((l for l in lines[i + 1:] if not l.startswith('#')), None)
+                if uri:
+                    variants.append({
+                        'url': urljoin(base_url, uri),
+                        'bandwidth': int(attributes.get('BANDWIDTH', 0) or 0),
+                        'audio': attributes.get('AUDIO'),
+                    })
+            elif line.startswith('#EXT-X-MEDIA:'):
+                attributes = parse_attribute_list(line.split(':', 1)[1])
+                if attributes.get('TYPE') == 'AUDIO' and attributes.get('URI'):
+                    group = attributes.get('GROUP-ID')
+                    # Prefer the default rendition of each group
+                    if group not in audio_groups or attributes.get('DEFAULT') == 'YES':
+                        audio_groups[group] = urljoin(base_url, attributes['URI'])
+        return variants, audio_groups
+
+    def _parse_hls_media(self, text, base_url):
+        segments = []
+        init_segment = None
+        key = None
+        sequence = 0
+        byte_range = None
+        next_offset = 0
+        ended = False
+
+        for line in (line.strip() for line in text.splitlines()):
+            if not line:
+                continue
+            if line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+                sequence = int(line.split(':', 1)[1])
+            elif line.startswith('#EXT-X-KEY:'):
+                attributes = parse_attribute_list(line.split(':', 1)[1])
+                method = attributes.get('METHOD', 'NONE')
+                if method == 'NONE':
+                    key = None
+                elif method == 'AES-128':
+                    iv = attributes.get('IV')
+                    key = {
+                        'uri': urljoin(base_url, attributes['URI']),
+                        'iv': bytes.fromhex(iv[2:].zfill(32)) if iv else None,
+                    }
+                else:
+                    raise ManifestError(f"Unsupported HLS encryption method: {method}")
+            elif line.startswith('#EXT-X-MAP:'):
+                attributes = parse_attribute_list(line.split(':', 1)[1])
+                map_range = None
+                if attributes.get('BYTERANGE'):
+                    map_range, _ = parse_byte_range(attributes['BYTERANGE'], 0)
+                init_segment = MediaSegment(urljoin(base_url, attributes['URI']), map_range)
+            elif line.startswith('#EXT-X-BYTERANGE:'):
+                byte_range, next_offset = parse_byte_range(line.split(':', 1)[1], next_offset)
+            elif line.startswith('#EXT-X-ENDLIST'):
+                ended = True
+            elif not line.startswith('#'):
+                segments.append(MediaSegment(urljoin(base_url, line), byte_range, key, sequence))
+                sequence += 1
+                byte_range = None
+
+        if not segments:
+            raise ManifestError("HLS playlist has no segments")
+        if not ended:
+            self.logger.warning("HLS playlist is live; downloading the segments listed so far")
+
+        ext = '.mp4' if init_segment else '.ts'
+        return MediaPlan('hls', segments, init_segment, ext)
+
+    # DASH
+
+    def _plan_dash(self, text, base_url):
+        try:
+            root = ElementTree.fromstring(text)
+        except ElementTree.ParseError as e:
+            raise ManifestError(f"Invalid DASH manifest: {str(e)}")
+
+        if root.get('type') == 'dynamic':
+            raise ManifestError("Live DASH streams are not supported")
+
+        periods = children(root, 'Period')
+        if not periods:
+            raise ManifestError("DASH manifest has no periods")
+        if len(periods) > 1:
+            self.logger.warning(f"DASH manifest has {len(periods)} periods; downloading the first")
+        period = periods[0]
+
+        base_url = resolve_base_url(root, base_url)
+        base_url = resolve_base_url(period, base_url)
+        duration = parse_duration(period.get('duration') or root.get('mediaPresentationDuration'))
+
+        renditions = {'video': [], 'audio': []}
+        for adaptation_set in children(period, 'AdaptationSet'):
+            set_base = resolve_base_url(adaptation_set, base_url)
+            for representation in children(adaptation_set, 'Representation'):
+                kind = content_kind(adaptation_set, representation)
+                if kind not in renditions:
+                    continue
+                renditions[kind].append({
+                    'bandwidth': int(representation.get('bandwidth', 0) or 0),
+                    'representation': representation,
+                    'adaptation_set': adaptation_set,
+                    'base_url': resolve_base_url(representation, set_base),
+                    'mime_type': representation.get('mimeType') or adaptation_set.get('mimeType', ''),
+                    'codecs': representation.get('codecs') or adaptation_set.get('codecs', ''),
+                })
+
+        if not renditions['video'] and not renditions['audio']:
+            raise ManifestError("DASH manifest has no audio or video representations")
+
+        main = self._pick(renditions['video'] or renditions['audio'])
+        self.logger.info(f"Selected DASH representation {main['representation'].get('id')} "
+                         f"at {main['bandwidth']} bit/s")
+        plan = self._dash_rendition(main, period, duration)
+
+        if renditions['video'] and renditions['audio']:
+            plan.audio = self._dash_rendition(self._pick(renditions['audio']), period, duration)
+        return plan
+
+    def _dash_rendition(self, rendition, period, duration):
+        representation = rendition['representation']
+        base_url = rendition['base_url']
+        ext = '.webm' if 'webm' in rendition['mime_type'] else '.mp4'
+
+        template = inherited_child('SegmentTemplate', representation, rendition['adaptation_set'], period)
+        if template is not None:
+            return self._dash_template(template, rendition, duration, ext)
+
+        segment_list = inherited_child('SegmentList', representation, rendition['adaptation_set'])
+        if segment_list is not None:
+            init = child(segment_list, 'Initialization')
+            init_segment = None
+            if init is not None:
+                init_segment = MediaSegment(
+                    urljoin(base_url, init.get('sourceURL', '')),
+                    parse_media_range(init.get('range'))
+                )
+            segments = [
+                MediaSegment(urljoin(base_url, segment_url.get('media', '')), parse_media_range(segment_url.get('mediaRange')))
+                for segment_url in children(segment_list, 'SegmentURL')
+            ]
+            return MediaPlan('dash', segments, init_segment, ext, rendition['bandwidth'])
+
+        # A single file, possibly with a SegmentBase index, downloaded whole
+        return MediaPlan('dash', [MediaSegment(base_url)], None, ext, rendition['bandwidth'])
+
+    def _dash_template(self, template, rendition, duration, ext):
+        representation = rendition['representation']
+        values = {
+            'RepresentationID': representation.get('id', ''),
+            'Bandwidth': representation.get('bandwidth', ''),
+        }
+        base_url = rendition['base_url']
+        start_number = int(template.get('startNumber', 1))
+        timescale = int(template.get('timescale', 1))
+
+        init_segment = None
+        if template.get('initialization'):
+            init_segment = MediaSegment(urljoin(base_url, fill_template(template.get('initialization'), values)))
+
+        media = template.get('media')
+        if not media:
+            raise ManifestError("DASH segment template has no media attribute")
+
+        segments = []
+        timeline = child(template, 'SegmentTimeline')
+        if timeline is not None:
+            number = start_number
+            time = 0
+            for entry in children(timeline, 'S'):
+                time = int(entry.get('t', time))
+                length = int(entry.get('d'))
+                for _ in range(int(entry.get('r', 0)) + 1):
+                    url = fill_template(media, dict(values, Number=number, Time=time))
+                    segments.append(MediaSegment(urljoin(base_url, url)))
+                    number += 1
+                    time += length
+        else:
+            segment_duration = int(template.get('duration', 0))
+            if not segment_duration or not duration:
+                raise ManifestError("Cannot work out the number of DASH segments")
+            count = math.ceil(duration * timescale / segment_duration)
+            for number in range(start_number, start_number + count):
+                url = fill_template(media, dict(values, Number=number, Time=(number - start_number) * segment_duration))
+                segments.append(MediaSegment(urljoin(base_url, url)))
+
+        return MediaPlan('dash', segments, init_segment, ext, rendition['bandwidth'])
+
+
+def parse_attribute_list(text):
+    """Parse an HLS attribute list into a dict, unquoting quoted values"""
+    return {key: value.strip('"') for key, value in ATTRIBUTE_PATTERN.findall(text)}
+
+
+def parse_byte_range(value, next_offset):
+    """
+    Parse an HLS byte range "length[@offset]".
+
+    Returns:
+        tuple: ((start, end) inclusive, offset where the next sub-range starts)
+    """
+    length, _, offset = value.partition('@')
+    start = int(offset) if offset else next_offset
+    end = start + int(length) - 1
+    return (start, end), end + 1
+
+
+def parse_media_range(value):
+    """Parse a DASH "start-end" byte range, or return None"""
+    if not value:
+        return None
+    start, end = value.split('-', 1)
+    return int(start), int(end)
+
+
+def parse_duration(value):
+    """Convert an ISO 8601 duration such as PT1M30S to seconds, or None"""
+    match = DURATION_PATTERN.fullmatch(value or '')
+    if not value or not match:
+        return None
+    parts = {name: float(amount) for name, amount in match.groupdict().items() if amount}
+    return (parts.get('days', 0) * 86400 + parts.get('hours', 0) * 3600
+            + parts.get('minutes', 0) * 60 + parts.get('seconds', 0))
+
+
+def fill_template(template, values):
+    """Substitute DASH template identifiers, honoring printf-style widths"""
+    def replace(match):
+        value = values.get(match.group(1), '')
+        return str(value).zfill(int(match.group(2))) if match.group(2) else str(value)
+    return TEMPLATE_PATTERN.sub(replace, template).replace('$$', '$')
+
+
+def local_name(element):
+    return element.tag.rsplit('}', 1)[-1]
+
+
+def children(element, name):
+    return [item for item in element if local_name(item) == name]
+
+
+def child(element, name):
+    found = children(element, name)
+    return found[0] if found else None
+
+
+def inherited_child(name, *elements):
+    """Return the named child of the first element that has one, innermost first"""
+    # Elements without children are falsy, so compare against None explicitly
+    for element in elements:
+        found = child(element, name)
+        if found is not None:
+            return found
+    return None
+
+
+def resolve_base_url(element, base_url):
+    """Apply an element's BaseURL, if it has one, to the inherited base URL"""
+    base = child(element, 'BaseURL')
+    if base is not None and base.text:
+        return urljoin(base_url, base.text.strip())
+    return base_url
+
+
+def content_kind(adaptation_set, representation):
+    """Return 'video', 'audio' or another content type for a DASH representation"""
+    content_type = adaptation_set.get('contentType')
+    if content_type:
+        return content_type
+    mime_type = representation.get('mimeType') or adaptation_set.get('mimeType', '')
+    return mime_type.split('/')[0]
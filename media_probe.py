@@ -0,0 +1,184 @@
+import re
+import logging
+
+from manifest_downloader import manifest_type
+from stream_reader import AdaptiveReader
+
+
+# Bytes read from a response before deciding what it is
+SNIFF_SIZE = 1024 * 8
+
+# Leading bytes of container formats, checked in order
+VIDEO_SIGNATURES = (
+    (4, b'ftyp'),                 # MP4, MOV, M4V, 3GP
+    (0, b'\x1a\x45\xdf\xa3'),     # Matroska, WebM
+    (0, b'FLV\x01'),              # Flash video
+    (0, b'\x30\x26\xb2\x75\x8e\x66\xcf\x11'),  # ASF, WMV
+    (0, b'\x00\x00\x01\xba'),     # MPEG program stream
+    (0, b'\x00\x00\x01\xb3'),     # MPEG video elementary stream
+)
+
+HTML_PATTERN = re.compile(rb'^\s*(<!doctype\s+html|<html|<head|<body)', re.IGNORECASE)
+DASH_PATTERN = re.compile(rb'^\s*(<\?xml[^>]*>\s*)?(<!--.*?-->\s*)*<MPD[\s>]', re.DOTALL)
+
+# Response fields kept when a probe is memoized
+MEMO_FIELDS = ('url', 'status_code', 'kind', 'content_type', 'total_size', 'supports_ranges', 'etag', 'last_modified')
+
+
+def sniff_kind(first_bytes, content_type='', url=''):
+    """
+    Classify a response from its first bytes, falling back to its headers.
+
+    Servers often label media application/octet-stream and playlists
+    text/plain, so the bytes take precedence over the Content-Type.
+
+    Args:
+        first_bytes (bytes): The start of the body
+        content_type (str): The Content-Type header
+        url (str): The URL, whose extension hints at manifests
+
+    Returns:
+        str: 'video', 'hls', 'dash', 'html' or 'other'
+    """
+    head = first_bytes.lstrip(b'\xef\xbb\xbf')
+    if head.startswith(b'#EXTM3U'):
+        return 'hls'
+    if DASH_PATTERN.match(head[:1024]):
+        return 'dash'
+    for offset, signature in VIDEO_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            return 'video'
+    if head[:4] == b'RIFF' and head[8:12] == b'AVI ':
+        return 'video'
+    # MPEG transport stream: a sync byte every 188 bytes
+    if len(head) > 188 * 2 and head[0] == head[188] == head[376] == 0x47:
+        return 'video'
+
+    content_type = content_type.lower()
+    stream_type = manifest_type(url, content_type)
+    if stream_type:
+        return stream_type
+    if content_type.startswith('video/'):
+        return 'video'
+    if HTML_PATTERN.match(head[:1024]) or 'html' in content_type:
+        return 'html'
+    return 'other'
+
+
+class ProbeResult:
+    """
+    What a URL turned out to serve, from one streaming GET.
+
+    A live result keeps the response open with its first chunk buffered:
+    it can be read on as the download itself (iter_content yields the
+    buffered chunk first) or as a page (text()). A memoized result has the
+    same metadata but no response, and the caller requests the body itself.
+    """
+
+    def __init__(self, url, response=None, first_chunk=b'', memo=None):
+        """
+        Args:
+            url (str): The URL that was probed
+            response (requests.Response, optional): The streaming response; an httpx
+                response works too, for its metadata
+            first_chunk (bytes): Body bytes already read from the response
+            memo (dict, optional): Metadata of an earlier probe, used instead of a response
+        """
+        self.url = url
+        self.response = response
+        self._first_chunk = first_chunk
+
+        if response is None:
+            for field in MEMO_FIELDS:
+                setattr(self, field, (memo or {}).get(field))
+            self.headers = {}
+            self.encoding = None
+            return
+
+        self.status_code = response.status_code
+        self.headers = response.headers
+        # Taken from the Content-Type charset, as requests does for response.text
+        self.encoding = response.encoding
+        self.content_type = response.headers.get('Content-Type', '')
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+        self.kind = sniff_kind(first_chunk, self.content_type, str(response.url or url))
+
+        # Compressed transfers report the encoded length, which does not match byte offsets
+        encoded = response.headers.get('Content-Encoding', 'identity').lower() not in ('', 'identity')
+        content_range = re.match(r'bytes\s+\d+-\d+/(\d+)', response.headers.get('Content-Range', ''))
+        if content_range:
+            self.total_size = int(content_range.group(1))
+        else:
+            self.total_size = int(response.headers.get('Content-Length', 0) or 0) if not encoded else 0
+        ranges_advertised = response.status_code == 206 or response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+        self.supports_ranges = ranges_advertised and self.total_size > 0 and not encoded
+
+    @property
+    def is_media(self):
+        """Whether the URL serves a video file or an HLS/DASH manifest"""
+        return self.kind in ('video', 'hls', 'dash')
+
+    @property
+    def live(self):
+        """Whether the response is still open and can be read"""
+        return self.response is not None
+
+    def iter_content(self, chunk_size=1024 * 64):
+        """Yield the body, starting with the bytes read while probing"""
+        if self._first_chunk:
+            yield self._first_chunk
+            self._first_chunk = b''
+        for data in self.response.iter_content(chunk_size):
+            yield data
+
+    def reader(self, **kwargs):
+        """Return an AdaptiveReader over the body, starting with the bytes read while probing"""
+        prefix, self._first_chunk = self._first_chunk, b''
+        return AdaptiveReader(self.response, prefix=prefix, **kwargs)
+
+    def text(self):
+        """Read the rest of the body and return all of it decoded"""
+        data = b''.join(self.iter_content())
+        self.close()
+        return data.decode(self.encoding or 'utf-8', errors='replace')
+
+    def as_memo(self):
+        """Return the metadata worth remembering about this URL"""
+        return {field: getattr(self, field) for field in MEMO_FIELDS}
+
+    def close(self):
+        if self.response is not None:
+            self.response.close()
+            self.response = None
+
+
+def probe_url(session, url, headers=None, timeout=30):
+    """
+    Open a URL with one streaming GET and sniff what it serves.
+
+    The request asks for bytes=0-, so servers that support ranges say so
+    (206 with Content-Range) while still sending the whole body.
+
+    Args:
+        session (requests.Session): Session used for the request
+        url (str): The URL to probe
+        headers (dict, optional): Request headers
+        timeout (int): Timeout in seconds
+
+    Returns:
+        ProbeResult: A live result; close() it if the body is not read
+    """
+    probe_headers = dict(headers or {})
+    probe_headers.setdefault('Range', 'bytes=0-')
+    response = session.get(url, headers=probe_headers, stream=True, timeout=timeout)
+    try:
+        first_chunk = next(response.iter_content(SNIFF_SIZE), b'')
+    except Exception:
+        response.close()
+        raise
+    result = ProbeResult(url, response, first_chunk)
+    logging.getLogger(__name__).debug(
+        f"Probed {url}: {result.kind}, status {result.status_code}, {result.total_size} bytes"
+    )
+    return result
@@ -0,0 +1,246 @@
+import math
+import logging
+import threading
+
+
+# Prometheus text exposition format served by /metrics
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; from a cached lookup to a slow yt-dlp extraction
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Bytes per second, 64 KiB/s to 1 GiB/s
+THROUGHPUT_BUCKETS = tuple(1024 * 64 * 4 ** i for i in range(9))
+
+
+class _Metric:
+    """A named metric with one value (or histogram) per combination of label values"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """Yield (suffix, labels, value) for every series"""
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield '', dict(zip(self.labelnames, key)), value
+
+
+class Counter(_Metric):
+    """A value that only goes up, such as bytes downloaded"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, such as queue depth"""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: dict(series, buckets=list(series['buckets'])) for key, series in self._values.items()}
+        for key, series in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, series['buckets']):
+                cumulative += count
+                yield '_bucket', dict(labels, le=format_value(bound)), cumulative
+            yield '_bucket', dict(labels, le='+Inf'), series['count']
+            yield '_sum', labels, series['sum']
+            yield '_count', labels, series['count']
+
+
+class MetricsRegistry:
+    """
+    The metrics of one process, rendered in the Prometheus text format.
+
+    Metrics updated as things happen are registered once; values that are
+    cheaper to read when scraped (cache counters, queue depth, pool sizes)
+    come from collectors, callables run on every scrape that fill gauges.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Add a metric; returns it"""
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        """
+        Run a callable before every scrape.
+
+        Args:
+            collector (callable): Takes no arguments and sets gauges; a collector
+                that raises is logged and skipped
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics.values())
+
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                self.logger.warning(f"Metrics collector failed: {str(e)}")
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {escape_help(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{format_labels(labels)} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{name}="{escape_label(value)}"' for name, value in labels.items())
+    return '{' + pairs + '}'
+
+
+def format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return str(int(value)) if value.is_integer() else repr(value)
+    return str(value)
+
+
+def escape_help(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+# The process-wide registry and the download pipeline's metrics
+REGISTRY = MetricsRegistry()
+
+EXTRACTION_SECONDS = REGISTRY.histogram(
+    'webvid_extraction_seconds',
+    'Time to resolve a URL to its media, by platform and the strategy that found it',
+    ('platform', 'strategy')
+)
+PAGE_SCAN_SECONDS = REGISTRY.histogram(
+    'webvid_page_scan_seconds',
+    'Time to scan a page for video sources, by the strategy of the best candidate',
+    ('strategy',)
+)
+TIME_TO_FIRST_BYTE_SECONDS = REGISTRY.histogram(
+    'webvid_time_to_first_byte_seconds',
+    'Time from sending a media request to receiving the first body bytes',
+    ('platform', 'engine')
+)
+THROUGHPUT_BYTES_PER_SECOND = REGISTRY.histogram(
+    'webvid_download_throughput_bytes_per_second',
+    'Average throughput of each completed transfer',
+    ('platform', 'engine'),
+    buckets=THROUGHPUT_BUCKETS
+)
+DOWNLOADED_BYTES = REGISTRY.counter(
+    'webvid_downloaded_bytes_total',
+    'Bytes written by completed transfers',
+    ('platform', 'engine')
+)
+DOWNLOADS = REGISTRY.counter(
+    'webvid_downloads_total',
+    'Finished download jobs by platform and outcome',
+    ('platform', 'status')
+)
+JOB_TRANSITIONS = REGISTRY.counter(
+    'webvid_job_status_transitions_total',
+    'Download jobs entering each status, as published on the progress bus',
+    ('status',)
+)
+DOWNLOADER_ATTEMPTS = REGISTRY.counter(
+    'webvid_downloader_attempts_total',
+    'Downloads or extractions attempted with each downloader',
+    ('platform', 'downloader')
+)
+FALLBACKS = REGISTRY.counter(
+    'webvid_fallbacks_total',
+    'Attempts that failed over from one downloader to another',
+    ('platform', 'from_downloader', 'to_downloader')
+)
+CACHE_HITS = REGISTRY.gauge('webvid_cache_hits', 'Cache lookups that hit since start', ('cache',))
+CACHE_MISSES = REGISTRY.gauge('webvid_cache_misses', 'Cache lookups that missed since start', ('cache',))
+CACHE_HIT_RATIO = REGISTRY.gauge('webvid_cache_hit_ratio', 'Share of cache lookups that hit', ('cache',))
+QUEUE_DEPTH = REGISTRY.gauge('webvid_queue_depth', 'Download jobs waiting for a worker', ('platform',))
+RUNNING_JOBS = REGISTRY.gauge('webvid_running_jobs', 'Download jobs being worked on', ('platform',))
+
+
+def observe_transfer(platform, engine, size, seconds):
+    """Record a completed transfer's bytes and average throughput"""
+    DOWNLOADED_BYTES.inc(size, platform=platform, engine=engine)
+    if seconds > 0:
+        THROUGHPUT_BYTES_PER_SECOND.observe(size / seconds, platform=platform, engine=engine)
@@ -0,0 +1,146 @@
+import logging
+from urllib.parse import urlparse
+from importlib.metadata import entry_points
+
+
+# Entry point group third-party packages use to add platforms, e.g. in pyproject.toml:
+#   [project.entry-points."webvid.platforms"]
+#   peertube = "my_package.platforms:peertube"
+ENTRY_POINT_GROUP = 'webvid.platforms'
+
+# Built-in platforms and the host suffixes they own; subdomains match too
+BUILTIN_PLATFORMS = (
+    ('youtube', ('youtube.com', 'youtu.be')),
+    ('instagram', ('instagram.com',)),
+    ('twitter', ('twitter.com', 'x.com')),
+    ('facebook', ('facebook.com', 'fb.com')),
+    ('tiktok', ('tiktok.com',)),
+    ('reddit', ('reddit.com',)),
+    ('linkedin', ('linkedin.com',)),
+    ('vimeo', ('vimeo.com',)),
+    ('dailymotion', ('dailymotion.com',)),
+    ('twitch', ('twitch.tv',)),
+)
+
+
+class Platform:
+    """
+    A video platform and the hosts it is served from.
+    """
+
+    def __init__(self, name, domains, handler=None):
+        """
+        Args:
+            name (str): Platform name used for dispatch, queue limits and filenames
+            domains (iterable): Host suffixes such as 'example.com'; 'www.example.com'
+                and other subdomains match as well
+            handler (callable, optional): Called as handler(downloader, url, download_path, job_id)
+                with the SocialMediaDownloader and returns a download result dict;
+                platforms without one are downloaded with yt-dlp
+        """
+        self.name = name
+        self.domains = tuple(normalize_host(domain) for domain in domains)
+        self.handler = handler
+
+    def __repr__(self):
+        return f"Platform({self.name!r}, {self.domains!r})"
+
+
+class PlatformRegistry:
+    """
+    Maps hostnames to platforms by exact label suffix.
+
+    Domains are stored in a trie keyed by their labels in reverse order
+    ('www.youtube.com' is looked up as com -> youtube -> www), so a lookup
+    costs one dict access per label and only whole labels match:
+    'x.com' owns 'x.com' and 'mobile.x.com' but not 'box.com'. The most
+    specific registered suffix wins.
+    """
+
+    def __init__(self, platforms=()):
+        """
+        Args:
+            platforms (iterable, optional): Platforms to register
+        """
+        self.logger = logging.getLogger(__name__)
+        self._platforms = {}
+        self._root = {}
+        for platform in platforms:
+            self.register(platform)
+
+    @classmethod
+    def default(cls):
+        """Return a registry with the built-in platforms and any installed through entry points"""
+        registry = cls(Platform(name, domains) for name, domains in BUILTIN_PLATFORMS)
+        registry.load_entry_points()
+        return registry
+
+    def register(self, platform):
+        """
+        Add a platform, taking over any of its domains registered before.
+
+        Args:
+            platform (Platform): The platform to add
+        """
+        self._platforms[platform.name] = platform
+        for domain in platform.domains:
+            node = self._root
+            for label in reversed(domain.split('.')):
+                node = node.setdefault(label, {})
+            # The empty label cannot occur in a hostname, so it marks the end of a domain
+            node[''] = platform
+
+    def load_entry_points(self, group=ENTRY_POINT_GROUP):
+        """
+        Register platforms published by installed packages.
+
+        Each entry point loads a Platform or a list of them. A broken plugin is
+        logged and skipped.
+
+        Args:
+            group (str): The entry point group to load
+        """
+        for entry_point in entry_points(group=group):
+            try:
+                loaded = entry_point.load()
+                for platform in (loaded if isinstance(loaded, (list, tuple)) else [loaded]):
+                    self.register(platform)
+                    self.logger.info(f"Registered platform {platform.name} from {entry_point.value}")
+            except Exception as e:
+                self.logger.warning(f"Could not load platform plugin {entry_point.name}: {str(e)}")
+
+    def get(self, name):
+        """Return the platform registered under a name, or None"""
+        return self._platforms.get(name)
+
+    def match_host(self, host):
+        """
+        Find the platform serving a hostname.
+
+        Args:
+            host (str): A hostname such as 'www.youtube.com'
+
+        Returns:
+            Platform or None: The platform owning the longest matching suffix
+        """
+        node = self._root
+        found = None
+        for label in reversed(normalize_host(host).split('.')):
+            node = node.get(label)
+            if node is None:
+                break
+            found = node.get('', found)
+        return found
+
+    def match_url(self, url):
+        """Find the platform serving a URL, or None"""
+        try:
+            host = urlparse(url).hostname
+        except ValueError:
+            return None
+        return self.match_host(host) if host else None
+
+
+def normalize_host(host):
+    """Lowercase a hostname and drop the trailing root dot"""
+    return host.strip().lower().rstrip('.')
@@ -0,0 +1,262 @@
+import sys
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from tqdm import tqdm
+
+
+# Statuses after which a job publishes nothing more
+FINISHED_STATUSES = ('completed', 'error')
+
+# Last statuses remembered to tell transitions from repeats
+MAX_TRACKED_JOBS = 10000
+
+
+class ProgressEvent:
+    """
+    A progress update of one download job.
+
+    Only the fields that changed are set; the rest are None. The bus marks
+    an event as a transition when its status differs from the last status
+    published for the job.
+    """
+
+    __slots__ = ('job_id', 'status', 'progress', 'file_size', 'downloaded', 'speed', 'filename',
+                 'platform', 'time', 'transition')
+
+    FIELDS = ('status', 'progress', 'file_size', 'downloaded', 'speed', 'filename', 'platform')
+
+    def __init__(self, job_id, status=None, progress=None, file_size=None, downloaded=None, speed=None,
+                 filename=None, platform=None, time=None):
+        self.job_id = job_id
+        self.status = status
+        self.progress = progress
+        self.file_size = file_size
+        self.downloaded = downloaded
+        self.speed = speed
+        self.filename = filename
+        self.platform = platform
+        self.time = time
+        self.transition = False
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+
+    def fields(self):
+        """Return the fields that are set, as keyword arguments for DownloadJobRegistry.update_job"""
+        return {name: getattr(self, name) for name in self.FIELDS if getattr(self, name) is not None}
+
+    def merge(self, other):
+        """Fold a later event of the same job into this one; later values win"""
+        for name in self.FIELDS:
+            value = getattr(other, name)
+            if value is not None:
+                setattr(self, name, value)
+        self.time = other.time
+        self.transition = self.transition or other.transition
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={value!r}" for name, value in self.fields().items())
+        return f"ProgressEvent({self.job_id!r}, {fields})"
+
+
+class ProgressBus:
+    """
+    Carries download progress from downloaders to whoever displays or stores it.
+
+    Downloaders publish events and return at once: publishing merges the
+    event into the job's pending one under a lock, without calling any
+    subscriber. A dispatcher thread hands subscribers everything pending
+    as one batch per interval, so a job reading thousands of chunks a
+    second costs subscribers at most one update per interval. A status
+    change wakes the dispatcher straight away and is never merged into the
+    next one: subscribers see every transition, in order.
+
+    Downloaders only know the bus, not the web app, so they can run where
+    the app is not imported; a subscriber can forward batches to another
+    process, where publish_event() puts them on that process's bus.
+    """
+
+    def __init__(self, interval=0.2):
+        """
+        Args:
+            interval (float): Seconds between deliveries of byte progress
+        """
+        self.logger = logging.getLogger(__name__)
+        self.interval = interval
+        self._subscribers = []
+        # Job ID to its merged, undelivered event
+        self._pending = OrderedDict()
+        # Events that must be delivered unmerged, because a status change followed them
+        self._ready = []
+        self._statuses = OrderedDict()
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        # Serializes deliveries, so subscribers see a job's events in order
+        self._deliver_lock = threading.Lock()
+        self._dispatcher = None
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, subscriber):
+        """
+        Add a subscriber.
+
+        Args:
+            subscriber (callable): Called as subscriber(events) with a list of
+                ProgressEvents from the dispatcher thread; at most one event per job
+                unless the job changed status in between
+        """
+        with self._lock:
+            self._subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def publish(self, job_id, status=None, progress=None, file_size=None, downloaded=None, speed=None,
+                filename=None, platform=None):
+        """
+        Report progress of a download job; fields left as None are unchanged.
+
+        Args:
+            job_id (str): The job; downloads without one (None) report nothing
+            status (str, optional): New status, e.g. 'downloading' or 'completed'
+            progress (float, optional): Percent done, 0-100
+            file_size (int, optional): Total size in bytes
+            downloaded (int, optional): Bytes downloaded so far
+            speed (float, optional): Bytes per second
+            filename (str, optional): Name of the file being written
+            platform (str, optional): Platform the URL belongs to
+        """
+        if job_id is None:
+            return
+        self.publish_event(ProgressEvent(job_id, status, progress, file_size, downloaded, speed,
+                                         filename, platform, time.time()))
+
+    def publish_event(self, event):
+        """Publish a ProgressEvent, e.g. one forwarded from another process"""
+        with self._lock:
+            self.published += 1
+            if event.status is not None and self._statuses.get(event.job_id) != event.status:
+                event.transition = True
+                self._statuses[event.job_id] = event.status
+                self._statuses.move_to_end(event.job_id)
+                while len(self._statuses) > MAX_TRACKED_JOBS:
+                    self._statuses.popitem(last=False)
+
+            pending = self._pending.get(event.job_id)
+            if pending is None:
+                self._pending[event.job_id] = event
+            elif event.transition and pending.status is not None:
+                # Keep the earlier transition as it was instead of overwriting it
+                self._ready.append(self._pending.pop(event.job_id))
+                self._pending[event.job_id] = event
+            else:
+                pending.merge(event)
+
+            if event.transition:
+                self._wake.notify()
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._run, name='progress-bus', daemon=True)
+                self._dispatcher.start()
+
+    def flush(self):
+        """Deliver everything pending now, from the calling thread"""
+        with self._deliver_lock:
+            with self._lock:
+                events, subscribers = self._take()
+            self._deliver(events, subscribers)
+
+    def _take(self):
+        # Caller must hold self._lock
+        events = self._ready + list(self._pending.values())
+        self._ready = []
+        self._pending = OrderedDict()
+        return events, list(self._subscribers)
+
+    def _run(self):
+        next_delivery = time.monotonic() + self.interval
+        while True:
+            with self._lock:
+                # Byte progress waits for the interval; a status change is delivered at once
+                self._wake.wait_for(
+                    lambda: self._ready or any(e.transition for e in self._pending.values()),
+                    max(next_delivery - time.monotonic(), 0)
+                )
+            with self._deliver_lock:
+                with self._lock:
+                    events, subscribers = self._take()
+                self._deliver(events, subscribers)
+            next_delivery = time.monotonic() + self.interval
+
+    def _deliver(self, events, subscribers):
+        if not events:
+            return
+        self.delivered += len(events)
+        for subscriber in subscribers:
+            try:
+                subscriber(events)
+            except Exception as e:
+                self.logger.warning(f"Progress subscriber {getattr(subscriber, '__name__', subscriber)} failed: {str(e)}")
+
+    def stats(self):
+        """Return how many events were published and how many reached subscribers after merging"""
+        with self._lock:
+            return {'published': self.published, 'delivered': self.delivered}
+
+
+class TqdmRenderer:
+    """A subscriber that draws a terminal progress bar per job"""
+
+    def __init__(self, file=None, leave=True):
+        """
+        Args:
+            file (file, optional): Where bars are drawn; defaults to stderr
+            leave (bool): Keep a finished job's bar on screen
+        """
+        self.file = file
+        self.leave = leave
+        self._bars = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, events):
+        with self._lock:
+            for event in events:
+                bar = self._bars.get(event.job_id)
+                if bar is None:
+                    # Nothing to draw until the download itself starts
+                    if event.finished or (event.filename is None and event.downloaded is None):
+                        continue
+                    bar = self._bars[event.job_id] = tqdm(
+                        desc=event.filename or event.job_id,
+                        total=event.file_size or None,
+                        unit='B',
+                        unit_scale=True,
+                        unit_divisor=1024,
+                        file=self.file or sys.stderr,
+                        leave=self.leave,
+                    )
+                if event.filename:
+                    bar.set_description(event.filename, refresh=False)
+                if event.file_size:
+                    bar.total = event.file_size
+                if event.downloaded is not None and event.downloaded >= bar.n:
+                    bar.update(event.downloaded - bar.n)
+                if event.finished:
+                    bar.close()
+                    del self._bars[event.job_id]
+
+    def close(self):
+        with self._lock:
+            for bar in self._bars.values():
+                bar.close()
+            self._bars.clear()
+
+
+# The process-wide bus downloaders publish to unless given another
+PROGRESS_BUS = ProgressBus()
@@ -0,0 +1,328 @@
+import re
+import time
+import logging
+import threading
+from urllib.parse import urlparse
+
+
+# Suffixes accepted by parse_rate, as in yt-dlp's --limit-rate
+RATE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+# Idle buckets are dropped once more than this many are held
+MAX_IDLE_BUCKETS = 256
+
+
+class TokenBucket:
+    """
+    A token bucket metering bytes, shared by every thread drawing from it.
+
+    Tokens accrue at rate bytes per second up to burst. A consumer reserves
+    the bytes it has just read and may run the bucket into debt; it is told
+    how long to wait until the debt is paid off. Later consumers inherit the
+    debt, so waiters are served in arrival order and no reader can starve
+    the others by asking often.
+    """
+
+    def __init__(self, rate=None, burst=None):
+        """
+        Args:
+            rate (float, optional): Bytes per second; None means unlimited
+            burst (float, optional): Bytes that may be taken at once after an idle spell;
+                defaults to one second's worth
+        """
+        self._lock = threading.Lock()
+        self.rate = None
+        self.burst = 0
+        self.tokens = 0
+        self.updated = time.monotonic()
+        self.consumed = 0
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate, burst=None):
+        """Change the rate; tokens and debt carry over, and a bucket that was unlimited starts full"""
+        with self._lock:
+            self._refill(time.monotonic())
+            unlimited = self.rate is None
+            self.rate = float(rate) if rate else None
+            self.burst = float(burst) if burst else (self.rate or 0)
+            self.tokens = self.burst if unlimited else min(self.tokens, self.burst)
+
+    def reserve(self, amount):
+        """
+        Take amount tokens.
+
+        Args:
+            amount (int): Bytes transferred
+
+        Returns:
+            float: Seconds the caller should wait before transferring more
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.consumed += amount
+            if self.rate is None:
+                return 0
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def _refill(self, now):
+        if self.rate is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class Throttle:
+    """
+    The buckets that apply to one transfer: global, its upstream host's and its job's.
+
+    Throttles of the same job take turns waiting, so a job reading over
+    several connections queues for the shared buckets once rather than once
+    per connection, and jobs get even shares however they download.
+    """
+
+    def __init__(self, limiter, host=None, job_id=None):
+        self.limiter = limiter
+        self.host = host
+        self.job_id = job_id
+        self._version = None
+        self._buckets = ()
+        self._turn = limiter.turn_lock(job_id)
+
+    @property
+    def buckets(self):
+        # Limits changed at runtime may have moved this transfer to other buckets
+        if self._version != self.limiter.version:
+            self._version = self.limiter.version
+            self._buckets = self.limiter.buckets_for(self.host, self.job_id)
+        return self._buckets
+
+    @property
+    def rate(self):
+        """The tightest rate that applies, in bytes per second, or None if unlimited"""
+        rates = [bucket.rate for bucket in self.buckets if bucket.rate]
+        return min(rates) if rates else None
+
+    @property
+    def chunk_limit(self):
+        """Largest read that keeps this transfer taking turns with the others, or None"""
+        rate = self.rate
+        return max(int(rate * self.limiter.quantum), 1024 * 16) if rate else None
+
+    def reserve(self, amount):
+        """Charge amount bytes to every bucket and return the seconds to wait"""
+        delay = 0
+        for bucket in self.buckets:
+            delay = max(delay, bucket.reserve(amount))
+        return delay
+
+    def wait(self, amount):
+        """Charge amount bytes and sleep until the transfer may continue"""
+        with self._turn:
+            delay = self.reserve(amount)
+            if delay > 0:
+                time.sleep(delay)
+
+
+class BandwidthLimiter:
+    """
+    Caps download throughput globally, per upstream host and per job.
+
+    Every transfer draws from the global bucket, the bucket of its host and
+    the bucket of its job, and waits for whichever is furthest in debt.
+    Limits can be changed while downloads run; transfers pick the new
+    buckets up on their next read.
+    """
+
+    def __init__(self, global_rate=None, job_rate=None, host_rate=None, host_rates=None, quantum=0.1):
+        """
+        Args:
+            global_rate (float, optional): Bytes per second across all downloads
+            job_rate (float, optional): Bytes per second for each job
+            host_rate (float, optional): Bytes per second for each upstream host
+            host_rates (dict, optional): Per-host overrides of host_rate, e.g.
+                {'cdn.example.com': 1048576}; subdomains share their parent's bucket
+            quantum (float): Seconds of transfer per read at the tightest rate; smaller
+                reads let many throttled jobs take turns evenly
+        """
+        self.logger = logging.getLogger(__name__)
+        self.quantum = quantum
+        self._lock = threading.Lock()
+        self._global = TokenBucket()
+        self._hosts = {}
+        self._jobs = {}
+        self._turns = {}
+        self.global_rate = None
+        self.job_rate = None
+        self.host_rate = None
+        self.host_rates = {}
+        self.job_rates = {}
+        # Bumped on every change of limits so throttles re-resolve their buckets
+        self.version = 0
+        self.set_limits(global_rate=global_rate, job_rate=job_rate, host_rate=host_rate,
+                        host_rates=host_rates or {})
+
+    def throttle(self, url=None, job_id=None):
+        """
+        Return the throttle for one transfer.
+
+        Args:
+            url (str, optional): The URL being downloaded; its host picks the host bucket
+            job_id (str, optional): The download job; its transfers share one bucket
+
+        Returns:
+            Throttle: Call wait(bytes) after every read
+        """
+        host = urlparse(url).hostname if url else None
+        return Throttle(self, host, job_id)
+
+    def set_limits(self, **limits):
+        """
+        Change limits at runtime; keys not passed are left as they are.
+
+        Args:
+            global_rate (float, optional): Bytes per second across all downloads
+            job_rate (float, optional): Default bytes per second for each job
+            host_rate (float, optional): Default bytes per second for each host
+            host_rates (dict, optional): Replaces the per-host limits
+            job_rates (dict, optional): Per-job limits to set; a None rate removes one
+        """
+        with self._lock:
+            if 'global_rate' in limits:
+                self.global_rate = limits['global_rate'] or None
+                self._global.set_rate(self.global_rate)
+            if 'job_rate' in limits:
+                self.job_rate = limits['job_rate'] or None
+            if 'host_rate' in limits:
+                self.host_rate = limits['host_rate'] or None
+            if 'host_rates' in limits:
+                self.host_rates = {host.lower(): rate for host, rate in limits['host_rates'].items() if rate}
+            for job_id, rate in (limits.get('job_rates') or {}).items():
+                if rate:
+                    self.job_rates[job_id] = rate
+                else:
+                    self.job_rates.pop(job_id, None)
+
+            # Existing buckets keep their debt but take the new rates
+            for key, bucket in self._hosts.items():
+                bucket.set_rate(self._host_rule(key)[1])
+            for job_id, bucket in self._jobs.items():
+                bucket.set_rate(self.job_rates.get(job_id, self.job_rate))
+            self.version += 1
+
+    def forget_job(self, job_id):
+        """Drop a finished job's bucket and limit"""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._turns.pop(job_id, None)
+            self.job_rates.pop(job_id, None)
+
+    def turn_lock(self, job_id):
+        """Return the lock a job's transfers hold while waiting; transfers without a job wait alone"""
+        if job_id is None:
+            return threading.Lock()
+        with self._lock:
+            return self._turns.setdefault(job_id, threading.Lock())
+
+    def buckets_for(self, host, job_id):
+        """Return the buckets a transfer from host for job_id draws from"""
+        with self._lock:
+            buckets = [self._global]
+            if host:
+                key, rate = self._host_rule(host.lower())
+                if rate:
+                    buckets.append(self._bucket(self._hosts, key, rate))
+            if job_id is not None:
+                rate = self.job_rates.get(job_id, self.job_rate)
+                if rate:
+                    buckets.append(self._bucket(self._jobs, job_id, rate))
+        return tuple(buckets)
+
+    def limits(self):
+        """Return the configured limits in bytes per second (None is unlimited)"""
+        with self._lock:
+            return {
+                'global': self.global_rate,
+                'per_job': self.job_rate,
+                'per_host': self.host_rate,
+                'hosts': dict(self.host_rates),
+                'jobs': dict(self.job_rates),
+            }
+
+    def stats(self):
+        """Return the bytes metered globally, per host and per job"""
+        with self._lock:
+            return {
+                'bytes': self._global.consumed,
+                'hosts': {key: bucket.consumed for key, bucket in self._hosts.items()},
+                'jobs': {job_id: bucket.consumed for job_id, bucket in self._jobs.items()},
+            }
+
+    def _host_rule(self, host):
+        """Return the bucket key and rate for a host: its configured suffix, or the host itself"""
+        labels = host.split('.')
+        for i in range(len(labels)):
+            suffix = '.'.join(labels[i:])
+            if suffix in self.host_rates:
+                return suffix, self.host_rates[suffix]
+        return host, self.host_rate
+
+    def _bucket(self, buckets, key, rate):
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= MAX_IDLE_BUCKETS:
+                self._prune(buckets)
+            bucket = buckets[key] = TokenBucket(rate)
+        return bucket
+
+    def _prune(self, buckets):
+        # A bucket idle this long has no debt left to enforce
+        cutoff = time.monotonic() - 60
+        for key in [key for key, bucket in buckets.items() if bucket.updated < cutoff]:
+            del buckets[key]
+
+
+def parse_rate(value):
+    """
+    Parse a rate such as "500K", "2M" or "1.5G" (bytes per second).
+
+    Args:
+        value (str or int): The rate; a plain number is bytes per second
+
+    Returns:
+        float or None: Bytes per second, or None for empty, zero or unlimited
+
+    Raises:
+        ValueError: If the value is not a rate
+    """
+    if value is None or isinstance(value, (int, float)):
+        return float(value) if value else None
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kmg]?)(?:i?b)?(?:/s)?\s*', value.lower())
+    if not match:
+        if value.strip().lower() in ('', 'none', 'unlimited'):
+            return None
+        raise ValueError(f"Invalid rate: {value}")
+    rate = float(match.group(1)) * RATE_UNITS[match.group(2)]
+    return rate or None
+
+
+def parse_host_rates(value):
+    """
+    Parse a per-host rate setting such as "cdn.example.com=5M,example.org=500K".
+
+    Args:
+        value (str): Comma-separated host=rate pairs
+
+    Returns:
+        dict: Host to bytes per second
+    """
+    rates = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        host, rate = item.split('=', 1)
+        try:
+            rates[host.strip().lower()] = parse_rate(rate)
+        except ValueError:
+            logging.getLogger(__name__).warning(f"Ignoring invalid host rate: {item}")
+    return {host: rate for host, rate in rates.items() if rate}
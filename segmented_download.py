@@ -0,0 +1,313 @@
+import os
+import time
+import logging
+import http.client
+import threading
+import requests
+from stream_reader import AdaptiveReader
+from tracing import TRACER
+
+
+class RangeNotSupportedError(Exception):
+    """Raised when the server ignores byte-range requests"""
+
+
+class Segment:
+    """A byte range [start, end) of the file and how far it has been written"""
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        # Next offset to be claimed by the worker reading this range
+        self.position = start
+        # Bytes [start, written) are on disk
+        self.written = start
+        # Whether a worker is currently fetching this segment
+        self.active = False
+
+    @property
+    def remaining(self):
+        return max(self.end - self.position, 0)
+
+
+class SegmentedDownloader:
+    """
+    Download a file over several parallel HTTP connections.
+
+    The file is split into byte ranges that are fetched concurrently and
+    written at their offsets into a preallocated file. When a connection
+    finishes its range it takes over the second half of whichever range has
+    the most bytes left, so a slow connection does not hold up the download.
+    """
+
+    def __init__(self, session, timeout=30, connections=4, min_segment_size=1024 * 1024,
+                 chunk_size=1024 * 64, max_chunk_size=1024 * 1024 * 4, max_segment_retries=3, throttle=None):
+        """
+        Args:
+            session (requests.Session): Session used for every range request
+            timeout (int): Timeout in seconds for HTTP requests
+            connections (int): Number of parallel connections
+            min_segment_size (int): Ranges are never split below this size
+            chunk_size (int): Bytes first read from a connection at a time
+            max_chunk_size (int): Largest read; reads grow towards it with the connection's throughput
+            max_segment_retries (int): Retries per range on connection errors
+            throttle (rate_limiter.Throttle, optional): Bandwidth limits shared by all connections
+        """
+        self.logger = logging.getLogger(__name__)
+        self.session = session
+        self.timeout = timeout
+        self.connections = connections
+        self.min_segment_size = min_segment_size
+        self.chunk_size = chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.max_segment_retries = max_segment_retries
+        self.throttle = throttle
+
+    def probe(self, url, headers=None):
+        """
+        Check whether a URL can be downloaded in ranges.
+
+        Args:
+            url (str): The URL of the file
+            headers (dict, optional): Headers to send with the probe
+
+        Returns:
+            dict: supports_ranges, total_size, etag and last_modified of the file
+        """
+        probe_headers = dict(headers or {})
+        probe_headers.pop('Range', None)
+        response = self.session.head(url, headers=probe_headers, timeout=self.timeout, allow_redirects=True)
+        if response.status_code >= 400:
+            return {'supports_ranges': False, 'total_size': 0, 'etag': None, 'last_modified': None}
+
+        total_size = int(response.headers.get('Content-Length', 0) or 0)
+        accept_ranges = response.headers.get('Accept-Ranges', '').lower()
+        # Compressed transfers report the encoded length, which does not match byte offsets
+        encoded = response.headers.get('Content-Encoding', 'identity').lower() not in ('', 'identity')
+        return {
+            'supports_ranges': accept_ranges == 'bytes' and total_size > 0 and not encoded,
+            'total_size': total_size,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+
+    def download(self, url, filepath, total_size, headers=None, progress_callback=None, update_interval=0.2,
+                 completed_ranges=None, checkpoint_callback=None, checkpoint_interval=1.0):
+        """
+        Download a file in parallel byte ranges.
+
+        Args:
+            url (str): The URL of the file
+            filepath (str): The path to save the file
+            total_size (int): The file size reported by probe()
+            headers (dict, optional): Headers to send with each range request
+            progress_callback (callable, optional): Called as progress_callback(downloaded, total_size)
+                from the calling thread every update_interval seconds
+            update_interval (float): Seconds between progress callbacks
+            completed_ranges (list, optional): [start, end) ranges already present in filepath;
+                only the rest of the file is fetched
+            checkpoint_callback (callable, optional): Called as checkpoint_callback(ranges) with the
+                [start, end) ranges written so far, every checkpoint_interval seconds and on exit
+            checkpoint_interval (float): Seconds between checkpoint callbacks
+
+        Returns:
+            int: The number of bytes in the file that are downloaded, including completed_ranges
+
+        Raises:
+            RangeNotSupportedError: If the server answers a range request with the full file
+        """
+        completed_ranges = list(completed_ranges or [])
+        segments = self._plan_segments(total_size, completed_ranges)
+        state = {
+            'segments': segments,
+            'downloaded': sum(end - start for start, end in completed_ranges),
+            'error': None,
+            'lock': threading.Lock(),
+            'stop': threading.Event(),
+        }
+
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+        if not completed_ranges:
+            flags |= os.O_TRUNC
+        fd = os.open(filepath, flags, 0o644)
+        last_checkpoint = time.time()
+        try:
+            if os.fstat(fd).st_size < total_size:
+                self._preallocate(fd, total_size)
+            writer = _OffsetWriter(fd)
+
+            workers = [
+                threading.Thread(
+                    target=self._worker,
+                    args=(url, headers or {}, writer, state),
+                    name=f"segment-worker-{i}",
+                    daemon=True
+                )
+                for i in range(min(self.connections, len(segments)))
+            ]
+            for worker in workers:
+                worker.start()
+
+            while any(worker.is_alive() for worker in workers):
+                for worker in workers:
+                    worker.join(timeout=update_interval / len(workers))
+                if progress_callback:
+                    progress_callback(state['downloaded'], total_size)
+                if checkpoint_callback and time.time() - last_checkpoint >= checkpoint_interval:
+                    checkpoint_callback(self._written_ranges(state, completed_ranges))
+                    last_checkpoint = time.time()
+
+            if state['error'] is not None:
+                raise state['error']
+
+            with TRACER.span('fsync'):
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+            if checkpoint_callback:
+                checkpoint_callback(self._written_ranges(state, completed_ranges))
+
+        if progress_callback:
+            progress_callback(state['downloaded'], total_size)
+        return state['downloaded']
+
+    def _plan_segments(self, total_size, completed_ranges):
+        """Split the bytes still missing into roughly one range per connection"""
+        missing = []
+        position = 0
+        for start, end in sorted(completed_ranges):
+            if start > position:
+                missing.append((position, start))
+            position = max(position, end)
+        if position < total_size:
+            missing.append((position, total_size))
+
+        remaining = sum(end - start for start, end in missing)
+        target_size = max(self.min_segment_size, -(-remaining // self.connections)) if remaining else 0
+
+        segments = []
+        for start, end in missing:
+            count = max(1, round((end - start) / target_size))
+            segment_size = (end - start) // count
+            for i in range(count):
+                segment_start = start + i * segment_size
+                segment_end = end if i == count - 1 else segment_start + segment_size
+                segments.append(Segment(segment_start, segment_end))
+        return segments
+
+    def _written_ranges(self, state, completed_ranges):
+        """Return every [start, end) range known to be on disk"""
+        with state['lock']:
+            written = [(s.start, s.written) for s in state['segments'] if s.written > s.start]
+        return list(completed_ranges) + written
+
+    def _preallocate(self, fd, total_size):
+        """Reserve disk space for the whole file up front"""
+        if hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(fd, 0, total_size)
+                return
+            except OSError:
+                # Not every filesystem supports fallocate
+                pass
+        os.ftruncate(fd, total_size)
+
+    def _next_segment(self, state):
+        """Pick an idle range, or split the largest active range in two"""
+        with state['lock']:
+            for segment in state['segments']:
+                if not segment.active and segment.remaining > 0:
+                    segment.active = True
+                    return segment
+
+            # Steal the second half of the range that is furthest behind
+            laggard = max(state['segments'], key=lambda s: s.remaining if s.active else 0)
+            if laggard.active and laggard.remaining >= 2 * self.min_segment_size:
+                split = laggard.position + laggard.remaining // 2
+                stolen = Segment(split, laggard.end)
+                stolen.active = True
+                laggard.end = split
+                state['segments'].append(stolen)
+                self.logger.debug(f"Split range at {split}, {stolen.remaining} bytes reassigned")
+                return stolen
+
+        return None
+
+    def _worker(self, url, headers, writer, state):
+        try:
+            while not state['stop'].is_set():
+                segment = self._next_segment(state)
+                if segment is None:
+                    return
+                self._fetch_segment(url, headers, writer, segment, state)
+        except Exception as e:
+            with state['lock']:
+                if state['error'] is None:
+                    state['error'] = e
+            state['stop'].set()
+
+    def _fetch_segment(self, url, headers, writer, segment, state):
+        """Download one range, retrying from the last written byte on connection errors"""
+        attempts = 0
+        while segment.remaining > 0 and not state['stop'].is_set():
+            range_headers = dict(headers)
+            range_headers['Range'] = f"bytes={segment.position}-{segment.end - 1}"
+            try:
+                with self.session.get(url, headers=range_headers, stream=True, timeout=self.timeout) as response:
+                    if response.status_code != 206:
+                        if response.status_code == 200:
+                            raise RangeNotSupportedError("Server ignored the Range header")
+                        response.raise_for_status()
+
+                    reader = AdaptiveReader(response, min_chunk=self.chunk_size, max_chunk=self.max_chunk_size,
+                                            throttle=self.throttle)
+                    for data in reader:
+                        with state['lock']:
+                            # The range may have shrunk because another worker stole its tail
+                            data = data[:segment.end - segment.position]
+                            offset = segment.position
+                            segment.position += len(data)
+                            state['downloaded'] += len(data)
+                        if data:
+                            writer.write(data, offset)
+                            # Only this worker writes this range, in order
+                            segment.written = offset + len(data)
+                        if segment.remaining == 0 or state['stop'].is_set():
+                            break
+                    else:
+                        # A response that ends before its range does counts as a failed attempt too
+                        if segment.remaining > 0 and not state['stop'].is_set():
+                            raise requests.exceptions.ChunkedEncodingError(
+                                http.client.IncompleteRead(b'', segment.remaining)
+                            )
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout) as e:
+                attempts += 1
+                if attempts > self.max_segment_retries:
+                    raise
+                self.logger.warning(f"Range {segment.position}-{segment.end - 1} failed, "
+                                    f"retrying ({attempts}/{self.max_segment_retries}): {str(e)}")
+                time.sleep(1)
+
+        with state['lock']:
+            segment.active = False
+
+
+class _OffsetWriter:
+    """Write bytes at absolute offsets, using os.pwrite where available"""
+
+    def __init__(self, fd):
+        self.fd = fd
+        self._lock = None if hasattr(os, 'pwrite') else threading.Lock()
+
+    def write(self, data, offset):
+        if self._lock is None:
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(self.fd, view, offset)
+                view = view[written:]
+                offset += written
+        else:
+            with self._lock:
+                os.lseek(self.fd, offset, os.SEEK_SET)
+                os.write(self.fd, data)
@@ -1,11 +1,20 @@
 import os
 import re
+import copy
+import time
 import logging
 import tempfile
 import shutil
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import parse_qs, urlparse
 from datetime import datetime
 
+from platforms import PlatformRegistry
+from ydl_pool import YoutubeDLPool, compact_info
+from tracing import TRACER
+from progress_bus import PROGRESS_BUS
+from metrics import (EXTRACTION_SECONDS, TIME_TO_FIRST_BYTE_SECONDS, DOWNLOADER_ATTEMPTS, FALLBACKS,
+                     observe_transfer)
+
 # Import specialized downloader libraries
 try:
     import pytube
@@ -23,6 +32,46 @@ except ImportError:
     YoutubeDL = None
 
 
+# yt-dlp option profiles; instances are pooled per profile and reused across calls
+YDL_PROFILES = {
+    # Lists a playlist's entries without resolving each video
+    'playlist': {
+        'quiet': True,
+        'no_warnings': True,
+        'skip_download': True,
+        'extract_flat': 'in_playlist',
+    },
+    # Extracts the direct media URL only
+    'extract': {
+        'format': 'best[ext=mp4]/best',
+        'quiet': True,
+        'no_warnings': True,
+        'noplaylist': True,
+        'nocheckcertificate': True,
+        'skip_download': True,  # Skip download, just get the info
+        'geo_bypass': True,     # Try to bypass geo restrictions
+        'cookiefile': None,     # Don't use cookies
+        'socket_timeout': 10,   # 10 seconds timeout
+        'retries': 3            # Retry 3 times
+    },
+    # Downloads the video; the output template is set per download
+    'download': {
+        'format': 'best[ext=mp4]/best',  # Prefer MP4 if available
+        'quiet': True,
+        'no_warnings': True,
+        'ignoreerrors': False,
+        'nooverwrites': True,
+        'noplaylist': True,
+        'nocheckcertificate': True,
+        'prefer_ffmpeg': True,
+    },
+}
+
+
+class StaleExtractionError(Exception):
+    """A cached yt-dlp extraction that could no longer be downloaded"""
+
+
 class SocialMediaDownloader:
     """
     A class to download videos from various social media platforms.
@@ -37,6 +86,30 @@ class SocialMediaDownloader:
         self.has_instaloader = instaloader is not None
         self.has_yt_dlp = YoutubeDL is not None
         
+        # Optional ExtractionCache so repeated lookups of a URL skip extraction
+        self.extraction_cache = None
+        
+        # Optional BandwidthLimiter shared with the generic downloader
+        self.rate_limiter = None
+        
+        # Where download progress is published for the job store, metrics and progress bars
+        self.progress_bus = PROGRESS_BUS
+        
+        # Warm YoutubeDL instances, reused instead of built for every call
+        self.ydl_pool = YoutubeDLPool(YDL_PROFILES) if self.has_yt_dlp else None
+        
+        # Optional ExtractionPool that runs yt-dlp extraction in worker processes
+        self.extraction_pool = None
+        
+        # Supported platforms by host, including any added through entry points
+        self.platforms = PlatformRegistry.default()
+        # Built-in platforms with their own download path; the rest use yt-dlp
+        self._handlers = {
+            'youtube': self._download_youtube,
+            'instagram': self._download_instagram,
+            'twitter': self._download_twitter,
+        }
+        
         # Initialize instaloader if available
         if self.has_instaloader:
             self.insta = instaloader.Instaloader(
@@ -59,38 +132,19 @@ class SocialMediaDownloader:
         Returns:
             tuple: (is_supported, platform_name)
         """
-        domain = urlparse(url).netloc.lower()
-        
-        if 'youtube.com' in domain or 'youtu.be' in domain:
-            return True, 'youtube'
-        elif 'instagram.com' in domain:
-            return True, 'instagram'
-        elif 'twitter.com' in domain or 'x.com' in domain:
-            return True, 'twitter'
-        elif 'facebook.com' in domain or 'fb.com' in domain:
-            return True, 'facebook'
-        elif 'tiktok.com' in domain:
-            return True, 'tiktok'
-        elif 'reddit.com' in domain:
-            return True, 'reddit'
-        elif 'linkedin.com' in domain:
-            return True, 'linkedin'
-        elif 'vimeo.com' in domain:
-            return True, 'vimeo'
-        elif 'dailymotion.com' in domain:
-            return True, 'dailymotion'
-        elif 'twitch.tv' in domain:
-            return True, 'twitch'
-            
-        return False, None
+        platform = self.platforms.match_url(url)
+        if platform is None:
+            return False, None
+        return True, platform.name
     
-    def download_video(self, url, download_path='downloads'):
+    def download_video(self, url, download_path='downloads', job_id=None):
         """
         Download a video from a social media platform.
         
         Args:
             url (str): The URL of the social media post containing a video
             download_path (str): The path to save the downloaded video
+            job_id (str, optional): The download job to report progress to
             
         Returns:
             dict: Information about the download including success status
@@ -112,15 +166,13 @@ class SocialMediaDownloader:
         
         # Call the appropriate platform-specific downloader
         try:
-            if platform == 'youtube':
-                return self._download_youtube(url, download_path)
-            elif platform == 'instagram':
-                return self._download_instagram(url, download_path)
-            elif platform in ['twitter', 'x']:
-                return self._download_twitter(url, download_path)
-            else:
-                # Use yt-dlp for other platforms - it supports many sites
-                return self._download_with_yt_dlp(url, download_path, platform)
+            handler = self.platforms.get(platform).handler
+            if handler is not None:
+                return handler(self, url, download_path, job_id)
+            if platform in self._handlers:
+                return self._handlers[platform](url, download_path, job_id)
+            # Use yt-dlp for other platforms - it supports many sites
+            return self._download_with_yt_dlp(url, download_path, platform, job_id)
                 
         except Exception as e:
             self.logger.exception(f"Error downloading from {platform}: {str(e)}")
@@ -129,27 +181,32 @@ class SocialMediaDownloader:
                 'error': f"Error downloading from {platform}: {str(e)}"
             }
     
-    def _download_youtube(self, url, download_path):
+    def _download_youtube(self, url, download_path, job_id=None):
         """Download a video from YouTube."""
         # Try first with pytube
         if self.has_pytube:
+            DOWNLOADER_ATTEMPTS.inc(platform='youtube', downloader='pytube')
+            start_time = time.time()
             try:
                 self.logger.info(f"Downloading YouTube video with pytube: {url}")
-                yt = pytube.YouTube(url)
-                stream = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc().first()
-                
-                if not stream:
-                    # Try getting any video stream if progressive not available
-                    stream = yt.streams.filter(file_extension='mp4').order_by('resolution').desc().first()
+                with TRACER.span('pytube.extract', url=url):
+                    yt = pytube.YouTube(url)
+                    stream = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc().first()
+                    
+                    if not stream:
+                        # Try getting any video stream if progressive not available
+                        stream = yt.streams.filter(file_extension='mp4').order_by('resolution').desc().first()
                 
                 if stream:
                     # Generate a unique filename
-                    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+                    timestamp = datetime.now().strftime('%Y%m%d%H%M%S_%f')
                     filename = f"youtube_{timestamp}.mp4"
                     filepath = os.path.join(download_path, filename)
                     
                     # Download the video
-                    stream.download(output_path=download_path, filename=filename)
+                    with TRACER.span('pytube.download', url=url):
+                        stream.download(output_path=download_path, filename=filename)
+                    observe_transfer('youtube', 'pytube', os.path.getsize(filepath), time.time() - start_time)
                     
                     return {
                         'success': True,
@@ -161,16 +218,18 @@ class SocialMediaDownloader:
                     }
             except Exception as e:
                 self.logger.warning(f"Pytube failed, trying yt-dlp: {str(e)}")
+            FALLBACKS.inc(platform='youtube', from_downloader='pytube', to_downloader='yt-dlp')
                 
         # Fall back to yt-dlp
-        return self._download_with_yt_dlp(url, download_path, 'youtube')
+        return self._download_with_yt_dlp(url, download_path, 'youtube', job_id)
     
-    def _download_instagram(self, url, download_path):
+    def _download_instagram(self, url, download_path, job_id=None):
         """Download a video from Instagram."""
         if not self.has_instaloader:
             self.logger.warning("Instaloader not available, falling back to yt-dlp")
-            return self._download_with_yt_dlp(url, download_path, 'instagram')
+            return self._download_with_yt_dlp(url, download_path, 'instagram', job_id)
         
+        DOWNLOADER_ATTEMPTS.inc(platform='instagram', downloader='instaloader')
         try:
             self.logger.info(f"Downloading Instagram video with instaloader: {url}")
             
@@ -191,13 +250,15 @@ class SocialMediaDownloader:
             os.makedirs(temp_download_dir, exist_ok=True)
             
             # Get the post and download it
-            post = instaloader.Post.from_shortcode(self.insta.context, shortcode)
+            with TRACER.span('instaloader.extract', shortcode=shortcode):
+                post = instaloader.Post.from_shortcode(self.insta.context, shortcode)
             
             if not post.is_video:
                 raise ValueError("Instagram post does not contain a video")
                 
             # Download video to temp directory
-            self.insta.download_post(post, temp_download_dir)
+            with TRACER.span('instaloader.download', shortcode=shortcode):
+                self.insta.download_post(post, temp_download_dir)
             
             # Find the downloaded video file (should be the only .mp4 file)
             video_files = [f for f in os.listdir(temp_download_dir) if f.endswith('.mp4')]
@@ -206,7 +267,7 @@ class SocialMediaDownloader:
                 raise FileNotFoundError("Downloaded video file not found")
                 
             # Generate a unique filename
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+            timestamp = datetime.now().strftime('%Y%m%d%H%M%S_%f')
             filename = f"instagram_{timestamp}.mp4"
             final_path = os.path.join(download_path, filename)
             
@@ -226,12 +287,47 @@ class SocialMediaDownloader:
             
         except Exception as e:
             self.logger.warning(f"Instaloader failed, trying yt-dlp: {str(e)}")
-            return self._download_with_yt_dlp(url, download_path, 'instagram')
+            FALLBACKS.inc(platform='instagram', from_downloader='instaloader', to_downloader='yt-dlp')
+            return self._download_with_yt_dlp(url, download_path, 'instagram', job_id)
     
-    def _download_twitter(self, url, download_path):
+    def _download_twitter(self, url, download_path, job_id=None):
         """Download a video from Twitter/X."""
         # Twitter API requires auth, so we'll use yt-dlp directly
-        return self._download_with_yt_dlp(url, download_path, 'twitter')
+        return self._download_with_yt_dlp(url, download_path, 'twitter', job_id)
+    
+    def expand_playlist(self, url):
+        """
+        List the videos behind a playlist or channel URL.
+        
+        Uses yt-dlp's flat extraction, which reads the playlist pages only and
+        does not resolve each video, so large playlists expand quickly.
+        
+        Args:
+            url (str): A playlist, channel or single video URL
+            
+        Returns:
+            list: The video page URLs, or [url] if the URL is not a playlist
+        """
+        is_social_media, _ = self.is_social_media_url(url)
+        if not is_social_media or not self.has_yt_dlp:
+            return [url]
+        
+        with self.ydl_pool.checkout('playlist') as ydl:
+            info = ydl.extract_info(url, download=False)
+        
+        if not info or info.get('_type') not in ('playlist', 'multi_video'):
+            return [url]
+        
+        urls = []
+        for entry in info.get('entries') or []:
+            if not entry:
+                continue
+            entry_url = entry.get('webpage_url') or entry.get('url')
+            if entry_url and entry_url.startswith(('http://', 'https://')):
+                urls.append(entry_url)
+        
+        self.logger.info(f"Expanded playlist {url} into {len(urls)} videos")
+        return urls
     
     def get_direct_video_url(self, url, platform):
         """
@@ -244,94 +340,184 @@ class SocialMediaDownloader:
         Returns:
             str or None: The direct video URL if found, None otherwise
         """
+        start_time = time.time()
+        direct_url, strategy = self._extract_direct_url(url, platform)
+        EXTRACTION_SECONDS.observe(time.time() - start_time, platform=platform, strategy=strategy)
+        return direct_url
+    
+    def _extract_direct_url(self, url, platform):
+        """Extract the direct video URL; returns it (or None) and the strategy that found it"""
         if not self.has_yt_dlp:
             self.logger.error("yt-dlp not available for URL extraction")
-            return None
+            return None, 'none'
         
         self.logger.info(f"Extracting direct URL from {platform}: {url}")
         
+        if self.extraction_cache is not None:
+            cached = self.extraction_cache.get('direct_url', url)
+            if cached:
+                self.logger.info(f"Using cached direct URL for {url}")
+                return cached['direct_url'], 'cache'
+            
+            # A recent download or lookup may already have extracted this URL
+            cached_info = self.extraction_cache.get('ytdlp_info', url)
+            if cached_info:
+                direct_url = self._direct_url_from_info(cached_info)
+                if direct_url:
+                    return direct_url, 'cache'
+        
         try:
             # Try platform-specific extraction for YouTube first if pytube is available
             if platform == 'youtube' and self.has_pytube:
+                DOWNLOADER_ATTEMPTS.inc(platform=platform, downloader='pytube')
                 try:
                     self.logger.info(f"Attempting to extract YouTube URL with pytube: {url}")
-                    yt = pytube.YouTube(url)
-                    stream = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc().first()
+                    with TRACER.span('pytube.extract', url=url):
+                        yt = pytube.YouTube(url)
+                        stream = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc().first()
                     
                     if stream and stream.url:
                         self.logger.info(f"Successfully extracted YouTube URL with pytube")
-                        return stream.url
+                        self._cache_direct_url(url, stream.url)
+                        return stream.url, 'pytube'
                 except Exception as pytube_err:
                     self.logger.warning(f"Failed to extract with pytube: {str(pytube_err)}")
-            
-            # Configure yt-dlp options for URL extraction only
-            ydl_opts = {
-                'format': 'best[ext=mp4]/best',
-                'quiet': True,
-                'no_warnings': True,
-                'noplaylist': True,
-                'nocheckcertificate': True,
-                'skip_download': True,  # Skip download, just get the info
-                'geo_bypass': True,     # Try to bypass geo restrictions
-                'cookiefile': None,     # Don't use cookies
-                'socket_timeout': 10,   # 10 seconds timeout
-                'retries': 3            # Retry 3 times
-            }
+                FALLBACKS.inc(platform=platform, from_downloader='pytube', to_downloader='yt-dlp')
             
             self.logger.info(f"Extracting URL with yt-dlp for {platform}")
-            with YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                
-                # Check if we have direct URL info
-                if info.get('url'):
-                    self.logger.info(f"Found direct URL in info['url']")
-                    return info['url']
-                elif info.get('requested_formats') and len(info['requested_formats']) > 0:
-                    # Get the best format
-                    best_url = info['requested_formats'][0]['url']
-                    self.logger.info(f"Found URL in requested_formats")
-                    return best_url
-                elif info.get('formats') and len(info['formats']) > 0:
-                    # Find the best video format (giving preference to formats with both audio and video)
-                    best_format = None
-                    max_width = 0
-                    
-                    # First try to get formats with both audio and video
-                    for fmt in info['formats']:
-                        if fmt.get('vcodec') != 'none' and fmt.get('acodec') != 'none':
-                            width = fmt.get('width', 0)
-                            if width > max_width:
-                                max_width = width
-                                best_format = fmt
-                    
-                    # If no combined format found, just get the best video format
-                    if not best_format:
-                        for fmt in info['formats']:
-                            if fmt.get('vcodec') != 'none':
-                                width = fmt.get('width', 0)
-                                if width > max_width:
-                                    max_width = width
-                                    best_format = fmt
-                    
-                    if best_format and best_format.get('url'):
-                        self.logger.info(f"Found best format with width {max_width}")
-                        return best_format['url']
+            DOWNLOADER_ATTEMPTS.inc(platform=platform, downloader='yt-dlp')
+            if self.extraction_pool is not None:
+                # Only the compacted info dict comes back from the worker process
+                with TRACER.span('ytdlp.extract_info', url=url, download=False, pooled=True):
+                    info = self.extraction_pool.extract_info(url, 'extract')
+                self._cache_info(url, info, compacted=True)
+            else:
+                with self.ydl_pool.checkout('extract') as ydl:
+                    with TRACER.span('ytdlp.extract_info', url=url, download=False):
+                        info = ydl.extract_info(url, download=False)
+                self._cache_info(url, info)
+            
+            direct_url = self._direct_url_from_info(info) if info else None
+            if direct_url:
+                self._cache_direct_url(url, direct_url)
+                return direct_url, 'yt-dlp'
             
             self.logger.warning(f"Could not extract direct URL from {platform}")
-            return None
+            return None, 'none'
             
         except Exception as e:
             self.logger.exception(f"Error extracting direct URL from {platform}: {str(e)}")
             # Print full traceback for debugging
             import traceback
             traceback.print_exc()
-            return None
+            return None, 'none'
 
-    def _download_with_yt_dlp(self, url, download_path, platform):
-        """Use yt-dlp to download videos from various platforms."""
-        from app import update_download_progress
-        import time
+    def _direct_url_from_info(self, info):
+        """
+        Pick the best direct media URL from a yt-dlp info dict.
         
+        Args:
+            info (dict): The info dict returned by extract_info
+            
+        Returns:
+            str or None: The direct video URL if found, None otherwise
+        """
+        # Check if we have direct URL info
+        if info.get('url'):
+            self.logger.info(f"Found direct URL in info['url']")
+            return info['url']
+        elif info.get('requested_formats') and len(info['requested_formats']) > 0:
+            # Get the best format
+            best_url = info['requested_formats'][0]['url']
+            self.logger.info(f"Found URL in requested_formats")
+            return best_url
+        elif info.get('formats') and len(info['formats']) > 0:
+            # Find the best video format (giving preference to formats with both audio and video)
+            best_format = None
+            max_width = 0
+            
+            # First try to get formats with both audio and video
+            for fmt in info['formats']:
+                if fmt.get('vcodec') != 'none' and fmt.get('acodec') != 'none':
+                    width = fmt.get('width', 0)
+                    if width > max_width:
+                        max_width = width
+                        best_format = fmt
+            
+            # If no combined format found, just get the best video format
+            if not best_format:
+                for fmt in info['formats']:
+                    if fmt.get('vcodec') != 'none':
+                        width = fmt.get('width', 0)
+                        if width > max_width:
+                            max_width = width
+                            best_format = fmt
+            
+            if best_format and best_format.get('url'):
+                self.logger.info(f"Found best format with width {max_width}")
+                return best_format['url']
+        
+        return None
+    
+    def _cache_direct_url(self, url, direct_url):
+        """Remember a direct media URL until it is due to expire."""
+        if self.extraction_cache is not None:
+            self.extraction_cache.set('direct_url', url, {'direct_url': direct_url}, media_url=direct_url)
+    
+    def _cache_info(self, url, info, compacted=False):
+        """Remember a yt-dlp info dict so later lookups and downloads can skip extraction."""
+        if self.extraction_cache is None or not info:
+            return
+        
+        if not compacted:
+            info = compact_info(info)
+        formats = info.get('requested_formats') or [info]
+        self.extraction_cache.set('ytdlp_info', url, info, media_url=formats[0].get('url'))
+
+    def _download_cached_info(self, ydl, url):
+        """
+        Download using a cached info dict instead of extracting the page again.
+        
+        Returns:
+            dict or None: The processed info dict, or None if nothing was cached
+        
+        Raises:
+            StaleExtractionError: If downloading from the cached info failed; the
+                instance may hold state from the half-processed download
+        """
+        if self.extraction_cache is None:
+            return None
+        
+        cached_info = self.extraction_cache.get('ytdlp_info', url)
+        if not cached_info:
+            return None
+        
+        try:
+            self.logger.info(f"Downloading from cached extraction of {url}")
+            # yt-dlp mutates the info dict while processing it
+            return ydl.process_ie_result(copy.deepcopy(cached_info), download=True)
+        except Exception as e:
+            # Signed media URLs can be revoked before their stated expiry
+            self.extraction_cache.invalidate('ytdlp_info', url)
+            self.extraction_cache.invalidate('direct_url', url)
+            raise StaleExtractionError(str(e)) from e
+    
+    def _download_pooled_info(self, ydl, url):
+        """
+        Extract in the extraction pool, then download from the result in this thread.
+        
+        Returns:
+            dict or None: The processed info dict, or None if nothing was extracted
+        """
+        info = self.extraction_pool.extract_info(url, 'extract')
+        if not info:
+            return None
+        self._cache_info(url, info, compacted=True)
+        # yt-dlp mutates the info dict while processing it
+        return ydl.process_ie_result(copy.deepcopy(info), download=True)
+    
+    def _download_with_yt_dlp(self, url, download_path, platform, job_id=None):
+        """Use yt-dlp to download videos from various platforms."""
         if not self.has_yt_dlp:
             self.logger.error("yt-dlp not available")
             return {
@@ -340,14 +526,16 @@ class SocialMediaDownloader:
             }
             
         self.logger.info(f"Downloading {platform} video with yt-dlp: {url}")
+        DOWNLOADER_ATTEMPTS.inc(platform=platform, downloader='yt-dlp')
         
         # Generate a unique filename
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S_%f')
         filename = f"{platform}_{timestamp}.%(ext)s"
         filepath_template = os.path.join(download_path, filename)
         
         # Initialize download progress tracking
-        update_download_progress(
+        self.progress_bus.publish(
+            job_id,
             status='downloading',
             progress=0,
             file_size=0,
@@ -360,94 +548,107 @@ class SocialMediaDownloader:
         # Start time for speed calculation
         start_time = time.time()
         
+        # Bytes yt-dlp downloads are charged to the same limits as generic downloads
+        meter = {
+            'throttle': self.rate_limiter.throttle(url, job_id) if self.rate_limiter is not None else None,
+            'bytes': 0,
+            'ydl': None,
+            # When the first bytes of the media arrived, after extraction
+            'first_byte_time': None,
+        }
+        
         # Custom progress hook to update download progress
         def yt_dlp_progress_hook(d):
             if d['status'] == 'downloading':
-                # Get file size if available
-                if d.get('total_bytes'):
-                    total_bytes = d['total_bytes']
-                    update_download_progress(file_size=total_bytes)
-                elif d.get('total_bytes_estimate'):
-                    total_bytes = d['total_bytes_estimate']
-                    update_download_progress(file_size=total_bytes)
+                if meter['first_byte_time'] is None and d.get('downloaded_bytes'):
+                    meter['first_byte_time'] = time.time()
+                    TIME_TO_FIRST_BYTE_SECONDS.observe(d.get('elapsed') or 0, platform=platform, engine='yt-dlp')
+                if meter['throttle'] is not None:
+                    self._meter_download(meter, d, job_id)
                 
-                # Get downloaded bytes and calculate progress
-                if d.get('downloaded_bytes'):
-                    downloaded_bytes = d['downloaded_bytes']
-                    total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
-                    
-                    # Calculate progress percentage
-                    if total > 0:
-                        progress = min(downloaded_bytes / total * 100, 99.9)
-                    else:
-                        progress = 0
-                    
-                    # Calculate speed
-                    elapsed = time.time() - start_time
-                    speed = downloaded_bytes / elapsed if elapsed > 0 else 0
-                    
-                    # Update the progress tracker
-                    update_download_progress(
-                        progress=progress,
-                        downloaded=downloaded_bytes,
-                        speed=speed
-                    )
+                # One event per hook call; the progress bus batches them for subscribers
+                total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+                downloaded_bytes = d.get('downloaded_bytes')
+                if not downloaded_bytes:
+                    if total:
+                        self.progress_bus.publish(job_id, file_size=total)
+                    return
+                
+                elapsed = time.time() - start_time
+                self.progress_bus.publish(
+                    job_id,
+                    progress=min(downloaded_bytes / total * 100, 99.9) if total > 0 else 0,
+                    file_size=total or None,
+                    downloaded=downloaded_bytes,
+                    speed=downloaded_bytes / elapsed if elapsed > 0 else 0
+                )
             
             elif d['status'] == 'finished':
                 # Download is complete
-                update_download_progress(
+                self.progress_bus.publish(
+                    job_id,
                     status='processing',
                     progress=99.9  # Allow room for post-processing
                 )
         
-        # Configure yt-dlp options
-        ydl_opts = {
-            'format': 'best[ext=mp4]/best',  # Prefer MP4 if available
-            'outtmpl': filepath_template,
-            'quiet': True,
-            'no_warnings': True,
-            'ignoreerrors': False,
-            'nooverwrites': True,
-            'noplaylist': True,
-            'nocheckcertificate': True,
-            'prefer_ffmpeg': True,
-            'progress_hooks': [yt_dlp_progress_hook],
-        }
-        
         try:
-            # Download the video
-            with YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-                downloaded_file = ydl.prepare_filename(info)
-                
-                # Some videos may have a different extension than mp4
-                if not os.path.exists(downloaded_file):
-                    possible_files = [
-                        os.path.join(download_path, f) 
-                        for f in os.listdir(download_path) 
-                        if f.startswith(f"{platform}_{timestamp}")
-                    ]
-                    if possible_files:
-                        downloaded_file = possible_files[0]
-                
-                # Final update to mark as complete
-                filesize = os.path.getsize(downloaded_file)
-                update_download_progress(
-                    status='completed',
-                    progress=100,
-                    file_size=filesize,
-                    downloaded=filesize,
-                    filename=os.path.basename(downloaded_file)
-                )
-                
-                return {
-                    'success': True,
-                    'filepath': downloaded_file,
-                    'original_url': url,
-                    'title': info.get('title', f"{platform.capitalize()} Video"),
-                    'uploader': info.get('uploader', 'Unknown'),
-                    'file_size': filesize
-                }
+            # A cached extraction that fails is extracted again on a fresh instance;
+            # leaving the checkout with the error discards the one it was processed on
+            for use_cache in (True, False):
+                try:
+                    # Download the video on a pooled instance bound to this job's file and progress
+                    with self.ydl_pool.checkout('download', progress_hook=yt_dlp_progress_hook,
+                                                outtmpl=filepath_template,
+                                                ratelimit=meter['throttle'].rate if meter['throttle'] else None) as ydl:
+                        meter['ydl'] = ydl
+                        with TRACER.span('ytdlp.extract_info', url=url, download=True) as span:
+                            call_time = time.time()
+                            info = self._download_cached_info(ydl, url) if use_cache else None
+                            span.set_attribute('cached', info is not None)
+                            if info is None and self.extraction_pool is not None:
+                                info = self._download_pooled_info(ydl, url)
+                            if info is None:
+                                info = ydl.extract_info(url, download=True)
+                                self._cache_info(url, info)
+                            # One call extracts and downloads; split its time at the first media bytes
+                            if meter['first_byte_time'] is not None:
+                                TRACER.record('ytdlp.extract', call_time, meter['first_byte_time'])
+                                TRACER.record('ytdlp.transfer', meter['first_byte_time'], time.time())
+                        downloaded_file = ydl.prepare_filename(info)
+                        
+                        # Some videos may have a different extension than mp4
+                        if not os.path.exists(downloaded_file):
+                            possible_files = [
+                                os.path.join(download_path, f) 
+                                for f in os.listdir(download_path) 
+                                if f.startswith(f"{platform}_{timestamp}")
+                            ]
+                            if possible_files:
+                                downloaded_file = possible_files[0]
+                        
+                        filesize = os.path.getsize(downloaded_file)
+                        if meter['first_byte_time'] is not None:
+                            observe_transfer(platform, 'yt-dlp', filesize, time.time() - meter['first_byte_time'])
+                        # Bytes are on disk; the job completes once the app has recorded the file
+                        self.progress_bus.publish(
+                            job_id,
+                            status='processing',
+                            progress=99.9,
+                            file_size=filesize,
+                            downloaded=filesize,
+                            filename=os.path.basename(downloaded_file)
+                        )
+                        
+                        return {
+                            'success': True,
+                            'filepath': downloaded_file,
+                            'original_url': url,
+                            'title': info.get('title', f"{platform.capitalize()} Video"),
+                            'uploader': info.get('uploader', 'Unknown'),
+                            'file_size': filesize
+                        }
+                except StaleExtractionError as e:
+                    self.logger.warning(f"Cached extraction failed, extracting again: {str(e)}")
                 
         except Exception as e:
             self.logger.exception(f"Error using yt-dlp for {platform}: {str(e)}")
@@ -456,8 +657,32 @@ class SocialMediaDownloader:
                 'error': f"Error downloading from {platform}: {str(e)}"
             }
     
+    def _meter_download(self, meter, status, job_id):
+        """
+        Charge the bytes yt-dlp reported since its last progress update to the job's throttle.
+        
+        yt-dlp paces itself with its ratelimit option; this also draws the bytes
+        from the global and host buckets, sleeping in yt-dlp's thread when they
+        are in debt, and passes limits changed at runtime on to yt-dlp.
+        """
+        media_url = (status.get('info_dict') or {}).get('url')
+        if media_url and meter['bytes'] == 0 and meter['throttle'].host != urlparse(media_url).hostname:
+            # The media usually comes from a CDN rather than the page's host
+            meter['throttle'] = self.rate_limiter.throttle(media_url, job_id)
+        
+        downloaded = status.get('downloaded_bytes') or 0
+        # Each format of a merged download counts from zero again
+        delta = downloaded - meter['bytes'] if downloaded >= meter['bytes'] else downloaded
+        meter['bytes'] = downloaded
+        
+        if meter['ydl'] is not None:
+            meter['ydl'].params['ratelimit'] = meter['throttle'].rate
+        meter['throttle'].wait(delta)
+    
     def cleanup(self):
         """Clean up temporary files."""
+        if self.ydl_pool is not None:
+            self.ydl_pool.close()
         try:
             if os.path.exists(self.temp_dir):
                 shutil.rmtree(self.temp_dir)
@@ -6,6 +6,10 @@ document.addEventListener('DOMContentLoaded', function() {
     const downloadForm = document.getElementById('download-form');
     const downloadProgress = document.getElementById('download-progress');
     const progressBar = downloadProgress.querySelector('.progress-bar');
+    const jobIdInput = document.getElementById('job-id');
+    
+    // ID of the current download job, used to follow its progress
+    let currentJobId = null;
     
     // Check URL functionality
     checkUrlButton.addEventListener('click', function() {
@@ -63,6 +67,10 @@ document.addEventListener('DOMContentLoaded', function() {
         // Prevent the default form submission - we'll handle downloading in the browser
         event.preventDefault();
         
+        // Start a new download job so progress updates target only this download
+        currentJobId = generateJobId();
+        jobIdInput.value = currentJobId;
+        
         // Show the URL check result as a loading message
         showUrlCheckResult(true, 'Preparing download, please wait...');
         
@@ -195,173 +203,73 @@ document.addEventListener('DOMContentLoaded', function() {
             downloadProgress.insertAdjacentElement('afterend', statsContainer);
         }
         
-        // Start polling for progress updates
-        startProgressPolling();
+        // Show the stats container
+        document.getElementById('download-stats').classList.remove('d-none');
     }
     
-    // Poll the server for download progress updates
-    function startProgressPolling() {
-        const fileSize = document.getElementById('file-size');
-        const downloadSpeed = document.getElementById('download-speed');
-        const statsContainer = document.getElementById('download-stats');
+    // Download through the server, following the job's progress while it runs
+    function submitServerDownload() {
+        startProgressUpdates();
+        downloadForm.submit();
+    }
+    
+    // Follow the current download job's progress; only server downloads have a job
+    function startProgressUpdates() {
+        if (window.EventSource) {
+            streamProgress(currentJobId);
+        } else {
+            pollProgress(currentJobId);
+        }
+    }
+    
+    // Receive progress updates pushed by the server
+    function streamProgress(jobId) {
+        const source = new EventSource(`/jobs/${jobId}/events`);
+        // Events only carry the fields that changed, so keep the full state here
+        let state = {};
+        
+        source.addEventListener('progress', function(event) {
+            // Stop listening once a newer download job has started
+            if (jobId !== currentJobId) {
+                source.close();
+                return;
+            }
+            
+            state = Object.assign(state, JSON.parse(event.data));
+            if (renderProgress(state)) {
+                source.close();
+            }
+        });
         
-        // Show the stats container
-        statsContainer.classList.remove('d-none');
+        source.addEventListener('end', function() {
+            source.close();
+        });
         
-        // Set up polling
+        source.addEventListener('gone', function() {
+            source.close();
+        });
+    }
+    
+    // Poll the server for download progress updates (browsers without EventSource)
+    function pollProgress(jobId) {
         const poll = setInterval(function() {
-            fetch('/download-progress')
-                .then(response => response.json())
-                .then(data => {
-                    // Update progress bar
-                    const progress = data.progress;
-                    progressBar.style.width = progress + '%';
-                    progressBar.setAttribute('aria-valuenow', progress);
-                    
-                    // Update status in progress bar text
-                    switch(data.status) {
-                        case 'idle':
-                            progressBar.innerHTML = 'Waiting...';
-                            break;
-                        case 'checking':
-                            progressBar.innerHTML = 'Checking URL...';
-                            break;
-                        case 'downloading':
-                            let progressText = 'Downloading';
-                            // Add platform info if available
-                            if (data.platform) {
-                                progressText += ` from ${data.platform.charAt(0).toUpperCase() + data.platform.slice(1)}`;
-                            }
-                            progressBar.innerHTML = `${progressText}: ${progress.toFixed(1)}%`;
-                            break;
-                        case 'processing':
-                            progressBar.innerHTML = 'Processing video...';
-                            break;
-                        case 'completed':
-                            progressBar.innerHTML = 'Download complete!';
-                            break;
-                        case 'retrying':
-                            progressBar.innerHTML = 'Retrying with alternative method...';
-                            break;
-                        case 'error':
-                            progressBar.innerHTML = 'Error during download';
-                            break;
-                        default:
-                            progressBar.innerHTML = `${progress.toFixed(1)}%`;
-                    }
-                    
-                    // Update file size and download speed
-                    if (data.human_readable) {
-                        fileSize.innerHTML = `File size: ${data.human_readable.file_size}`;
-                        downloadSpeed.innerHTML = `Speed: ${data.human_readable.speed}`;
-                        
-                        // Add estimated time if we have enough data
-                        if (data.file_size > 0 && data.downloaded > 0 && data.speed > 0) {
-                            const remainingBytes = data.file_size - data.downloaded;
-                            const remainingTimeSeconds = remainingBytes / data.speed;
-                            
-                            if (remainingTimeSeconds > 0 && remainingTimeSeconds < 3600) {
-                                const minutes = Math.floor(remainingTimeSeconds / 60);
-                                const seconds = Math.floor(remainingTimeSeconds % 60);
-                                const timeStr = `${minutes}m ${seconds}s`;
-                                downloadSpeed.innerHTML += ` • Est. time: ${timeStr}`;
-                            }
-                        }
+            // Stop polling once a newer download job has started
+            if (jobId !== currentJobId) {
+                clearInterval(poll);
+                return;
+            }
+            
+            fetch(`/download-progress/${jobId}`)
+                .then(response => {
+                    // The job is only registered once the server-side download starts
+                    if (response.status === 404) {
+                        return null;
                     }
-                    
-                    // If download is complete or there's an error, stop polling
-                    if (data.status === 'completed' || data.status === 'error') {
+                    return response.json();
+                })
+                .then(data => {
+                    if (data && renderProgress(data)) {
                         clearInterval(poll);
-                        
-                        // If download is complete, show success message
-                        if (data.status === 'completed') {
-                            // Create a success message if it doesn't exist
-                            if (!document.getElementById('download-success')) {
-                                const successAlert = document.createElement('div');
-                                successAlert.id = 'download-success';
-                                successAlert.className = 'alert alert-success mt-3';
-                                // Determine platform for icon display
-                                let platformClass = 'general';
-                                let platformName = 'Video';
-                                let platformIconPath = '/static/icons/video.svg';
-                                
-                                if (data.platform) {
-                                    const platform = data.platform.toLowerCase();
-                                    if (platform === 'youtube') {
-                                        platformClass = 'youtube';
-                                        platformName = 'YouTube';
-                                        platformIconPath = '/static/icons/youtube.svg';
-                                    } else if (platform === 'instagram') {
-                                        platformClass = 'instagram';
-                                        platformName = 'Instagram';
-                                        platformIconPath = '/static/icons/instagram.svg';
-                                    } else if (platform === 'twitter') {
-                                        platformClass = 'twitter';
-                                        platformName = 'Twitter';
-                                        platformIconPath = '/static/icons/twitter.svg';
-                                    } else if (platform === 'facebook') {
-                                        platformClass = 'facebook';
-                                        platformName = 'Facebook';
-                                        platformIconPath = '/static/icons/facebook.svg';
-                                    } else if (platform === 'tiktok') {
-                                        platformClass = 'tiktok';
-                                        platformName = 'TikTok';
-                                        platformIconPath = '/static/icons/tiktok.svg';
-                                    }
-                                }
-                                
-                                // Create platform badge with icon
-                                const platformBadge = `
-                                    <div class="platform-badge ${platformClass} mb-2">
-                                        <img src="${platformIconPath}" alt="${platformName}" class="platform-icon">
-                                        ${platformName}
-                                    </div>
-                                `;
-                                
-                                successAlert.innerHTML = `
-                                    ${platformBadge}
-                                    <div>Video downloaded successfully! File: <strong>${data.filename}</strong></div>
-                                    <div class="mt-1 small">Size: ${data.human_readable.file_size}</div>
-                                    <div class="mt-2">
-                                        <a href="/download?url=${encodeURIComponent(urlInput.value)}" 
-                                           class="btn btn-success btn-sm" download>
-                                            <i class="fas fa-download me-1"></i> Save to Device
-                                        </a>
-                                    </div>
-                                `;
-                                
-                                // Insert after stats container
-                                statsContainer.insertAdjacentElement('afterend', successAlert);
-                                
-                                // Scroll to make the success message visible
-                                successAlert.scrollIntoView({ behavior: 'smooth', block: 'center' });
-                            }
-                        }
-                        
-                        // If there was an error, show it for a while then hide
-                        if (data.status === 'error') {
-                            // Create an error message
-                            if (!document.getElementById('download-error')) {
-                                const errorAlert = document.createElement('div');
-                                errorAlert.id = 'download-error';
-                                errorAlert.className = 'alert alert-danger mt-3';
-                                errorAlert.innerHTML = `
-                                    <i class="fas fa-exclamation-circle me-2"></i>
-                                    Error during download. Please try again or use a different URL.
-                                `;
-                                
-                                // Insert after stats container
-                                statsContainer.insertAdjacentElement('afterend', errorAlert);
-                            }
-                            
-                            setTimeout(function() {
-                                downloadProgress.classList.add('d-none');
-                                statsContainer.classList.add('d-none');
-                                // Also hide error message
-                                const errorAlert = document.getElementById('download-error');
-                                if (errorAlert) errorAlert.classList.add('d-none');
-                            }, 8000);
-                        }
                     }
                 })
                 .catch(error => {
@@ -370,6 +278,182 @@ document.addEventListener('DOMContentLoaded', function() {
         }, 500); // Poll every 500ms
     }
     
+    // Show a progress update; returns true once the download has finished
+    function renderProgress(data) {
+        const fileSize = document.getElementById('file-size');
+        const downloadSpeed = document.getElementById('download-speed');
+        const statsContainer = document.getElementById('download-stats');
+        
+        // Update progress bar
+        const progress = data.progress;
+        progressBar.style.width = progress + '%';
+        progressBar.setAttribute('aria-valuenow', progress);
+        
+        // Update status in progress bar text
+        switch(data.status) {
+            case 'idle':
+                progressBar.innerHTML = 'Waiting...';
+                break;
+            case 'queued':
+                progressBar.innerHTML = 'Queued...';
+                break;
+            case 'checking':
+                progressBar.innerHTML = 'Checking URL...';
+                break;
+            case 'downloading':
+                let progressText = 'Downloading';
+                // Add platform info if available
+                if (data.platform) {
+                    progressText += ` from ${data.platform.charAt(0).toUpperCase() + data.platform.slice(1)}`;
+                }
+                progressBar.innerHTML = `${progressText}: ${progress.toFixed(1)}%`;
+                break;
+            case 'processing':
+                progressBar.innerHTML = 'Processing video...';
+                break;
+            case 'completed':
+                progressBar.innerHTML = 'Download complete!';
+                break;
+            case 'retrying':
+                progressBar.innerHTML = 'Retrying with alternative method...';
+                break;
+            case 'error':
+                progressBar.innerHTML = 'Error during download';
+                break;
+            default:
+                progressBar.innerHTML = `${progress.toFixed(1)}%`;
+        }
+        
+        // Update file size and download speed
+        if (data.human_readable) {
+            fileSize.innerHTML = `File size: ${data.human_readable.file_size}`;
+            downloadSpeed.innerHTML = `Speed: ${data.human_readable.speed}`;
+            
+            // Add estimated time if we have enough data
+            if (data.file_size > 0 && data.downloaded > 0 && data.speed > 0) {
+                const remainingBytes = data.file_size - data.downloaded;
+                const remainingTimeSeconds = remainingBytes / data.speed;
+                
+                if (remainingTimeSeconds > 0 && remainingTimeSeconds < 3600) {
+                    const minutes = Math.floor(remainingTimeSeconds / 60);
+                    const seconds = Math.floor(remainingTimeSeconds % 60);
+                    const timeStr = `${minutes}m ${seconds}s`;
+                    downloadSpeed.innerHTML += ` • Est. time: ${timeStr}`;
+                }
+            }
+        }
+        
+        // If download is complete or there's an error, stop listening for updates
+        if (data.status === 'completed' || data.status === 'error') {
+            // If download is complete, show success message
+            if (data.status === 'completed') {
+                // Create a success message if it doesn't exist
+                if (!document.getElementById('download-success')) {
+                    const successAlert = document.createElement('div');
+                    successAlert.id = 'download-success';
+                    successAlert.className = 'alert alert-success mt-3';
+                    // Determine platform for icon display
+                    let platformClass = 'general';
+                    let platformName = 'Video';
+                    let platformIconPath = '/static/icons/video.svg';
+                    
+                    if (data.platform) {
+                        const platform = data.platform.toLowerCase();
+                        if (platform === 'youtube') {
+                            platformClass = 'youtube';
+                            platformName = 'YouTube';
+                            platformIconPath = '/static/icons/youtube.svg';
+                        } else if (platform === 'instagram') {
+                            platformClass = 'instagram';
+                            platformName = 'Instagram';
+                            platformIconPath = '/static/icons/instagram.svg';
+                        } else if (platform === 'twitter') {
+                            platformClass = 'twitter';
+                            platformName = 'Twitter';
+                            platformIconPath = '/static/icons/twitter.svg';
+                        } else if (platform === 'facebook') {
+                            platformClass = 'facebook';
+                            platformName = 'Facebook';
+                            platformIconPath = '/static/icons/facebook.svg';
+                        } else if (platform === 'tiktok') {
+                            platformClass = 'tiktok';
+                            platformName = 'TikTok';
+                            platformIconPath = '/static/icons/tiktok.svg';
+                        }
+                    }
+                    
+                    // Create platform badge with icon
+                    const platformBadge = `
+                        <div class="platform-badge ${platformClass} mb-2">
+                            <img src="${platformIconPath}" alt="${platformName}" class="platform-icon">
+                            ${platformName}
+                        </div>
+                    `;
+                    
+                    successAlert.innerHTML = `
+                        ${platformBadge}
+                        <div>Video downloaded successfully! File: <strong>${data.filename}</strong></div>
+                        <div class="mt-1 small">Size: ${data.human_readable.file_size}</div>
+                        <div class="mt-2">
+                            <a href="/download?url=${encodeURIComponent(urlInput.value)}&job_id=${encodeURIComponent(currentJobId)}" 
+                               class="btn btn-success btn-sm" download>
+                                <i class="fas fa-download me-1"></i> Save to Device
+                            </a>
+                        </div>
+                    `;
+                    
+                    // Insert after stats container
+                    statsContainer.insertAdjacentElement('afterend', successAlert);
+                    
+                    // Saving downloads the file again as a new job, since a job ID is only used once
+                    successAlert.querySelector('a').addEventListener('click', function() {
+                        currentJobId = generateJobId();
+                        this.href = `/download?url=${encodeURIComponent(urlInput.value)}&job_id=${encodeURIComponent(currentJobId)}`;
+                        startProgressUpdates();
+                    });
+                    
+                    // Scroll to make the success message visible
+                    successAlert.scrollIntoView({ behavior: 'smooth', block: 'center' });
+                }
+            }
+            
+            // If there was an error, show it for a while then hide
+            if (data.status === 'error') {
+                // Create an error message
+                if (!document.getElementById('download-error')) {
+                    const errorAlert = document.createElement('div');
+                    errorAlert.id = 'download-error';
+                    errorAlert.className = 'alert alert-danger mt-3';
+                    errorAlert.innerHTML = `
+                        <i class="fas fa-exclamation-circle me-2"></i>
+                        Error during download. Please try again or use a different URL.
+                    `;
+                    
+                    // Insert after stats container
+                    statsContainer.insertAdjacentElement('afterend', errorAlert);
+                }
+                
+                setTimeout(function() {
+                    downloadProgress.classList.add('d-none');
+                    statsContainer.classList.add('d-none');
+                    // Also hide error message
+                    const errorAlert = document.getElementById('download-error');
+                    if (errorAlert) errorAlert.classList.add('d-none');
+                }, 8000);
+            }
+        }
+        
+        return data.status === 'completed' || data.status === 'error';
+    }
+    
+    // Helper function to create a random download job ID
+    function generateJobId() {
+        if (window.crypto && window.crypto.randomUUID) {
+            return window.crypto.randomUUID().replace(/-/g, '');
+        }
+        return Date.now().toString(36) + Math.random().toString(36).slice(2);
+    }
+    
     // Helper function to validate URL format
     function isValidURL(string) {
         try {
@@ -452,7 +536,7 @@ document.addEventListener('DOMContentLoaded', function() {
             
             // Fallback to server-side download
             console.log('Falling back to server-side download...');
-            document.getElementById('download-form').submit();
+            submitServerDownload();
         });
     }
     
@@ -681,8 +765,8 @@ document.addEventListener('DOMContentLoaded', function() {
             setTimeout(function() {
                 console.log('Falling back to server-side download...');
                 // Create a form submission to download via the server
-                document.getElementById('url-input').value = url;
-                document.getElementById('download-form').submit();
+                urlInput.value = url;
+                submitServerDownload();
             }, 2000);
         };
         
@@ -694,8 +778,8 @@ document.addEventListener('DOMContentLoaded', function() {
             setTimeout(function() {
                 console.log('Falling back to server-side download...');
                 // Create a form submission to download via the server
-                document.getElementById('url-input').value = url;
-                document.getElementById('download-form').submit();
+                urlInput.value = url;
+                submitServerDownload();
             }, 2000);
         };
         
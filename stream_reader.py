@@ -0,0 +1,140 @@
+import time
+import http.client
+
+import requests
+from urllib3.exceptions import ProtocolError, ReadTimeoutError, DecodeError, SSLError
+from urllib3.util.response import is_fp_closed
+
+
+class AdaptiveReader:
+    """
+    Read a streaming HTTP response in chunks sized to its throughput.
+
+    A fixed small chunk costs a loop iteration, a write and a progress check
+    per few kilobytes, and on a fast link that overhead rather than the
+    network caps the download. The reader starts at min_chunk, so slow
+    transfers still yield often, and doubles the chunk while reads fill it
+    well within target_interval, up to max_chunk; reads that take much
+    longer halve it again.
+
+    Identity-encoded bodies are read with readinto straight into one
+    reusable buffer, so no bytes object is allocated per chunk. Compressed
+    bodies go through urllib3, which has to decode them. Either way read
+    errors are raised as the requests exceptions iter_content would raise.
+
+    With a throttle, every chunk is charged to it before being yielded and
+    chunks are kept small enough for throttled transfers to take turns.
+    """
+
+    def __init__(self, response, prefix=b'', min_chunk=1024 * 16, max_chunk=1024 * 1024 * 4,
+                 target_interval=0.05, throttle=None):
+        """
+        Args:
+            response (requests.Response): A response opened with stream=True
+            prefix (bytes): Body bytes already read from the response, yielded first
+            min_chunk (int): Starting and smallest chunk size
+            max_chunk (int): Largest chunk size
+            target_interval (float): Seconds a single read should take at most
+            throttle (rate_limiter.Throttle, optional): Bandwidth limits to wait for
+        """
+        self.response = response
+        self.prefix = prefix
+        self.min_chunk = min_chunk
+        self.max_chunk = max(max_chunk, min_chunk)
+        self.target_interval = target_interval
+        self.throttle = throttle
+        self.chunk_size = min_chunk
+        self._buffer = None
+        self._view = None
+
+    def __iter__(self):
+        """
+        Yield the body chunk by chunk.
+
+        Chunks from the fast path are memoryviews of the reusable buffer:
+        they are only valid until the next chunk is requested, so write or
+        copy each one before moving on.
+        """
+        throttle = self.throttle
+        if self.prefix:
+            if throttle is not None:
+                throttle.wait(len(self.prefix))
+            yield self.prefix
+            self.prefix = b''
+
+        fp = self._direct_fp()
+        read = self._readinto if fp is not None else self._read
+        clock = time.monotonic
+        while True:
+            size = self.chunk_size
+            if throttle is not None:
+                size = min(size, throttle.chunk_limit or size)
+            started = clock()
+            data = read(fp, size)
+            if not data:
+                break
+            self._adapt(len(data), size, clock() - started)
+            if throttle is not None:
+                throttle.wait(len(data))
+            yield data
+
+        self._finish()
+
+    def _direct_fp(self):
+        """Return the http.client response to read into, or None to read through urllib3"""
+        raw = getattr(self.response, 'raw', None)
+        fp = getattr(raw, '_fp', None)
+        if not isinstance(fp, http.client.HTTPResponse):
+            return None
+        encoding = self.response.headers.get('Content-Encoding', 'identity').lower()
+        if encoding not in ('', 'identity'):
+            return None
+        # urllib3 may hold bytes it read ahead of the socket
+        if len(getattr(raw, '_decoded_buffer', b'')):
+            return None
+        return fp
+
+    def _readinto(self, fp, size):
+        if self._buffer is None or len(self._buffer) < size:
+            self._buffer = bytearray(size)
+            self._view = memoryview(self._buffer)
+        try:
+            count = fp.readinto(self._view[:size])
+        except http.client.HTTPException as e:
+            raise requests.exceptions.ChunkedEncodingError(e)
+        except OSError as e:
+            raise requests.exceptions.ConnectionError(e)
+
+        if not count and fp.length:
+            # http.client leaves a body cut short of its Content-Length to the caller
+            raise requests.exceptions.ChunkedEncodingError(
+                http.client.IncompleteRead(b'', fp.length)
+            )
+        return self._view[:count]
+
+    def _read(self, fp, size):
+        # Same translation of urllib3 errors as requests.Response.iter_content
+        try:
+            return self.response.raw.read(size, decode_content=True)
+        except ProtocolError as e:
+            raise requests.exceptions.ChunkedEncodingError(e)
+        except DecodeError as e:
+            raise requests.exceptions.ContentDecodingError(e)
+        except ReadTimeoutError as e:
+            raise requests.exceptions.ConnectionError(e)
+        except SSLError as e:
+            raise requests.exceptions.SSLError(e)
+
+    def _adapt(self, count, size, elapsed):
+        if count == size and elapsed < self.target_interval / 2:
+            self.chunk_size = min(size * 2, self.max_chunk)
+        elif elapsed > self.target_interval * 2:
+            self.chunk_size = max(size // 2, self.min_chunk)
+
+    def _finish(self):
+        """Hand the connection back to the pool once the whole body has been read"""
+        raw = self.response.raw
+        # Otherwise response.close() would drop the connection as if the body were unread
+        self.response._content_consumed = True
+        if is_fp_closed(raw._fp):
+            raw.release_conn()
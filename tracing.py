@@ -0,0 +1,328 @@
+import time
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+
+# opentelemetry-api lets spans be exported to any OpenTelemetry backend
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+
+# The innermost open span of the running thread or task
+_current_span = contextvars.ContextVar('webvid_current_span', default=None)
+
+
+class Span:
+    """
+    One timed stage of the pipeline, such as a probe, a page scan or a transfer.
+
+    A span opened while another is open becomes its child and inherits its
+    job, so stages of a download are attributed to the job without passing
+    the job ID down. Use it as a context manager; an exception raised inside
+    marks the span as failed.
+    """
+
+    __slots__ = ('tracer', 'name', 'attributes', 'parent', 'job_id', 'start_time', 'end_time',
+                 'error', 'exported', '_token')
+
+    def __init__(self, tracer, name, attributes, parent=None, start_time=None):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.parent = parent
+        self.job_id = attributes.pop('job_id', None) or (parent.job_id if parent is not None else None)
+        self.start_time = start_time if start_time is not None else time.time()
+        self.end_time = None
+        self.error = None
+        # State exporters keep on the span between on_start and on_end
+        self.exported = {}
+        self._token = None
+
+    @property
+    def duration(self):
+        """Seconds from start to end, or so far if the span is still open"""
+        return (self.end_time if self.end_time is not None else time.time()) - self.start_time
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self, error=None, end_time=None):
+        """Close the span; closing it again does nothing"""
+        if self.end_time is not None:
+            return
+        self.end_time = end_time if end_time is not None else time.time()
+        if error is not None:
+            self.error = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # Ended in another context than it was opened in; that context keeps its own state
+                pass
+            self._token = None
+        self.tracer._finish(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end(exc_value)
+        return False
+
+
+class _NoopSpan:
+    """Stands in for a span while tracing is off, so instrumented code costs next to nothing"""
+
+    __slots__ = ()
+    name = None
+    job_id = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def end(self, error=None, end_time=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class SpanExporter:
+    """Receives spans as they start and end; subclasses override what they need"""
+
+    def on_start(self, span):
+        pass
+
+    def on_end(self, span):
+        pass
+
+
+class LogExporter(SpanExporter):
+    """Logs every finished span with its duration and attributes"""
+
+    def __init__(self, level=logging.DEBUG, min_duration=0):
+        """
+        Args:
+            level (int): Log level of the messages
+            min_duration (float): Spans shorter than this many seconds are not logged
+        """
+        self.logger = logging.getLogger(__name__)
+        self.level = level
+        self.min_duration = min_duration
+
+    def on_end(self, span):
+        if span.duration < self.min_duration:
+            return
+        attributes = ' '.join(f"{key}={value}" for key, value in span.attributes.items())
+        job = f" job={span.job_id}" if span.job_id else ''
+        error = f" error={span.error!r}" if span.error else ''
+        self.logger.log(self.level, f"span {span.name} {span.duration * 1000:.1f} ms{job} {attributes}{error}".rstrip())
+
+
+class OpenTelemetryExporter(SpanExporter):
+    """
+    Mirrors spans as OpenTelemetry spans, parented like the originals.
+
+    Only the API is needed here; where the spans go (OTLP, Jaeger, console)
+    is up to the tracer provider configured by the application or by
+    running it under opentelemetry-instrument. Root spans join whatever
+    OpenTelemetry span is current, e.g. one from Flask instrumentation.
+    """
+
+    def __init__(self, tracer_provider=None):
+        """
+        Args:
+            tracer_provider (TracerProvider, optional): Defaults to the global provider
+
+        Raises:
+            RuntimeError: If opentelemetry-api is not installed
+        """
+        if otel_trace is None:
+            raise RuntimeError("opentelemetry-api is required for the OpenTelemetry exporter")
+        self.tracer = otel_trace.get_tracer(__name__, tracer_provider=tracer_provider)
+
+    def on_start(self, span):
+        parent = span.parent.exported.get('otel') if span.parent is not None else None
+        context = otel_trace.set_span_in_context(parent) if parent is not None else None
+        span.exported['otel'] = self.tracer.start_span(
+            span.name,
+            context=context,
+            start_time=int(span.start_time * 1e9)
+        )
+
+    def on_end(self, span):
+        otel_span = span.exported.pop('otel', None)
+        if otel_span is None:
+            return
+        for key, value in span.attributes.items():
+            if value is not None:
+                otel_span.set_attribute(key, value if isinstance(value, (str, bool, int, float)) else str(value))
+        if span.job_id:
+            otel_span.set_attribute('webvid.job_id', span.job_id)
+        if span.error:
+            otel_span.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=int(span.end_time * 1e9))
+
+
+class Tracer:
+    """
+    Times the stages of downloads and requests.
+
+    While disabled, span() hands back a shared no-op span, so the
+    instrumentation left in the pipeline costs one method call per stage.
+    While enabled, finished spans go to the exporters and the time of each
+    stage is summed per job, for the job status to show where a slow
+    download spent its time.
+    """
+
+    def __init__(self, enabled=False, exporters=(), max_jobs=1000):
+        """
+        Args:
+            enabled (bool): Whether spans are recorded
+            exporters (iterable): SpanExporters that receive every span
+            max_jobs (int): Jobs whose timing breakdown is kept; the oldest are dropped
+        """
+        self.logger = logging.getLogger(__name__)
+        self.enabled = enabled
+        self.exporters = list(exporters)
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, enabled=None, exporters=None):
+        """Turn tracing on or off and/or replace the exporters"""
+        if exporters is not None:
+            self.exporters = list(exporters)
+        if enabled is not None:
+            self.enabled = enabled
+
+    def span(self, name, **attributes):
+        """
+        Open a span as a child of the current one.
+
+        Args:
+            name (str): The stage, e.g. 'probe' or 'ytdlp.extract_info'
+            **attributes: Details of the stage; job_id attributes the span and its
+                children to a download job
+
+        Returns:
+            Span: Use as a context manager, or call end() when the stage is over
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        span = Span(self, name, attributes, parent=_current_span.get())
+        span._token = _current_span.set(span)
+        self._start(span)
+        return span
+
+    def record(self, name, start_time, end_time, **attributes):
+        """
+        Add a stage that was timed by other means, as a child of the current span.
+
+        Args:
+            name (str): The stage
+            start_time (float): When it started, as time.time()
+            end_time (float): When it ended, as time.time()
+            **attributes: Details of the stage
+        """
+        if not self.enabled:
+            return
+        span = Span(self, name, attributes, parent=_current_span.get(), start_time=start_time)
+        self._start(span)
+        span.end(end_time=end_time)
+
+    def current_span(self):
+        """Return the innermost open span, or None"""
+        return _current_span.get() if self.enabled else None
+
+    def job_timings(self, job_id):
+        """
+        Return the time a job spent in each stage.
+
+        Seconds are inclusive: a stage's time includes the stages nested in it.
+
+        Returns:
+            list: {'stage', 'seconds', 'count'} dicts in the order the stages first
+            started; empty if nothing was recorded
+        """
+        with self._lock:
+            stages = self._jobs.get(job_id)
+            if stages is None:
+                return []
+            return [{'stage': name, 'seconds': round(seconds, 4), 'count': count}
+                    for name, (seconds, count) in stages.items() if count]
+
+    def forget_job(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _start(self, span):
+        if span.job_id is not None:
+            with self._lock:
+                stages = self._jobs.get(span.job_id)
+                if stages is None:
+                    stages = self._jobs[span.job_id] = {}
+                    while len(self._jobs) > self.max_jobs:
+                        self._jobs.popitem(last=False)
+                # Reserve the stage's place so the breakdown reads in start order
+                stages.setdefault(span.name, [0.0, 0])
+        for exporter in self.exporters:
+            try:
+                exporter.on_start(span)
+            except Exception as e:
+                self.logger.warning(f"Span exporter {type(exporter).__name__} failed: {str(e)}")
+
+    def _finish(self, span):
+        if span.job_id is not None:
+            with self._lock:
+                stages = self._jobs.get(span.job_id)
+                if stages is not None:
+                    stage = stages.setdefault(span.name, [0.0, 0])
+                    stage[0] += span.duration
+                    stage[1] += 1
+        for exporter in self.exporters:
+            try:
+                exporter.on_end(span)
+            except Exception as e:
+                self.logger.warning(f"Span exporter {type(exporter).__name__} failed: {str(e)}")
+
+
+def build_exporters(names):
+    """
+    Build span exporters from a setting such as "log,otel".
+
+    Args:
+        names (str): Comma-separated exporter names: 'log' or 'otel'
+
+    Returns:
+        list: The exporters; unknown or unavailable ones are logged and skipped
+    """
+    logger = logging.getLogger(__name__)
+    exporters = []
+    for name in (names or '').split(','):
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name == 'log':
+            exporters.append(LogExporter(level=logging.INFO))
+        elif name in ('otel', 'opentelemetry'):
+            try:
+                exporters.append(OpenTelemetryExporter())
+            except RuntimeError as e:
+                logger.warning(f"Skipping span exporter {name}: {str(e)}")
+        else:
+            logger.warning(f"Ignoring unknown span exporter: {name}")
+    return exporters
+
+
+# The process-wide tracer; off until the application turns it on
+TRACER = Tracer()
@@ -1,13 +1,19 @@
 import os
-import re
 import time
 import logging
 import requests
-from bs4 import BeautifulSoup
-from tqdm import tqdm
 import urllib.parse
-import json
 from datetime import datetime
+from segmented_download import SegmentedDownloader, RangeNotSupportedError
+from download_journal import DownloadJournal
+from html_extractor import scan_page
+from http_client import PooledSession
+from media_probe import ProbeResult, probe_url
+from stream_reader import AdaptiveReader
+from manifest_downloader import ManifestDownloader, ManifestError, MANIFEST_EXTENSIONS, manifest_type
+from metrics import EXTRACTION_SECONDS, PAGE_SCAN_SECONDS, TIME_TO_FIRST_BYTE_SECONDS, observe_transfer
+from tracing import TRACER
+from progress_bus import PROGRESS_BUS
 
 class VideoDownloader:
     def __init__(self):
@@ -28,8 +34,29 @@ class VideoDownloader:
         self.max_retries = 3
         # Timeout in seconds for HTTP requests
         self.timeout = 30
-        # Session to maintain cookies across requests
-        self.session = requests.Session()
+        # Shared session: cookies across requests, and keep-alive connections
+        # pooled per host for every probe, page fetch and download
+        self.session = PooledSession()
+        # Parallel connections per download when the server supports byte ranges
+        self.segment_connections = 4
+        # Files smaller than this are downloaded over a single connection
+        self.segment_min_size = 1024 * 1024 * 4
+        # Upper bound of the adaptive read size; chunks start small and grow with throughput
+        self.max_chunk_size = 1024 * 1024 * 4
+        # Optional DownloadCache consulted once the media URL is resolved
+        self.cache = None
+        # Optional ExtractionCache shared by check_url, resolve_video_url and downloads
+        self.extraction_cache = None
+        # Optional ExtractionPool that scans large pages in worker processes
+        self.extraction_pool = None
+        # HLS/DASH segments fetched in parallel
+        self.manifest_workers = 8
+        # Highest stream bandwidth (bits/s) to pick from a manifest; None picks the best
+        self.max_bandwidth = None
+        # Optional BandwidthLimiter capping throughput globally, per host and per job
+        self.rate_limiter = None
+        # Where download progress is published for the job store, metrics and progress bars
+        self.progress_bus = PROGRESS_BUS
 
     def check_url(self, url):
         """
@@ -41,57 +68,69 @@ class VideoDownloader:
         Returns:
             dict: Result containing valid status and message
         """
+        if self.extraction_cache is not None:
+            cached = self.extraction_cache.get('check', url)
+            if cached:
+                return cached
+        
+        result = self._check_url(url)
+        if result['valid'] and self.extraction_cache is not None:
+            self.extraction_cache.set('check', url, result)
+        return result
+
+    def _check_url(self, url):
+        """Check a URL for video content without consulting the extraction cache"""
         try:
-            # Send a HEAD request first to check content type and save bandwidth
-            head_response = requests.head(url, headers=self.headers, timeout=self.timeout)
-            content_type = head_response.headers.get('Content-Type', '')
-            
-            # Direct video file
-            if any(f'video/{ext.lstrip(".")}' in content_type for ext in self.video_extensions):
-                return {'valid': True, 'message': 'Direct video link detected'}
+            # One GET tells a media file from a page; pages are read on, media is not
+            probe = self.probe(url)
+            try:
+                # Direct video file, or HLS/DASH manifest
+                if probe.is_media:
+                    if self.extraction_cache is not None:
+                        self.extraction_cache.set('video_url', url, {'video_url': url}, media_url=url)
+                    if probe.kind == 'video':
+                        return {'valid': True, 'message': 'Direct video link detected'}
+                    return {'valid': True, 'message': f'{probe.kind.upper()} stream detected'}
+                    
+                if probe.status_code not in (200, 206):
+                    return {'valid': False, 'message': f'Failed to access the URL (Status code: {probe.status_code})'}
                 
-            # If not a direct video file, make a GET request to analyze the page
-            response = requests.get(url, headers=self.headers, timeout=self.timeout)
-            
-            if response.status_code != 200:
-                return {'valid': False, 'message': f'Failed to access the URL (Status code: {response.status_code})'}
+                with TRACER.span('page.fetch', url=url):
+                    page = probe.text()
+            finally:
+                probe.close()
                 
-            # Parse the HTML
-            soup = BeautifulSoup(response.content, 'html.parser')
+            # Scan the HTML once for every kind of video content
+            with TRACER.span('page.scan', url=url):
+                scan = self._scan_page(page)
+            
+            # Remember the video source so a download right after this check skips the page fetch
+            if self.extraction_cache is not None:
+                candidates = scan.candidates()
+                if candidates:
+                    video_url = self._ensure_absolute_url(candidates[0]['url'], url)
+                    self.extraction_cache.set('video_url', url, {'video_url': video_url}, media_url=video_url)
             
             # Check for video tags
-            video_tags = soup.find_all('video')
-            if video_tags:
-                return {'valid': True, 'message': f'Found {len(video_tags)} video elements on the page'}
+            if scan.video_count:
+                return {'valid': True, 'message': f'Found {scan.video_count} video elements on the page'}
                 
             # Check for source tags
-            source_tags = soup.find_all('source')
-            video_sources = [s for s in source_tags if s.get('type', '').startswith('video/')]
-            if video_sources:
-                return {'valid': True, 'message': f'Found {len(video_sources)} video sources on the page'}
+            if scan.video_type_source_count:
+                return {'valid': True, 'message': f'Found {scan.video_type_source_count} video sources on the page'}
                 
             # Check for iframe embeds (like YouTube, Vimeo, etc.)
-            iframes = soup.find_all('iframe')
-            video_platforms = ['youtube.com', 'vimeo.com', 'dailymotion.com', 'twitch.tv']
-            video_iframes = [i for i in iframes if any(platform in i.get('src', '') for platform in video_platforms)]
+            video_iframes = scan.embedded_players()
             if video_iframes:
                 return {'valid': True, 'message': f'Found {len(video_iframes)} embedded video players'}
                 
             # Look for video URLs in the page source
-            video_urls = []
-            for ext in self.video_extensions:
-                pattern = f'https?://[^\\s/$.?#].[^\\s]*\\{ext}'
-                matches = re.findall(pattern, response.text)
-                video_urls.extend(matches)
-                
-            if video_urls:
-                return {'valid': True, 'message': f'Found {len(video_urls)} video URLs in page source'}
+            if scan.media_urls:
+                return {'valid': True, 'message': f'Found {len(scan.media_urls)} video URLs in page source'}
                 
             # Check for common JavaScript video players
-            video_players = ['videojs', 'jwplayer', 'flowplayer', 'mediaelement', 'plyr']
-            for player in video_players:
-                if player in response.text.lower():
-                    return {'valid': True, 'message': f'Found {player} video player on the page'}
+            if scan.players:
+                return {'valid': True, 'message': f'Found {scan.players[0]} video player on the page'}
             
             # If we made it here, we couldn't find any obvious video content
             return {'valid': False, 'message': 'No obvious video content detected on this page'}
@@ -111,72 +150,176 @@ class VideoDownloader:
         Returns:
             str or None: The video URL if found, None otherwise
         """
+        best = self._extract_best_candidate(page_url, page_content)
+        return best['url'] if best else None
+
+    def _extract_best_candidate(self, page_url, page_content):
+        """Return the best candidate on a page, with the strategy that found it, or None"""
+        start_time = time.time()
+        best = None
+        span = TRACER.span('page.scan', url=page_url, size=len(page_content))
         try:
-            soup = BeautifulSoup(page_content, 'html.parser')
-            video_url = None
-            
-            # Strategy 1: Check for video tags with src attribute
-            for video_tag in soup.find_all('video'):
-                if video_tag.get('src'):
-                    video_url = video_tag['src']
-                    self.logger.info(f"Found video tag with src: {video_url}")
-                    return self._ensure_absolute_url(video_url, page_url)
-                
-                # Check for source tags inside video tags
-                for source in video_tag.find_all('source'):
-                    if source.get('src'):
-                        video_url = source['src']
-                        self.logger.info(f"Found source tag inside video: {video_url}")
-                        return self._ensure_absolute_url(video_url, page_url)
-            
-            # Strategy 2: Check for standalone source tags
-            for source in soup.find_all('source'):
-                if source.get('src'):
-                    video_url = source['src']
-                    self.logger.info(f"Found standalone source tag: {video_url}")
-                    return self._ensure_absolute_url(video_url, page_url)
-            
-            # Strategy 3: Check for video URLs in the page source
-            for ext in self.video_extensions:
-                pattern = f'https?://[^\\s/$.?#].[^\\s]*\\{ext}'
-                matches = re.findall(pattern, page_content)
-                if matches:
-                    video_url = matches[0]  # Return the first match
-                    self.logger.info(f"Found video URL in page source: {video_url}")
-                    return video_url
+            candidates = self.extract_video_candidates(page_url, page_content)
+            span.set_attribute('candidates', len(candidates))
+            if candidates:
+                best = candidates[0]
+                self.logger.info(f"Found video via {best['strategy']}: {best['url']}")
+            else:
+                # If all strategies fail, return None
+                self.logger.warning("Could not extract video URL using any strategy")
             
-            # Strategy 4: Look for data attributes which might contain video info
-            video_attrs = ['data-src', 'data-source', 'data-video']
-            for tag in soup.find_all():
-                for attr in video_attrs:
-                    if tag.has_attr(attr):
-                        video_url = tag[attr]
-                        self.logger.info(f"Found video in data attribute {attr}: {video_url}")
-                        return self._ensure_absolute_url(video_url, page_url)
+        except Exception as e:
+            self.logger.exception(f"Error extracting video URL: {str(e)}")
+        
+        span.set_attribute('strategy', best['strategy'] if best else 'none')
+        span.end()
+        PAGE_SCAN_SECONDS.observe(time.time() - start_time, strategy=best['strategy'] if best else 'none')
+        return best
+
+    def extract_video_candidates(self, page_url, page_content):
+        """
+        Find every candidate video URL on a page, best first
+        
+        The page is scanned once; candidates are ranked by strategy: video
+        tags (and their sources), standalone source tags, URLs in the page
+        source, data attributes, then YouTube/Vimeo iframe embeds.
+        
+        Args:
+            page_url (str): The URL of the page
+            page_content (str): The HTML content of the page
             
-            # Strategy 5: Check for iframe embeds (YouTube, Vimeo)
-            for iframe in soup.find_all('iframe'):
-                src = iframe.get('src')
-                if src:
-                    # Check for YouTube
-                    if 'youtube.com/embed/' in src:
-                        video_id = src.split('/')[-1].split('?')[0]
-                        self.logger.info(f"YouTube video detected, ID: {video_id}")
-                        return f"https://www.youtube.com/watch?v={video_id}"
-                    
-                    # Check for Vimeo
-                    elif 'vimeo.com' in src:
-                        video_id = src.split('/')[-1].split('?')[0]
-                        self.logger.info(f"Vimeo video detected, ID: {video_id}")
-                        return f"https://vimeo.com/{video_id}"
+        Returns:
+            list: dicts with an absolute 'url' and the 'strategy' that found it
+        """
+        scan = self._scan_page(page_content)
+        return [
+            {'url': self._ensure_absolute_url(candidate['url'], page_url), 'strategy': candidate['strategy']}
+            for candidate in scan.candidates()
+        ]
+
+    def _scan_page(self, page_content):
+        """Scan a page in the extraction pool if one is attached, otherwise in this thread"""
+        if self.extraction_pool is not None:
+            return self.extraction_pool.scan_page(page_content, self.media_extensions())
+        return scan_page(page_content, self.media_extensions())
+
+    def resolve_video_url(self, url, keep_probe=False):
+        """
+        Find the URL of the video file behind a page or direct link
+        
+        Results are kept in the extraction cache, if one is attached, so a
+        URL that was just checked is not fetched and parsed again.
+        
+        Args:
+            url (str): The URL of the video or page containing the video
+            keep_probe (bool): For a direct link, return the open probe response
+                as 'probe' so the caller can download from it without another request
             
-            # If all strategies fail, return None
-            self.logger.warning("Could not extract video URL using any strategy")
-            return None
+        Returns:
+            dict: success status, the strategy that found the video and either video_url or error
+        """
+        start_time = time.time()
+        with TRACER.span('resolve', url=url) as span:
+            result = self._resolve_video_url(url, keep_probe)
+            span.set_attribute('strategy', result['strategy'])
+        EXTRACTION_SECONDS.observe(time.time() - start_time, platform='generic', strategy=result['strategy'])
+        return result
+
+    def _resolve_video_url(self, url, keep_probe):
+        """resolve_video_url without the latency measurement"""
+        if self.extraction_cache is not None:
+            cached = self.extraction_cache.get('video_url', url)
+            if cached:
+                self.logger.info(f"Using cached video URL for: {url}")
+                return {'success': True, 'video_url': cached['video_url'], 'strategy': 'cache'}
+        
+        probe = self.probe(url)
+        
+        # Direct video file or stream manifest
+        if probe.is_media:
+            self.logger.info("Direct video link detected")
+            if self.extraction_cache is not None:
+                self.extraction_cache.set('video_url', url, {'video_url': url}, media_url=url)
+            if not keep_probe:
+                probe.close()
+                return {'success': True, 'video_url': url, 'strategy': 'direct'}
+            return {'success': True, 'video_url': url, 'strategy': 'direct', 'probe': probe}
+        
+        if probe.status_code not in (200, 206):
+            probe.close()
+            self.logger.warning(f"Failed to access the URL. Status code: {probe.status_code}")
+            return {
+                'success': False,
+                'strategy': 'none',
+                'error': f"Failed to access the URL. Status code: {probe.status_code}"
+            }
+        
+        # Parse the HTML content
+        self.logger.info("Parsing HTML content to find video source")
+        with TRACER.span('page.fetch', url=url):
+            page = probe.text()
+        best = self._extract_best_candidate(url, page)
+        
+        if not best:
+            self.logger.warning("No video source found on the page")
+            return {
+                'success': False,
+                'strategy': 'none',
+                'error': "No video source found on the page"
+            }
+        
+        video_url = self._ensure_absolute_url(best['url'], url)
+        if self.extraction_cache is not None:
+            self.extraction_cache.set('video_url', url, {'video_url': video_url}, media_url=video_url)
+        return {'success': True, 'video_url': video_url, 'strategy': best['strategy']}
+
+    def probe(self, url, headers=None, cached=False):
+        """
+        Find out what a URL serves with one streaming GET
+        
+        Successful probes are remembered in the extraction cache, so later
+        steps can plan a download without asking the server again.
+        
+        Args:
+            url (str): The URL to probe
+            headers (dict, optional): Request headers; defaults to the browser headers
+            cached (bool): Return a remembered probe, without a response, if there is one
             
-        except Exception as e:
-            self.logger.exception(f"Error extracting video URL: {str(e)}")
+        Returns:
+            ProbeResult: The probe; close() a live one whose body is not read
+        """
+        if cached and self.extraction_cache is not None:
+            memo = self.extraction_cache.get('probe', url)
+            if memo:
+                self.logger.info(f"Using cached probe for: {url}")
+                return ProbeResult(url, memo=memo)
+        
+        start_time = time.time()
+        with TRACER.span('probe', url=url) as span:
+            probe = probe_url(self.session, url, headers=headers or self.headers, timeout=self.timeout)
+            span.set_attribute('kind', probe.kind)
+            span.set_attribute('status', probe.status_code)
+        if probe.is_media:
+            TIME_TO_FIRST_BYTE_SECONDS.observe(time.time() - start_time, platform='generic', engine='http')
+        if probe.status_code < 400 and self.extraction_cache is not None:
+            self.extraction_cache.set('probe', url, probe.as_memo(), media_url=url)
+        return probe
+
+    def media_extensions(self):
+        """Return the extensions looked for in pages: video files first, then stream manifests"""
+        return self.video_extensions + list(MANIFEST_EXTENSIONS)
+
+    def _is_video_content(self, url, content_type):
+        """Check whether a URL serves a video file or an HLS/DASH manifest"""
+        if any(f'video/{ext.lstrip(".")}' in content_type for ext in self.video_extensions):
+            return True
+        return manifest_type(url, content_type) is not None
+
+    def throttle(self, url, job_id=None):
+        """Return the bandwidth throttle for a transfer, or None when downloads are not rate limited"""
+        if self.rate_limiter is None:
             return None
+        return self.rate_limiter.throttle(url, job_id)
 
     def _ensure_absolute_url(self, url, base_url):
         """Convert relative URLs to absolute URLs"""
@@ -190,13 +333,14 @@ class VideoDownloader:
             return urllib.parse.urljoin(base_url, url)
         return url
 
-    def download_video(self, url, download_path='downloads'):
+    def download_video(self, url, download_path='downloads', job_id=None):
         """
         Download a video from a URL
         
         Args:
             url (str): The URL of the video or page containing the video
             download_path (str): The path to save the downloaded video
+            job_id (str, optional): The download job to report progress to
             
         Returns:
             dict: Information about the download including success status
@@ -211,96 +355,66 @@ class VideoDownloader:
         
         while retry_count < self.max_retries:
             try:
-                # Set headers to mimic a browser request
-                # Use the session for all requests to maintain cookies
-                session = self.session
-                
-                # Check if the URL is a direct video file
-                try:
-                    head_response = session.head(url, headers=self.headers, timeout=self.timeout)
-                    content_type = head_response.headers.get('Content-Type', '')
-                    
-                    # Direct video file
-                    if any(f'video/{ext.lstrip(".")}' in content_type for ext in self.video_extensions):
-                        video_url = url
-                        self.logger.info("Direct video link detected")
-                    else:
-                        # Get the page content
-                        response = session.get(url, headers=self.headers, timeout=self.timeout)
-                        
-                        if response.status_code != 200:
-                            self.logger.warning(f"Failed to access the URL. Status code: {response.status_code}")
-                            return {
-                                'success': False,
-                                'error': f"Failed to access the URL. Status code: {response.status_code}"
-                            }
-                        
-                        # Parse the HTML content
-                        self.logger.info("Parsing HTML content to find video source")
-                        video_url = self.extract_video_url(url, response.text)
-                        
-                        if not video_url:
-                            self.logger.warning("No video source found on the page")
-                            return {
-                                'success': False,
-                                'error': "No video source found on the page"
-                            }
-                except Exception as e:
-                    self.logger.warning(f"Error during initial URL check: {str(e)}")
-                    # Fall back to direct request without head check
-                    response = session.get(url, headers=self.headers, timeout=self.timeout)
-                    
-                    if response.status_code != 200:
-                        self.logger.warning(f"Failed to access the URL. Status code: {response.status_code}")
-                        return {
-                            'success': False,
-                            'error': f"Failed to access the URL. Status code: {response.status_code}"
-                        }
-                    
-                    # Extract the video URL from the page
-                    video_url = self.extract_video_url(url, response.text)
-                    
-                    if not video_url:
-                        self.logger.warning("No video source found on the page")
-                        return {
-                            'success': False,
-                            'error': "No video source found on the page"
-                        }
+                # Find the video source, reusing a recent extraction of this page;
+                # a direct link comes back with its response already open
+                resolved = self.resolve_video_url(url, keep_probe=True)
+                if not resolved['success']:
+                    return resolved
+                video_url = resolved['video_url']
+                probe = resolved.get('probe')
                 
                 # If the video URL is a relative URL, convert it to an absolute URL
                 video_url = self._ensure_absolute_url(video_url, url)
                 self.logger.info(f"Video URL identified: {video_url}")
                 
-                try:
-                    # Check content type of the video URL
-                    video_head = session.head(video_url, headers=self.headers, timeout=self.timeout)
-                    content_type = video_head.headers.get('Content-Type', '')
-                except Exception as e:
-                    self.logger.warning(f"Error checking video URL headers: {str(e)}")
-                    # If head request fails, assume a generic content type
-                    content_type = ""
+                # Another page may already have led us to the same media file
+                if self.cache is not None:
+                    cached = self.cache.lookup(video_url, count=False)
+                    if cached:
+                        if probe is not None:
+                            probe.close()
+                        cached['original_url'] = url
+                        return cached
+                
+                # Custom headers for video download
+                download_headers = self.headers.copy()
+                download_headers.update({
+                    'Referer': url,  # Set the referrer to the original page URL
+                    'Range': 'bytes=0-',  # Support for partial content
+                })
+                
+                # Open the video itself, unless a recent probe already described it
+                if probe is None:
+                    probe = self.probe(video_url, headers=download_headers, cached=True)
+                if probe.status_code is not None and probe.status_code >= 400:
+                    probe.close()
+                    return {
+                        'success': False,
+                        'error': f"Failed to access the video. Status code: {probe.status_code}"
+                    }
+                content_type = probe.content_type or ''
+                
+                # Adaptive streams are assembled from their segments
+                if probe.kind in ('hls', 'dash') or manifest_type(video_url, content_type):
+                    probe.close()
+                    return self._download_manifest(url, video_url, download_path, content_type, job_id)
                 
                 # Determine file extension
                 file_ext = self._get_file_extension(video_url, content_type)
                 
                 # Generate a unique filename
-                timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+                timestamp = datetime.now().strftime('%Y%m%d%H%M%S_%f')
                 filename = f"video_{timestamp}{file_ext}"
                 filepath = os.path.join(download_path, filename)
                 
                 # Download the video with progress bar
                 self.logger.info(f"Downloading video from: {video_url}")
                 
-                # Custom headers for video download
-                download_headers = self.headers.copy()
-                download_headers.update({
-                    'Referer': url,  # Set the referrer to the original page URL
-                    'Range': 'bytes=0-',  # Support for partial content
-                })
-                
                 # Download the video with progress tracking
                 try:
-                    self._download_file_with_progress(video_url, filepath, headers=download_headers)
+                    with TRACER.span('transfer', url=video_url):
+                        self._download_file_with_progress(video_url, filepath, headers=download_headers,
+                                                          job_id=job_id, probe=probe)
                     
                     # Verify the file was actually downloaded and has content
                     if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
@@ -318,16 +432,25 @@ class VideoDownloader:
                             'success': False,
                             'error': "Download failed - empty file or file does not exist"
                         }
+                except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                        requests.exceptions.Timeout):
+                    # Let the retry loop pick up the partial download where it stopped
+                    raise
                 except Exception as download_error:
                     self.logger.exception(f"Error during download: {str(download_error)}")
+                    # The cached video source may have expired; extract it afresh next time
+                    if self.extraction_cache is not None:
+                        self.extraction_cache.invalidate('video_url', url)
+                        self.extraction_cache.invalidate('probe', video_url)
                     return {
                         'success': False,
                         'error': f"Download error: {str(download_error)}"
                     }
                 
-            except requests.exceptions.Timeout:
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError) as e:
                 retry_count += 1
-                self.logger.warning(f"Timeout error, retrying ({retry_count}/{self.max_retries})...")
+                self.logger.warning(f"Transfer interrupted ({str(e)}), retrying ({retry_count}/{self.max_retries})...")
                 time.sleep(2)  # Wait before retrying
                 
             except requests.exceptions.RequestException as e:
@@ -349,6 +472,258 @@ class VideoDownloader:
             'error': "Maximum retry attempts reached"
         }
 
+    def _download_manifest(self, url, manifest_url, download_path, content_type='', job_id=None):
+        """
+        Download an HLS or DASH stream into a single file
+        
+        Args:
+            url (str): The page or URL the download was requested for
+            manifest_url (str): The URL of the manifest
+            download_path (str): The path to save the downloaded video
+            content_type (str): The Content-Type the manifest was served with
+            job_id (str, optional): The download job to report progress to
+            
+        Returns:
+            dict: Information about the download including success status
+        """
+        headers = self.headers.copy()
+        headers['Referer'] = url
+        engine = ManifestDownloader(
+            self.session,
+            headers=headers,
+            timeout=self.timeout,
+            workers=self.manifest_workers,
+            max_bandwidth=self.max_bandwidth,
+            throttle=self.throttle(manifest_url, job_id)
+        )
+        
+        try:
+            with TRACER.span('manifest.plan', url=manifest_url):
+                plan = engine.plan(manifest_url, content_type)
+        except ManifestError as e:
+            self.logger.warning(f"Cannot download stream {manifest_url}: {str(e)}")
+            return {
+                'success': False,
+                'error': f"Unsupported stream: {str(e)}"
+            }
+        
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S_%f')
+        filename = f"video_{timestamp}{plan.ext}"
+        filepath = os.path.join(download_path, filename)
+        self.progress_bus.publish(
+            job_id,
+            status='downloading',
+            progress=0,
+            file_size=0,
+            downloaded=0,
+            speed=0,
+            filename=filename,
+            platform='generic'
+        )
+        
+        start_time = time.time()
+        
+        def on_progress(downloaded, done, total):
+            elapsed = time.time() - start_time
+            self.progress_bus.publish(
+                job_id,
+                progress=min(done / total * 100, 99.9),
+                # The final size is only known at the end; extrapolate from the segments so far
+                file_size=int(downloaded / done * total),
+                downloaded=downloaded,
+                speed=downloaded / elapsed if elapsed > 0 else 0
+            )
+        
+        try:
+            with TRACER.span('transfer', url=manifest_url, segments=len(plan.segments)):
+                file_size = engine.download(plan, filepath, progress_callback=on_progress)
+        except ManifestError as e:
+            self.logger.warning(f"Stream download failed: {str(e)}")
+            return {
+                'success': False,
+                'error': f"Stream download failed: {str(e)}"
+            }
+        
+        self.logger.info(f"Stream downloaded successfully to: {filepath}")
+        observe_transfer('generic', 'manifest', file_size, time.time() - start_time)
+        # The job completes once the app has recorded the file
+        self.progress_bus.publish(job_id, status='processing', progress=99.9, file_size=file_size, downloaded=file_size)
+        return {
+            'success': True,
+            'filepath': filepath,
+            'original_url': url,
+            'video_url': manifest_url,
+            'file_size': file_size
+        }
+
+    def stream_video(self, url, download_path='downloads', job_id=None, video_url=None):
+        """
+        Open a video for relaying to a client while it downloads
+        
+        The upstream response is not written to disk first: the returned
+        chunks are passed on as they arrive and copied into a journal part
+        file on the way, which becomes the downloaded file once the stream
+        has been read to the end. An interrupted stream leaves its bytes in
+        the journal for a later download to resume from.
+        
+        Args:
+            url (str): The URL of the video or page containing the video
+            download_path (str): The path to save the downloaded video
+            job_id (str, optional): The download job to report progress to
+            video_url (str, optional): The media URL, if already known; otherwise
+                it is resolved from url
+            
+        Returns:
+            dict: On success, 'chunks' (an iterator of bytes), 'content_type',
+            'content_length' (or None), 'filename' and 'video_url'; once 'chunks'
+            is exhausted, 'download_info' holds the same result download_video()
+            returns. On failure, success False and an error.
+        """
+        os.makedirs(download_path, exist_ok=True)
+        
+        # A direct link is relayed straight from the response that identified it
+        response = None
+        if video_url is None:
+            resolved = self.resolve_video_url(url, keep_probe=True)
+            if not resolved['success']:
+                return resolved
+            video_url = self._ensure_absolute_url(resolved['video_url'], url)
+            response = resolved.get('probe')
+        
+        download_headers = self.headers.copy()
+        download_headers['Referer'] = url
+        
+        try:
+            if response is None:
+                response = self.probe(video_url, headers=download_headers)
+        except requests.exceptions.RequestException as e:
+            self.logger.warning(f"Could not open video stream: {str(e)}")
+            return {
+                'success': False,
+                'error': f"Request error: {str(e)}"
+            }
+        if response.status_code >= 400:
+            response.close()
+            self.logger.warning(f"Could not open video stream: status {response.status_code}")
+            return {
+                'success': False,
+                'error': f"Request error: status {response.status_code}"
+            }
+        
+        content_type = response.headers.get('Content-Type', '').split(';')[0] or 'application/octet-stream'
+        if response.kind in ('hls', 'dash') or manifest_type(video_url, content_type):
+            response.close()
+            return {
+                'success': False,
+                'error': "Adaptive streams have to be assembled before they can be served"
+            }
+        
+        file_ext = self._get_file_extension(video_url, content_type)
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S_%f')
+        filename = f"video_{timestamp}{file_ext}"
+        filepath = os.path.join(download_path, filename)
+        
+        # Compressed transfers are decoded on the way, so their length is unknown
+        encoded = response.headers.get('Content-Encoding', 'identity').lower() not in ('', 'identity')
+        content_length = None if encoded else int(response.headers.get('Content-Length', 0)) or None
+        
+        self.progress_bus.publish(
+            job_id,
+            status='downloading',
+            progress=0,
+            file_size=content_length or 0,
+            downloaded=0,
+            speed=0,
+            filename=filename,
+            platform='generic'
+        )
+        
+        stream = {
+            'success': True,
+            'content_type': content_type,
+            'content_length': content_length,
+            'filename': filename,
+            'video_url': video_url,
+            'download_info': None,
+        }
+        stream['chunks'] = self._tee_stream(response, url, video_url, filepath, content_length, job_id, stream)
+        return stream
+
+    def _tee_stream(self, response, url, video_url, filepath, total_size, job_id, stream):
+        """Yield a response's body while copying it into the journal's part file"""
+        with DownloadJournal.open(os.path.join(os.path.dirname(filepath) or '.', '.partial'), video_url) as journal:
+            journal.reset(
+                total_size=total_size or 0,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified')
+            )
+            journal.save()
+            
+            start_time = time.time()
+            downloaded = 0
+            last_update_time = start_time
+            last_checkpoint_time = start_time
+            throttle = self.throttle(video_url, job_id)
+            
+            try:
+                with open(journal.part_path, 'wb') as file:
+                    try:
+                        for data in response.iter_content(1024 * 64):
+                            if not data:
+                                continue
+                            file.write(data)
+                            downloaded += len(data)
+                            if throttle is not None:
+                                throttle.wait(len(data))
+                            yield data
+                            
+                            current_time = time.time()
+                            if current_time - last_update_time >= 0.2:
+                                self.progress_bus.publish(
+                                    job_id,
+                                    progress=min(downloaded / total_size * 100, 99.9) if total_size else 0,
+                                    downloaded=downloaded,
+                                    speed=downloaded / (current_time - start_time)
+                                )
+                                last_update_time = current_time
+                            
+                            if current_time - last_checkpoint_time >= 1.0:
+                                file.flush()
+                                journal.set_ranges([(0, downloaded)])
+                                journal.save()
+                                last_checkpoint_time = current_time
+                    finally:
+                        # Also runs when the client goes away mid-stream (GeneratorExit)
+                        file.flush()
+                        journal.set_ranges([(0, downloaded)])
+                        journal.save()
+                    
+                    with TRACER.span('fsync'):
+                        os.fsync(file.fileno())
+            finally:
+                response.close()
+            
+            journal.complete(filepath)
+            self.logger.info(f"Video streamed and saved to: {filepath}")
+            
+            elapsed = time.time() - start_time
+            observe_transfer('generic', 'stream', downloaded, elapsed)
+            # Bytes are on disk; the job completes once the app has recorded the file
+            self.progress_bus.publish(
+                job_id,
+                status='processing',
+                progress=99.9,
+                downloaded=downloaded,
+                speed=downloaded / elapsed if elapsed > 0 else 0
+            )
+            stream['download_info'] = {
+                'success': True,
+                'filepath': filepath,
+                'original_url': url,
+                'video_url': video_url,
+                'file_size': downloaded
+            }
+
     def _get_file_extension(self, url, content_type):
         """
         Determine the file extension based on URL or content type
@@ -388,24 +763,29 @@ class VideoDownloader:
         # Default to .mp4 if we couldn't determine the extension
         return '.mp4'
 
-    def _download_file_with_progress(self, url, filepath, headers=None):
+    def _download_file_with_progress(self, url, filepath, headers=None, job_id=None, probe=None):
         """
         Download a file with progress indication
         
+        Bytes are written to a .part file next to the target and tracked in a
+        download journal, so an interrupted transfer resumes where it stopped
+        on the next attempt instead of starting over.
+        
         Args:
             url (str): The URL of the file to download
             filepath (str): The path to save the file
             headers (dict, optional): Custom headers for the download request
+            job_id (str, optional): The download job to report progress to
+            probe (ProbeResult, optional): A probe of the URL; its size and range support
+                replace a separate check, and a live one is read as the download itself
         """
-        from app import update_download_progress
-        import time
-        
         # Use provided headers or default headers
-        download_headers = headers if headers else self.headers
+        download_headers = dict(headers if headers else self.headers)
         
         # Reset and initialize download progress
         filename = os.path.basename(filepath)
-        update_download_progress(
+        self.progress_bus.publish(
+            job_id,
             status='downloading',
             progress=0,
             file_size=0,
@@ -415,64 +795,226 @@ class VideoDownloader:
             platform='generic'
         )
         
-        # Use session for consistent cookies and connection pooling
-        response = self.session.get(url, headers=download_headers, stream=True, timeout=self.timeout)
-        
-        # Get the total file size if available
-        total_size = int(response.headers.get('content-length', 0))
-        block_size = 1024 * 8  # 8 KB for faster downloads
-        
-        # Update file size in progress tracker
-        update_download_progress(file_size=total_size)
-        
-        # Variables to track download speed
-        start_time = time.time()
-        downloaded = 0
-        last_update_time = start_time
-        update_interval = 0.2  # Update progress every 0.2 seconds for smoother UI
-        
-        with open(filepath, 'wb') as file, tqdm(
-                desc=filename,
-                total=total_size,
-                unit='B',
-                unit_scale=True,
-                unit_divisor=1024,
-        ) as bar:
-            for data in response.iter_content(block_size):
-                if data:  # Filter out keep-alive chunks
-                    file.write(data)
-                    data_len = len(data)
-                    downloaded += data_len
-                    bar.update(data_len)
-                    
-                    # Calculate progress percentage
-                    progress = (downloaded / total_size * 100) if total_size > 0 else 0
-                    
-                    # Update download speed calculation periodically
-                    current_time = time.time()
-                    elapsed = current_time - last_update_time
-                    
-                    if elapsed >= update_interval:
-                        # Calculate download speed (bytes per second)
-                        speed = downloaded / (current_time - start_time) if (current_time - start_time) > 0 else 0
+        # Pick up any partial download of this URL left by an earlier attempt
+        with DownloadJournal.open(os.path.join(os.path.dirname(filepath) or '.', '.partial'), url) as journal:
+            
+            # Fetch the file over several connections when the server supports ranges
+            if self.segment_connections > 1:
+                if self._download_segmented(url, journal, download_headers, job_id, filename, probe) is not None:
+                    journal.complete(filepath)
+                    return
+            
+            # Resume from the end of the contiguous part we already have, if the file is unchanged
+            resume_from = journal.contiguous_prefix()
+            if resume_from and journal.if_range_value():
+                download_headers['Range'] = f"bytes={resume_from}-"
+                download_headers['If-Range'] = journal.if_range_value()
+            else:
+                resume_from = 0
+            
+            if probe is not None and probe.live and not resume_from:
+                # The probe already opened the file from the start; read on from it
+                response = probe
+            else:
+                if probe is not None:
+                    probe.close()
+                # Use session for consistent cookies and connection pooling
+                response = self.session.get(url, headers=download_headers, stream=True, timeout=self.timeout)
+            
+            if resume_from and response.status_code == 206:
+                self.logger.info(f"Resuming download at byte {resume_from}")
+                mode = 'r+b'
+            else:
+                # The server sent the whole file (or it changed), so start from scratch
+                resume_from = 0
+                mode = 'wb'
+                journal.reset(
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified')
+                )
+            
+            # Get the total file size if available
+            total_size = resume_from + int(response.headers.get('content-length', 0))
+            journal.total_size = total_size
+            journal.save()
+            
+            # Update file size in progress tracker
+            self.progress_bus.publish(job_id, file_size=total_size)
+            
+            # Chunks grow with the measured throughput, so fast links cost few loop iterations
+            throttle = self.throttle(url, job_id)
+            if isinstance(response, ProbeResult):
+                reader = response.reader(max_chunk=self.max_chunk_size, throttle=throttle)
+            else:
+                reader = AdaptiveReader(response, max_chunk=self.max_chunk_size, throttle=throttle)
+            
+            # Variables to track download speed
+            start_time = time.time()
+            downloaded = resume_from
+            update_interval = 0.2  # Update progress every 0.2 seconds for smoother UI
+            checkpoint_interval = 1.0  # Save the journal every second
+            next_update_time = start_time + update_interval
+            next_checkpoint_time = start_time + checkpoint_interval
+            
+            with open(journal.part_path, mode) as file:
+                file.seek(resume_from)
+                file.truncate()
+                try:
+                    for data in reader:
+                        # Chunks are views of a reused buffer, so write each one before the next read
+                        file.write(data)
+                        downloaded += len(data)
+                        
+                        # Progress and the journal are only touched on a timer
+                        current_time = time.time()
+                        if current_time < next_update_time:
+                            continue
+                        
+                        # Calculate progress percentage and download speed (bytes per second)
+                        progress = (downloaded / total_size * 100) if total_size > 0 else 0
+                        speed = (downloaded - resume_from) / (current_time - start_time) if (current_time - start_time) > 0 else 0
                         
                         # Update progress tracker
-                        update_download_progress(
+                        self.progress_bus.publish(
+                            job_id,
                             progress=min(progress, 99.9),  # Cap at 99.9% until fully complete
                             downloaded=downloaded,
                             speed=speed
                         )
+                        next_update_time = current_time + update_interval
                         
-                        last_update_time = current_time
+                        if current_time >= next_checkpoint_time:
+                            file.flush()
+                            journal.set_ranges([(0, downloaded)])
+                            journal.save()
+                            next_checkpoint_time = current_time + checkpoint_interval
+                finally:
+                    # Record how far we got so a retry can resume from here
+                    file.flush()
+                    journal.set_ranges([(0, downloaded)])
+                    journal.save()
+                    response.close()
+                
+                # Ensure the file is completely written to disk
+                # (Important for some systems where writing might be cached)
+                with TRACER.span('fsync'):
+                    os.fsync(file.fileno())
+            
+            journal.complete(filepath)
+            observe_transfer('generic', 'single', downloaded - resume_from, time.time() - start_time)
+            
+            # Bytes are on disk; the job completes once the app has recorded the file
+            self.progress_bus.publish(
+                job_id,
+                status='processing',
+                progress=99.9,
+                downloaded=downloaded,
+                speed=(downloaded - resume_from) / (time.time() - start_time) if (time.time() - start_time) > 0 else 0
+            )
+
+    def _download_segmented(self, url, journal, headers, job_id=None, filename='', probe=None):
+        """
+        Download a file over parallel range requests into the journal's part file
         
-        # Final update to mark as complete
-        update_download_progress(
-            status='completed',
-            progress=100,
-            downloaded=downloaded,
-            speed=downloaded / (time.time() - start_time) if (time.time() - start_time) > 0 else 0
+        Args:
+            url (str): The URL of the file to download
+            journal (DownloadJournal): Partial download state to resume from and update
+            headers (dict): Headers for the download requests
+            job_id (str, optional): The download job to report progress to
+            filename (str): Name of the file being downloaded
+            probe (ProbeResult, optional): A probe of the URL, used instead of a HEAD request;
+                a live one is closed if the download goes ahead in ranges
+            
+        Returns:
+            int or None: Bytes downloaded, or None if the server does not support
+            range requests and the caller should use a single stream
+        """
+        engine = SegmentedDownloader(
+            self.session,
+            timeout=self.timeout,
+            connections=self.segment_connections,
+            min_segment_size=self.segment_min_size // 2,
+            max_chunk_size=self.max_chunk_size,
+            throttle=self.throttle(url, job_id)
         )
         
-        # Ensure the file is completely written to disk
-        # (Important for some systems where writing might be cached)
-        os.fsync(file.fileno())
+        if probe is not None:
+            info = {
+                'supports_ranges': probe.supports_ranges,
+                'total_size': probe.total_size or 0,
+                'etag': probe.etag,
+                'last_modified': probe.last_modified,
+            }
+        else:
+            try:
+                info = engine.probe(url, headers=headers)
+            except requests.exceptions.RequestException as e:
+                self.logger.warning(f"Range probe failed, using a single connection: {str(e)}")
+                return None
+        
+        total_size = info['total_size']
+        if not info['supports_ranges'] or total_size < self.segment_min_size:
+            return None
+        
+        # The range requests replace the probe's full-body response
+        if probe is not None:
+            probe.close()
+        
+        # Only reuse partial data if the server still describes the same file
+        if not journal.matches(total_size, info['etag'], info['last_modified']):
+            journal.reset(total_size, info['etag'], info['last_modified'])
+        journal.save()
+        
+        range_headers = dict(headers)
+        range_headers.pop('Range', None)
+        if journal.if_range_value():
+            range_headers['If-Range'] = journal.if_range_value()
+        
+        already_downloaded = journal.completed_bytes()
+        if already_downloaded:
+            self.logger.info(f"Resuming download with {already_downloaded} of {total_size} bytes already on disk")
+        self.logger.info(f"Downloading {total_size} bytes over {self.segment_connections} connections")
+        self.progress_bus.publish(job_id, file_size=total_size)
+        
+        start_time = time.time()
+        
+        def on_checkpoint(ranges):
+            journal.set_ranges(ranges)
+            journal.save()
+        
+        def on_progress(downloaded, total):
+            elapsed = time.time() - start_time
+            self.progress_bus.publish(
+                job_id,
+                progress=min(downloaded / total * 100, 99.9),  # Cap at 99.9% until fully complete
+                downloaded=downloaded,
+                speed=(downloaded - already_downloaded) / elapsed if elapsed > 0 else 0
+            )
+        
+        try:
+            downloaded = engine.download(
+                url,
+                journal.part_path,
+                total_size,
+                headers=range_headers,
+                progress_callback=on_progress,
+                completed_ranges=journal.ranges,
+                checkpoint_callback=on_checkpoint
+            )
+        except RangeNotSupportedError:
+            # Either ranges are unsupported or If-Range failed because the file changed
+            self.logger.warning("Server ignored range requests, using a single connection")
+            journal.reset()
+            return None
+        
+        elapsed = time.time() - start_time
+        observe_transfer('generic', 'segmented', downloaded - already_downloaded, elapsed)
+        # Bytes are on disk; the job completes once the app has recorded the file
+        self.progress_bus.publish(
+            job_id,
+            status='processing',
+            progress=99.9,
+            downloaded=downloaded,
+            speed=(downloaded - already_downloaded) / elapsed if elapsed > 0 else 0
+        )
+        return downloaded
@@ -0,0 +1,278 @@
+"""
+Download videos in bulk from the command line or a script, without the web app.
+
+URLs come from the command line, a file or stdin (one per line; blank lines
+and lines starting with # are skipped). Each finished URL is appended to a
+JSONL manifest as it completes; a rerun with the same manifest skips the
+URLs it records as downloaded, as long as their files still exist.
+
+Usage:
+    webvid URL [URL ...] [-o downloads] [-j 4]
+    webvid -i urls.txt -o downloads --manifest results.jsonl
+    cat urls.txt | webvid -i - --progress
+
+As a library:
+    from webvid import BulkDownloader
+    for record in BulkDownloader('downloads', concurrency=4).run(urls, manifest='results.jsonl'):
+        print(record['url'], record['success'])
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from video_downloader import VideoDownloader
+from social_media_downloader import SocialMediaDownloader, YDL_PROFILES
+from extraction_pool import ExtractionPool
+from progress_bus import PROGRESS_BUS, TqdmRenderer
+
+DEFAULT_MANIFEST = 'manifest.jsonl'
+
+# Downloads at once per platform; the shared instaloader session is not thread-safe
+PLATFORM_LIMITS = {'instagram': 1}
+
+
+def read_urls(lines):
+    """
+    Collect URLs from lines of text, in order and without duplicates.
+
+    Args:
+        lines (iterable): Lines such as an open file or sys.stdin
+
+    Returns:
+        list: The URLs; blank lines and # comments are skipped
+    """
+    urls = []
+    seen = set()
+    for line in lines:
+        url = line.strip()
+        if url and not url.startswith('#') and url not in seen:
+            seen.add(url)
+            urls.append(url)
+    return urls
+
+
+def load_completed(manifest_path):
+    """
+    Read a manifest and return the URLs it records as downloaded.
+
+    Args:
+        manifest_path (str): Path of a JSONL manifest written by BulkDownloader.run()
+
+    Returns:
+        dict: URL to its latest successful record, for files that still exist
+    """
+    latest = {}
+    if not os.path.exists(manifest_path):
+        return latest
+    with open(manifest_path, encoding='utf-8') as manifest:
+        for line in manifest:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A run interrupted mid-write leaves a partial last line
+                continue
+            if isinstance(record, dict) and record.get('url'):
+                latest[record['url']] = record
+    return {url: record for url, record in latest.items()
+            if record.get('success') and record.get('filepath') and os.path.exists(record['filepath'])}
+
+
+class BulkDownloader:
+    """
+    Downloads many URLs concurrently with the same downloaders the web app uses.
+
+    Social media URLs go to SocialMediaDownloader and fall back to the
+    generic downloader if it fails; other URLs go to VideoDownloader.
+    Files are written straight to the download directory, with no HTTP
+    round trip or copy through the web app.
+    """
+
+    def __init__(self, download_path='downloads', concurrency=4, video_downloader=None,
+                 social_media_downloader=None, progress_bus=PROGRESS_BUS, report_progress=False):
+        """
+        Args:
+            download_path (str): Directory the files are saved in
+            concurrency (int): URLs downloaded at once
+            video_downloader (VideoDownloader, optional): Generic downloader to use
+            social_media_downloader (SocialMediaDownloader, optional): Social media downloader to use
+            progress_bus (ProgressBus): Where downloads publish their progress
+            report_progress (bool): Give each download a job ID so it publishes progress;
+                without one, downloads publish nothing
+        """
+        self.logger = logging.getLogger(__name__)
+        self.download_path = download_path
+        self.concurrency = max(int(concurrency), 1)
+        self.video_downloader = video_downloader or VideoDownloader()
+        self.social_media_downloader = social_media_downloader or SocialMediaDownloader()
+        self.video_downloader.progress_bus = progress_bus
+        self.social_media_downloader.progress_bus = progress_bus
+        self.progress_bus = progress_bus
+        self.report_progress = report_progress
+        self._platform_slots = {platform: threading.Semaphore(limit) for platform, limit in PLATFORM_LIMITS.items()}
+
+    def download(self, url):
+        """
+        Download one URL.
+
+        Returns:
+            dict: A manifest record: url, success, platform, filepath, file_size,
+            error, seconds and finished_at
+        """
+        start_time = time.time()
+        job_id = uuid.uuid4().hex if self.report_progress else None
+        is_social_media, platform = self.social_media_downloader.is_social_media_url(url)
+        platform = platform if is_social_media else 'generic'
+
+        slot = self._platform_slots.get(platform)
+        if slot is not None:
+            slot.acquire()
+        try:
+            download_info = self._download(url, is_social_media, platform, job_id)
+        except Exception as e:
+            self.logger.exception(f"Exception while downloading {url}")
+            download_info = {'success': False, 'error': f'An error occurred: {str(e)}'}
+        finally:
+            if slot is not None:
+                slot.release()
+
+        # Downloaders stop at processing; the outcome is the caller's to report
+        self.progress_bus.publish(job_id, status='completed' if download_info['success'] else 'error')
+        return {
+            'url': url,
+            'success': download_info['success'],
+            'platform': platform,
+            'filepath': download_info.get('filepath'),
+            'file_size': download_info.get('file_size'),
+            'error': None if download_info['success'] else download_info.get('error', 'Unknown error'),
+            'seconds': round(time.time() - start_time, 3),
+            'finished_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        }
+
+    def _download(self, url, is_social_media, platform, job_id):
+        os.makedirs(self.download_path, exist_ok=True)
+        if not is_social_media:
+            return self.video_downloader.download_video(url, self.download_path, job_id=job_id)
+
+        download_info = self.social_media_downloader.download_video(url, self.download_path, job_id=job_id)
+        if not download_info['success']:
+            self.logger.info(f"Social media downloader failed for {url}, trying generic downloader")
+            self.progress_bus.publish(job_id, status='retrying', progress=0)
+            download_info = self.video_downloader.download_video(url, self.download_path, job_id=job_id)
+        return download_info
+
+    def run(self, urls, manifest=None):
+        """
+        Download URLs concurrently, yielding each record as its download finishes.
+
+        Args:
+            urls (iterable): The URLs; duplicates are downloaded once
+            manifest (str, optional): JSONL file each record is appended to; URLs
+                it already records as downloaded are skipped
+
+        Yields:
+            dict: Records as returned by download()
+        """
+        urls = read_urls(urls)
+        if manifest is not None:
+            completed = load_completed(manifest)
+            if completed:
+                self.logger.info(f"Skipping {sum(url in completed for url in urls)} URLs already in {manifest}")
+                urls = [url for url in urls if url not in completed]
+        if not urls:
+            return
+
+        manifest_file = open(manifest, 'a', encoding='utf-8') if manifest is not None else None
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='webvid') as executor:
+                futures = [executor.submit(self.download, url) for url in urls]
+                try:
+                    for future in as_completed(futures):
+                        record = future.result()
+                        if manifest_file is not None:
+                            # One line per finished URL, so an interrupted run resumes where it stopped
+                            manifest_file.write(json.dumps(record) + '\n')
+                            manifest_file.flush()
+                        yield record
+                finally:
+                    # Stopped early (interrupted, or the caller stopped iterating): start nothing new
+                    for future in futures:
+                        future.cancel()
+        finally:
+            if manifest_file is not None:
+                manifest_file.close()
+            self.progress_bus.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='webvid', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('urls', nargs='*', metavar='URL', help='URLs to download')
+    parser.add_argument('-i', '--input', help="file of URLs, one per line; '-' reads stdin")
+    parser.add_argument('-o', '--output', default='downloads', help='download directory (default: downloads)')
+    parser.add_argument('-j', '--concurrency', type=int, default=4, help='downloads at once (default: 4)')
+    parser.add_argument('-m', '--manifest',
+                        help=f'JSONL result manifest; completed URLs in it are skipped (default: OUTPUT/{DEFAULT_MANIFEST})')
+    parser.add_argument('--no-manifest', action='store_true', help='do not read or write a manifest')
+    parser.add_argument('--progress', action='store_true', help='draw a progress bar per download')
+    parser.add_argument('--extraction-processes', type=int, default=0,
+                        help='run page scans and yt-dlp extraction in this many worker processes')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log what the downloaders do')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(levelname)s %(name)s: %(message)s')
+
+    urls = list(args.urls)
+    if args.input == '-':
+        urls += read_urls(sys.stdin)
+    elif args.input:
+        with open(args.input, encoding='utf-8') as lines:
+            urls += read_urls(lines)
+    if not urls:
+        parser.error('no URLs given')
+
+    manifest = None if args.no_manifest else args.manifest or os.path.join(args.output, DEFAULT_MANIFEST)
+    if manifest is not None:
+        os.makedirs(os.path.dirname(manifest) or '.', exist_ok=True)
+
+    downloader = BulkDownloader(args.output, concurrency=args.concurrency, report_progress=args.progress)
+    renderer = None
+    if args.progress:
+        renderer = TqdmRenderer(leave=False)
+        downloader.progress_bus.subscribe(renderer)
+    extraction_pool = None
+    if args.extraction_processes > 0:
+        extraction_pool = ExtractionPool(
+            workers=args.extraction_processes,
+            ydl_profiles={'extract': YDL_PROFILES['extract']}
+        )
+        downloader.video_downloader.extraction_pool = extraction_pool
+        downloader.social_media_downloader.extraction_pool = extraction_pool
+
+    failed = 0
+    try:
+        for record in downloader.run(urls, manifest=manifest):
+            if record['success']:
+                print(f"done\t{record['url']}\t{record['filepath']}", flush=True)
+            else:
+                failed += 1
+                print(f"failed\t{record['url']}\t{record['error']}", flush=True)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if renderer is not None:
+            renderer.close()
+        if extraction_pool is not None:
+            extraction_pool.close(wait=False)
+        downloader.social_media_downloader.cleanup()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
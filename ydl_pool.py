@@ -0,0 +1,189 @@
+import copy
+import logging
+import threading
+from contextlib import contextmanager
+
+try:
+    from yt_dlp import YoutubeDL
+except ImportError:
+    YoutubeDL = None
+
+
+# Info dict fields that are large and never used for downloading
+BULKY_INFO_KEYS = ('automatic_captions', 'subtitles', 'thumbnails', 'heatmap')
+
+
+def compact_info(info):
+    """
+    Reduce a yt-dlp info dict to plain data a later download can start from.
+
+    Private and unserializable values are dropped along with captions and
+    thumbnails, so the result can be cached or sent to another process and
+    passed back to YoutubeDL.process_ie_result().
+
+    Args:
+        info (dict): An info dict returned by extract_info
+
+    Returns:
+        dict: The compacted copy
+    """
+    info = YoutubeDL.sanitize_info(info, remove_private_keys=True)
+    for key in BULKY_INFO_KEYS:
+        info.pop(key, None)
+    return info
+
+
+class _PooledYoutubeDL:
+    """A YoutubeDL instance and the progress hook of the job currently using it"""
+
+    def __init__(self, ydl):
+        self.ydl = ydl
+        self.progress_hook = None
+        self.uses = 0
+        # Registered once; the job's hook is swapped in on every checkout
+        ydl.add_progress_hook(self._dispatch)
+
+    def _dispatch(self, status):
+        if self.progress_hook is not None:
+            self.progress_hook(status)
+
+
+class YoutubeDLPool:
+    """
+    Keeps warm YoutubeDL instances for reuse, one set per option profile.
+
+    Creating a YoutubeDL sets up its extractor registry, cookie jar and
+    HTTP handlers; a pooled instance keeps all of them, so later calls
+    skip that work and reuse cookies and open connections. YoutubeDL is not
+    thread-safe, so an instance is only ever held by the thread that checked
+    it out, and the caller's progress hook and output template are bound to
+    it for the duration of the checkout.
+    """
+
+    def __init__(self, profiles=None, max_idle=4, max_uses=200):
+        """
+        Args:
+            profiles (dict, optional): Profile name to YoutubeDL options
+            max_idle (int): Idle instances kept per profile; extra ones are closed
+            max_uses (int): Checkouts after which an instance is replaced, so
+                per-instance state cannot grow without bound
+        """
+        if YoutubeDL is None:
+            raise RuntimeError("yt-dlp is required for the YoutubeDL pool")
+
+        self.logger = logging.getLogger(__name__)
+        self.max_idle = max_idle
+        self.max_uses = max_uses
+        self._profiles = {}
+        # Idle instances per profile, most recently returned last
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._stats = {'created': 0, 'reused': 0, 'discarded': 0}
+        for name, options in (profiles or {}).items():
+            self.register_profile(name, options)
+
+    def register_profile(self, name, options):
+        """
+        Add or replace an option profile; idle instances of a replaced profile are closed.
+
+        Args:
+            name (str): The profile name passed to checkout()
+            options (dict): The YoutubeDL options; progress_hooks are not allowed here,
+                pass a progress_hook to checkout() instead
+        """
+        if options.get('progress_hooks'):
+            raise ValueError("Pass progress hooks to checkout(), not in the profile options")
+        with self._lock:
+            self._profiles[name] = copy.deepcopy(options)
+            stale = self._idle.pop(name, [])
+        for pooled in stale:
+            self._close(pooled)
+
+    @contextmanager
+    def checkout(self, profile, progress_hook=None, outtmpl=None, ratelimit=None):
+        """
+        Borrow a YoutubeDL instance for the current thread.
+
+        The instance goes back to the pool when the block exits normally. An
+        instance that raised may be in an inconsistent state and is closed.
+
+        Args:
+            profile (str): The option profile to use
+            progress_hook (callable, optional): Receives this call's progress updates
+            outtmpl (str, optional): Output template for this call, replacing the profile's
+            ratelimit (float, optional): Download speed limit in bytes/s for this call
+
+        Yields:
+            YoutubeDL: The instance, for use by this thread only
+        """
+        pooled = self._acquire(profile)
+        default_outtmpl = pooled.ydl.params['outtmpl'].get('default')
+        default_ratelimit = pooled.ydl.params.get('ratelimit')
+        if outtmpl is not None:
+            pooled.ydl.params['outtmpl']['default'] = outtmpl
+        if ratelimit is not None:
+            pooled.ydl.params['ratelimit'] = ratelimit
+        pooled.progress_hook = progress_hook
+        try:
+            yield pooled.ydl
+        except BaseException:
+            self._discard(pooled)
+            raise
+        else:
+            pooled.progress_hook = None
+            pooled.ydl.params['outtmpl']['default'] = default_outtmpl
+            pooled.ydl.params['ratelimit'] = default_ratelimit
+            self._release(profile, pooled)
+
+    def stats(self):
+        """Return counts of created, reused and discarded instances, and idle ones per profile"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = {name: len(idle) for name, idle in self._idle.items()}
+        return stats
+
+    def close(self):
+        """Close every idle instance"""
+        with self._lock:
+            idle = [pooled for pool in self._idle.values() for pooled in pool]
+            self._idle.clear()
+        for pooled in idle:
+            self._close(pooled)
+
+    def _acquire(self, profile):
+        with self._lock:
+            if profile not in self._profiles:
+                raise KeyError(f"Unknown YoutubeDL profile: {profile}")
+            idle = self._idle.get(profile)
+            if idle:
+                pooled = idle.pop()
+                pooled.uses += 1
+                self._stats['reused'] += 1
+                return pooled
+            options = copy.deepcopy(self._profiles[profile])
+            self._stats['created'] += 1
+
+        # Building an instance is the slow part; keep it outside the lock
+        pooled = _PooledYoutubeDL(YoutubeDL(options))
+        pooled.uses = 1
+        return pooled
+
+    def _release(self, profile, pooled):
+        with self._lock:
+            idle = self._idle.setdefault(profile, [])
+            keep = pooled.uses < self.max_uses and len(idle) < self.max_idle
+            if keep:
+                idle.append(pooled)
+        if not keep:
+            self._close(pooled)
+
+    def _discard(self, pooled):
+        with self._lock:
+            self._stats['discarded'] += 1
+        self._close(pooled)
+
+    def _close(self, pooled):
+        try:
+            pooled.ydl.close()
+        except Exception as e:
+            self.logger.warning(f"Error closing YoutubeDL instance: {str(e)}")